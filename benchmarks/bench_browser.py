@@ -0,0 +1,131 @@
+# benchmarks/bench_browser.py
+"""
+Time Chrome page loads for the headed and throughput driver profiles.
+
+The saved fixture pages are served from a local server, with their
+listing photos and a tag-manager script moved to a slow "third-party"
+asset route, so a load costs what the real site costs: the HTML plus
+everything it pulls in. The headed profile loads pages like the old
+scraper (full page load, then page_source); the throughput profile
+(headless, eager load, blocked resources) uses fetch_browser. Both must
+extract the same listings, and the throughput profile must not announce
+itself as HeadlessChrome. Needs Chrome (and a display, or xvfb-run, for
+the headed profile); politeness delays are not part of the timings.
+
+    python -m benchmarks.bench_browser --loads 30 --asset-delay 0.2
+"""
+import argparse
+import re
+import statistics
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import scraper
+from benchmarks.synthetic import load_fixture_pages
+
+LISTING_PATH = '/fr/maroc/ordinateurs_portables'
+IMAGE_URL = re.compile(r'https://content\.avito\.ma/classifieds/images/(\d+)\?t=images')
+IMAGE_BYTES = 40_000
+
+def serve_fixtures(pages, asset_delay):
+    """
+    Start a server on 127.0.0.1 for the fixture pages (page N at
+    LISTING_PATH?o=N) and their assets, which are linked through
+    "localhost" so they count as another host. The user agents pages were
+    requested with are collected in server.user_agents. Returns (server,
+    base_url).
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), None)
+    server.user_agents = set()
+    port = server.server_address[1]
+    assets = f"http://localhost:{port}/asset"
+    rendered = {}
+    for page, html in pages.items():
+        html = IMAGE_URL.sub(lambda m: f"{assets}/{m.group(1)}.jpg", html)
+        rendered[page] = html.replace('<head>', f'<head><script src="{assets}/gtm.js"></script>', 1).encode()
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path.startswith('/asset/'):
+                time.sleep(asset_delay)
+                is_script = url.path.endswith('.js')
+                body = b'' if is_script else bytes(IMAGE_BYTES)
+                kind = 'application/javascript' if is_script else 'image/jpeg'
+            elif url.path == LISTING_PATH:
+                page = int(urllib.parse.parse_qs(url.query).get('o', ['1'])[0])
+                server.user_agents.add(self.headers.get('User-Agent', ''))
+                body = rendered[(page - 1) % len(rendered) + 1]
+                kind = 'text/html; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', kind)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server.RequestHandlerClass = Handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{port}{LISTING_PATH}"
+
+def fetch_legacy(driver, url):
+    driver.get(url)
+    return driver.page_source
+
+def time_profile(base_url, loads, throughput):
+    """Per-page seconds and listings found over `loads` page loads"""
+    # The fixture tag-manager script stands in for the real third-party hosts
+    driver = scraper.create_driver(throughput=throughput,
+                                   blocked_urls=scraper.BLOCKED_URLS + ['*/asset/*.js'])
+    fetch = scraper.fetch_browser if throughput else fetch_legacy
+    seconds, listings = [], []
+    try:
+        fetch(driver, base_url)  # warm-up: browser start, first connection
+        for i in range(loads):
+            page = i + 1
+            start = time.perf_counter()
+            html = fetch(driver, scraper.page_url(page, base_url))
+            seconds.append(time.perf_counter() - start)
+            listings.append(len(scraper.extract_listings(html, page)))
+    finally:
+        driver.quit()
+    return seconds, listings
+
+def run(loads, asset_delay):
+    pages = load_fixture_pages()
+    server, base_url = serve_fixtures(pages, asset_delay)
+    try:
+        headed, headed_listings = time_profile(base_url, loads, throughput=False)
+        server.user_agents.clear()
+        fast, fast_listings = time_profile(base_url, loads, throughput=True)
+    finally:
+        server.shutdown()
+    if headed_listings != fast_listings:
+        raise AssertionError(f"Listings differ: headed {headed_listings}, throughput {fast_listings}")
+    if len(server.user_agents) != 1 or 'Headless' in next(iter(server.user_agents)):
+        raise AssertionError(f"Throughput profile user agents: {sorted(server.user_agents)}")
+    
+    print(f"Page loads: {loads} per profile, asset delay {asset_delay:.2f}s, "
+          f"{sum(fast_listings):,} listings (both profiles agree)")
+    for name, seconds in (('headed', headed), ('throughput', fast)):
+        p95 = sorted(seconds)[int(0.95 * (len(seconds) - 1))]
+        print(f"{name:11} mean {statistics.mean(seconds):.3f}s  p95 {p95:.3f}s  "
+              f"{len(seconds) / sum(seconds):.1f} pages/s")
+    print(f"Speedup:    {statistics.mean(headed) / statistics.mean(fast):.1f}x")
+    print(f"User agent: {next(iter(server.user_agents))}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--loads', type=int, default=30)
+    parser.add_argument('--asset-delay', type=float, default=0.2,
+                        help="seconds each image/script takes to arrive")
+    args = parser.parse_args()
+    run(args.loads, args.asset_delay)
@@ -0,0 +1,83 @@
+# benchmarks/bench_dedup.py
+"""
+Time MinHash/LSH repost clustering on synthetic titles.
+
+Titles come from benchmarks.synthetic.generate_listings, so nearly all
+of them are distinct, and are perturbed the way reposts are edited
+(case, punctuation, an extra word). They are then clustered into a fresh
+temporary DB: once in a single pass, then again as an incremental run
+that only adds the last 10% of the titles. Peak RSS is read with
+getrusage, so this benchmark is Unix-only.
+
+    python -m benchmarks.bench_dedup --rows 500000
+"""
+import argparse
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_listings
+from cleaner import parse_specs_batch
+from dedup import cluster_listings
+
+EXTRA_WORDS = ['urgent', 'prix fixe', 'très bon état', 'comme neuf', 'garantie', 'occasion']
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def synthetic_titles(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    sample = generate_listings(rows, seed=seed)['title'].tolist()
+    edits = rng.integers(0, 4, rows)
+    words = rng.choice(EXTRA_WORDS, rows)
+    perturbed = []
+    for title, edit, word in zip(sample, edits, words):
+        if edit == 1:
+            title = title.upper()
+        elif edit == 2:
+            title = title.replace(' ', ' - ', 1) + ' !!'
+        elif edit == 3:
+            title = f"{title} {word}"
+        perturbed.append(title)
+    df = pd.DataFrame({'title': perturbed})
+    return pd.concat([df, parse_specs_batch(df['title'])], axis=1)
+
+def run(rows):
+    df = synthetic_titles(rows)
+    split = int(rows * 0.9)
+    input_rss = peak_rss_mb()
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        conn = sqlite3.connect(os.path.join(workdir, 'single.db'))
+        start = time.perf_counter()
+        single = cluster_listings(conn, df)
+        single_time = time.perf_counter() - start
+        conn.close()
+        single_rss = peak_rss_mb()
+        
+        conn = sqlite3.connect(os.path.join(workdir, 'incremental.db'))
+        cluster_listings(conn, df.iloc[:split])
+        start = time.perf_counter()
+        incremental = cluster_listings(conn, df.iloc[split:])
+        incremental_time = time.perf_counter() - start
+        conn.close()
+    
+    print(f"Titles: {rows:,} ({df['title'].nunique():,} distinct)")
+    print(f"Single pass:          {single_time:.2f}s, {single.nunique():,} clusters "
+          f"({rows / single_time:,.0f} titles/s)")
+    print(f"Peak RSS:             {single_rss:,.0f} MB "
+          f"({input_rss:,.0f} MB after building the input)")
+    print(f"Incremental (last {rows - split:,}): {incremental_time:.2f}s, "
+          f"{incremental.nunique():,} clusters touched")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=500_000)
+    args = parser.parse_args()
+    run(args.rows)
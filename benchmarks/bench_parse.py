@@ -0,0 +1,84 @@
+# benchmarks/bench_parse.py
+"""
+Compare title parsing engines: Series.apply, a list comprehension over
+parse_specs, and parse_specs_batch (what the cleaner ships).
+
+Titles are sampled from marketpulse.db and repeated up to the requested
+size. Before anything is timed, parse_specs_batch must agree with
+parse_specs on those titles and on fuzzed ones (odd spacing, long and
+zero-padded numbers, unicode, empty strings).
+
+    python -m benchmarks.bench_parse --rows 200000
+"""
+import argparse
+import random
+import sqlite3
+import time
+
+import pandas as pd
+
+from cleaner import parse_specs, parse_specs_batch
+
+FUZZ_TOKENS = ['dell', 'hp', 'macbook', 'ryzen5', 'ryzen 7', 'i5', 'i7', 'm2', 'ultra 7',
+               'go', 'gb', 'GO', 'Gb', '/', '-', '  ', 'é', 'ç', ' ', 'ssd', 'ram', '']
+
+def load_titles(rows, db_path='marketpulse.db'):
+    conn = sqlite3.connect(db_path)
+    titles = pd.read_sql("SELECT title FROM laptops_clean_new", conn)['title']
+    conn.close()
+    sample = titles.sample(n=rows, replace=True, random_state=42)
+    return sample.reset_index(drop=True)
+
+def fuzz_titles(rows, seed=0):
+    """Random titles built from spec-like tokens and numbers of 1 to 40 digits"""
+    rng = random.Random(seed)
+    titles = []
+    for _ in range(rows):
+        parts = []
+        for _ in range(rng.randint(0, 8)):
+            if rng.random() < 0.4:
+                digits = "".join(rng.choice("0123456789") for _ in range(rng.choice([1, 2, 3, 4, 19, 25, 40])))
+                parts.append(digits + rng.choice(['go', 'gb', ' go', ' Gb', '', 'g']))
+            else:
+                parts.append(rng.choice(FUZZ_TOKENS))
+        titles.append(rng.choice([' ', '', '/']).join(parts))
+    return pd.Series(titles, dtype=object)
+
+def check_parity(titles):
+    """Fail loudly if parse_specs_batch disagrees with parse_specs on any title"""
+    expected = [parse_specs(t) for t in titles]
+    batch = parse_specs_batch(titles)
+    actual = list(batch.itertuples(index=False, name=None))
+    mismatches = [(t, e, a) for t, e, a in zip(titles, expected, actual) if tuple(e) != a]
+    if mismatches:
+        raise AssertionError(f"{len(mismatches)} mismatches, first: {mismatches[0]}")
+
+def run(rows):
+    titles = load_titles(rows)
+    check_parity(titles)
+    check_parity(fuzz_titles(min(rows, 50_000)))
+    
+    start = time.perf_counter()
+    titles.apply(lambda x: pd.Series(parse_specs(x)))
+    per_row = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    [parse_specs(t) for t in titles]
+    loop = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    parse_specs_batch(titles)
+    batch = time.perf_counter() - start
+    
+    print(f"Rows: {rows:,} (parity OK, real and fuzzed titles)")
+    print(f"parse_specs (apply):  {per_row:.3f}s")
+    print(f"parse_specs (list):   {loop:.3f}s")
+    print(f"parse_specs_batch:    {batch:.3f}s")
+    print(f"Speedup over apply:   {per_row / batch:.1f}x")
+    print(f"Speedup over list:    {loop / batch:.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.rows)
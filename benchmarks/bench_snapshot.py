@@ -0,0 +1,71 @@
+# benchmarks/bench_snapshot.py
+"""
+Load time and resident memory: SQLite read_sql vs the Arrow snapshot.
+
+Each loader runs in a fresh interpreter so RSS numbers don't leak into
+each other. RSS is read from /proc, so this benchmark is Linux-only.
+
+    python -m benchmarks.bench_snapshot --rows 1000000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_top_value import random_clean_table
+from cleaner import CLEAN_TABLE, prepare_clean_table, write_snapshot
+
+LOADERS = {
+    'sqlite read_sql': "df = pd.read_sql('SELECT * FROM laptops_clean_new', sqlite3.connect(db))",
+    'snapshot mmap': "table = queries.load_snapshot(snapshot)",
+    'snapshot to_pandas': "df = queries.load_snapshot(snapshot).to_pandas()",
+}
+
+PROBE = """
+import json, sqlite3, sys, time
+import pandas as pd
+import queries
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * {page_size} / 2**20
+
+db, snapshot = sys.argv[1], sys.argv[2]
+before = rss_mb()
+start = time.perf_counter()
+{loader}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_mb() - before}}))
+"""
+
+def measure(loader, db, snapshot):
+    code = PROBE.format(loader=loader, page_size=os.sysconf('SC_PAGE_SIZE'))
+    out = subprocess.run([sys.executable, '-c', code, db, snapshot],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as workdir:
+        db = os.path.join(workdir, 'bench.db')
+        snapshot = os.path.join(workdir, 'bench.arrow')
+        conn = sqlite3.connect(db)
+        random_clean_table(rows).to_sql(CLEAN_TABLE, conn, index=False)
+        prepare_clean_table(conn)
+        conn.commit()
+        write_snapshot(conn, snapshot)
+        conn.close()
+        
+        print(f"Rows: {rows:,} | db {os.path.getsize(db) / 2**20:.0f} MB | "
+              f"snapshot {os.path.getsize(snapshot) / 2**20:.0f} MB")
+        for name, loader in LOADERS.items():
+            result = measure(loader, db, snapshot)
+            print(f"{name:20s} {result['seconds'] * 1000:9.1f} ms | +{result['rss_mb']:7.1f} MB RSS")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    run(args.rows)
@@ -0,0 +1,84 @@
+# benchmarks/bench_top_value.py
+"""
+Compare the indexed top-N best value query with nlargest over a filtered frame.
+
+Builds a temporary clean table of random listings, lets the cleaner create
+its indexes, then times both paths for a few sidebar filter combinations.
+
+    python -m benchmarks.bench_top_value --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import queries
+from cleaner import CLEAN_TABLE, prepare_clean_table
+
+BRANDS = ['Hp', 'Dell', 'Lenovo', 'Apple', 'Asus', 'Acer', 'Msi', 'Samsung', 'Other']
+CPUS = ['I3', 'I5', 'I7', 'I9', 'M1', 'M2', 'RYZEN-5', 'RYZEN-7', 'ULTRA-7', 'Unknown']
+RAMS = [4, 8, 16, 32]
+
+def random_clean_table(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'scrape_date': '2025-12-18',
+        'title': [f"listing {i}" for i in range(rows)],
+        'price': rng.integers(600, 30_000, rows).astype('float64'),
+        'link': [f"https://www.avito.ma/fr/bench/{i}.htm" for i in range(rows)],
+        'page': rng.integers(1, 500, rows),
+        'brand': rng.choice(BRANDS, rows),
+        'cpu': rng.choice(CPUS, rows),
+        'ram': rng.choice(RAMS, rows),
+    })
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def nlargest(df, f, k):
+    mask = (df['ram'] >= f.min_ram) & (df['price'] >= f.price_min) & (df['price'] <= f.price_max)
+    if f.brand != 'All':
+        mask &= df['brand'] == f.brand
+    if f.cpu != 'All':
+        mask &= df['cpu'] == f.cpu
+    return df[mask].nlargest(k, 'value_ratio')
+
+def run(rows, k):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    conn = sqlite3.connect(path)
+    random_clean_table(rows).to_sql(CLEAN_TABLE, conn, index=False)
+    prepare_clean_table(conn)
+    conn.commit()
+    df = pd.read_sql(f"SELECT * FROM {CLEAN_TABLE}", conn)
+    
+    cases = {
+        'no filter': queries.Filters('All', 0, 1e9, 4, 'All'),
+        'brand': queries.Filters('Hp', 0, 1e9, 4, 'All'),
+        'brand+cpu+ram+price': queries.Filters('Dell', 5000, 9000, 16, 'I7'),
+    }
+    print(f"Rows: {rows:,} | k = {k}")
+    for name, f in cases.items():
+        pandas_time, expected = timed(lambda: nlargest(df, f, k))
+        sql_time, actual = timed(lambda: queries.top_value(conn, f, k=k))
+        page_time, _ = timed(lambda: queries.top_value(conn, f, k=k, page=10))
+        assert np.allclose(expected['value_ratio'].values, actual['value_ratio'].values)
+        print(f"{name:22s} nlargest {pandas_time * 1000:8.2f} ms | "
+              f"index {sql_time * 1000:6.2f} ms | page 10 {page_time * 1000:6.2f} ms")
+    conn.close()
+    os.remove(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--k', type=int, default=20)
+    args = parser.parse_args()
+    run(args.rows, args.k)
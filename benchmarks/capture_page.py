@@ -0,0 +1,81 @@
+# benchmarks/capture_page.py
+"""
+Save a live avito.ma results page as a trimmed, anonymized test fixture.
+
+The page is loaded with the scraper's browser profile. Only the first
+N listing cards are kept, and everything a fixture must not carry is
+dropped: scripts (including the embedded Next.js state, which holds
+seller data), styles, iframes, header, footer, image URLs, and phone
+numbers in the text. `--redact` replaces other strings, such as shop
+names shown on cards.
+
+The output is NAME.html plus NAME.json, which holds the fields
+extract_listings reads from the page. Check every field of the JSON
+against the live page before committing both files:
+tests/test_extract.py asserts them field by field.
+
+    python -m benchmarks.capture_page --page 2 --cards 8 --name avito_page_2 --redact "Shop Name"
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+
+from selectolax.lexbor import LexborHTMLParser
+
+import scraper
+from benchmarks.synthetic import FIXTURES_DIR
+
+REAL_FIXTURES_DIR = os.path.join(FIXTURES_DIR, 'real')
+DROPPED = 'script, style, noscript, iframe, link, meta, header, footer, aside'
+PHONE = re.compile(r'(?:\+212|\b0)[5-7](?:[\s.-]?\d{2}){4}\b')
+
+def trim(html, cards, redact=()):
+    """First `cards` listing cards of a results page, without scripts, images or personal data"""
+    tree = LexborHTMLParser(html)
+    for node in tree.css(DROPPED):
+        node.decompose()
+    for card in tree.css(scraper.SELECTORS['listing'])[cards:]:
+        card.decompose()
+    for image in tree.css('img, source'):
+        for name in ('src', 'srcset', 'data-src'):
+            if name in image.attrs:
+                image.attrs[name] = ''
+    html = PHONE.sub('0600000000', tree.html)
+    for text in redact:
+        html = html.replace(text, 'Vendeur')
+    return html
+
+def capture(page, cards, name, redact=(), directory=REAL_FIXTURES_DIR):
+    url = scraper.page_url(page)
+    driver = scraper.create_driver()
+    try:
+        html = trim(scraper.fetch_browser(driver, url), cards, redact)
+    finally:
+        driver.quit()
+    listings = scraper.extract_listings(html, page)
+    if not listings:
+        raise SystemExit(f"No listings extracted from {url}: selectors out of date?")
+    
+    os.makedirs(directory, exist_ok=True)
+    html_path = os.path.join(directory, f"{name}.html")
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            'page': page,
+            'captured': datetime.date.today().isoformat(),
+            'listings': [{k: item[k] for k in ('title', 'price', 'link')} for item in listings],
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {html_path} and {name}.json ({len(listings)} listings): check them against {url}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--cards', type=int, default=8)
+    parser.add_argument('--name', default='avito_page')
+    parser.add_argument('--redact', action='append', default=[],
+                        help="text to replace with 'Vendeur' (repeatable)")
+    args = parser.parse_args()
+    capture(args.page, args.cards, args.name, args.redact)
@@ -0,0 +1,236 @@
+# benchmarks/run_all.py
+"""
+Run the offline pipeline benchmarks on synthetic data and save JSON results.
+
+Covers title parsing (parse_specs, parse_specs_batch), a full, a chunked
+multi-process and an incremental cleaner.run, save_batch_to_db, scoring,
+the dashboard's aggregate queries and page extraction from the saved
+fixture pages.
+Everything runs in a temporary directory; nothing touches marketpulse.db.
+
+Pass --compare with an earlier results file to flag benchmarks that got
+slower by more than --tolerance.
+
+    python -m benchmarks.run_all --rows 100000 --output results.json
+    python -m benchmarks.run_all --rows 100000 --compare results.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import cleaner
+import queries
+import scraper
+from benchmarks.synthetic import LISTINGS_PER_PAGE, generate_listings, load_fixture_pages
+from scoring import score_frame
+
+# parse_specs is per row and slow, so it only sees a sample of this size
+PER_ROW_SAMPLE = 100_000
+CLEANER_CHUNKSIZE = 50_000
+
+@contextlib.contextmanager
+def working_directory(path):
+    """cleaner and scraper use DB paths relative to the current directory"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def timed(fn, repeat=1):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def result(seconds, items, unit):
+    return {'seconds': round(seconds, 4), unit: items, f'{unit}_per_sec': round(items / seconds, 1)}
+
+def bench_parse(listings):
+    titles = listings['title']
+    sample = titles.head(PER_ROW_SAMPLE)
+    per_row, _ = timed(lambda: [cleaner.parse_specs(t) for t in sample], repeat=3)
+    batch, _ = timed(lambda: cleaner.parse_specs_batch(titles), repeat=3)
+    return {
+        'parse_specs': result(per_row, len(sample), 'titles'),
+        'parse_specs_batch': result(batch, len(titles), 'titles'),
+    }
+
+def drop_parse_cache():
+    conn = sqlite3.connect(cleaner.PROD_DB)
+    conn.execute("DROP TABLE IF EXISTS parse_cache")
+    conn.close()
+
+def bench_cleaner(listings, workdir):
+    """
+    Full rebuild over every row, the same rebuild streamed in chunks across
+    every core (both with a cold parse cache), then an incremental run
+    adding 1% new rows
+    """
+    split = len(listings) - max(1, len(listings) // 100)
+    with working_directory(workdir), contextlib.redirect_stdout(io.StringIO()):
+        scraper.init_db()
+        conn = sqlite3.connect(scraper.RAW_DB)
+        listings.iloc[:split].to_sql('new_listings', conn, if_exists='append', index=False)
+        conn.commit()
+        full, _ = timed(lambda: cleaner.run(full=True))
+        drop_parse_cache()
+        chunked, _ = timed(lambda: cleaner.run(full=True, chunksize=CLEANER_CHUNKSIZE,
+                                               workers=os.cpu_count() or 1))
+        
+        listings.iloc[split:].to_sql('new_listings', conn, if_exists='append', index=False)
+        conn.commit()
+        conn.close()
+        incremental, _ = timed(lambda: cleaner.run())
+    return {
+        'cleaner_run_full': result(full, split, 'rows'),
+        'cleaner_run_full_chunked': result(chunked, split, 'rows'),
+        'cleaner_run_incremental': result(incremental, len(listings) - split, 'rows'),
+    }
+
+def bench_save_batch(listings, workdir):
+    """save_batch_to_db in scraper-sized batches: first inserts, then all-unchanged"""
+    batch_rows = 10 * LISTINGS_PER_PAGE
+    records = listings.to_dict('records')
+    batches = [records[i:i + batch_rows] for i in range(0, len(records), batch_rows)]
+    with working_directory(workdir), contextlib.redirect_stdout(io.StringIO()):
+        if os.path.exists(scraper.RAW_DB):
+            os.remove(scraper.RAW_DB)
+        scraper.init_db()
+        insert, _ = timed(lambda: [scraper.save_batch_to_db(b) for b in batches])
+        unchanged, _ = timed(lambda: [scraper.save_batch_to_db(b) for b in batches])
+    return {
+        'save_batch_to_db_insert': result(insert, len(records), 'rows'),
+        'save_batch_to_db_unchanged': result(unchanged, len(records), 'rows'),
+    }
+
+def bench_dashboard(workdir):
+    """Scoring and the dashboard's aggregate queries on the cleaned DB"""
+    db_path = os.path.join(workdir, cleaner.PROD_DB)
+    # The aggregates are written like the cleaner does; the dashboard's
+    # queries then go through its read-only connection
+    conn = sqlite3.connect(db_path)
+    clean = queries.fetch_rows(conn, queries.Filters('All', 0, float('inf'), 0, 'All'),
+                               ['cpu', 'ram', 'price'])
+    scoring, _ = timed(lambda: score_frame(clean), repeat=3)
+    aggregates, _ = timed(lambda: cleaner.build_aggregates(conn))
+    conn.commit()
+    conn.close()
+    
+    conn = queries.connect(db_path)
+    options = queries.filter_options(conn)
+    everything = queries.Filters('All', options['price_min'], options['price_max'], 0, 'All')
+    top_brand = queries.value_counts(conn, everything, 'brand').index[0]
+    filtered = everything._replace(brand=top_brand, price_max=(options['price_min'] + options['price_max']) / 2)
+    
+    def widgets(filters):
+        summary = queries.overview(conn, filters)
+        for column in ('brand', 'cpu', 'ram'):
+            queries.value_counts(conn, filters, column)
+        queries.median_price(conn, filters, summary['count'])
+        queries.price_histogram(conn, filters, summary['min_price'], summary['max_price'])
+        queries.brand_price_boxes(conn, filters, queries.value_counts(conn, filters, 'brand').head(8).index)
+        queries.avg_price_by(conn, filters, 'ram')
+        queries.top_value(conn, filters)
+    
+    unfiltered, _ = timed(lambda: widgets(everything), repeat=3)
+    brand_filtered, _ = timed(lambda: widgets(filtered), repeat=3)
+    conn.close()
+    return {
+        'score_frame': result(scoring, len(clean), 'rows'),
+        'build_aggregates': result(aggregates, len(clean), 'rows'),
+        'dashboard_queries_unfiltered': result(unfiltered, 1, 'renders'),
+        'dashboard_queries_filtered': result(brand_filtered, 1, 'renders'),
+    }
+
+def bench_extract(repeat=50):
+    pages = load_fixture_pages()
+    def extract_all():
+        return sum(len(scraper.extract_listings(html, page)) for page, html in pages.items())
+    seconds, listings = timed(lambda: [extract_all() for _ in range(repeat)])
+    return {
+        'extract_listings': {**result(seconds, len(pages) * repeat, 'pages'),
+                             'listings_per_sec': round(sum(listings) / seconds, 1)},
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(rows, seed=42):
+    listings = generate_listings(rows, seed=seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        results.update(bench_parse(listings))
+        results.update(bench_cleaner(listings, workdir))
+        results.update(bench_dashboard(workdir))
+        results.update(bench_save_batch(listings, workdir))
+    results.update(bench_extract())
+    return {
+        'revision': git_revision(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'rows': rows,
+        'seed': seed,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+def compare(current, baseline, tolerance):
+    """Print time ratios against a baseline run, returns the regressed benchmark names"""
+    if baseline['rows'] != current['rows']:
+        print(f"Warning: baseline has {baseline['rows']:,} rows, this run {current['rows']:,}")
+    regressions = []
+    print(f"\n{'Benchmark':32} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, metrics in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:32} {'-':>10} {metrics['seconds']:>9.3f}s")
+            continue
+        ratio = metrics['seconds'] / before['seconds']
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:32} {before['seconds']:>9.3f}s {metrics['seconds']:>9.3f}s {ratio:>6.2f}x{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100_000, help="synthetic listings (10k to 5M)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="earlier results JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="slowdown ratio above 1 counted as a regression (default 0.2)")
+    args = parser.parse_args()
+    
+    report = run(args.rows, args.seed)
+    for name, metrics in report['results'].items():
+        rates = ", ".join(f"{k} {v:,.0f}" for k, v in metrics.items() if k.endswith('_per_sec'))
+        print(f"{name:32} {metrics['seconds']:>9.3f}s  ({rates})")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
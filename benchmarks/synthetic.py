@@ -0,0 +1,220 @@
+# benchmarks/synthetic.py
+"""
+Seeded generator of Avito-like laptop listings, for benchmarks that must
+run offline and at any size (10k to 5M rows).
+
+Titles are assembled from the pieces real listings use: brand and model,
+an Intel/AMD/Apple CPU token with a French generation suffix, a RAM/storage
+combo such as "8go/256go" and an optional sales phrase. Prices follow the
+configuration with log-normal noise, and a few percent of rows are
+accessories or placeholder prices the cleaner must reject.
+
+render_page() wraps listings in Avito's results markup, with the class
+names written out rather than taken from scraper.SELECTORS, so a selector
+change shows up as failing extraction tests instead of being mirrored
+into the fixtures. write_fixture_pages() regenerates the saved pages in
+benchmarks/fixtures.
+
+    python -m benchmarks.synthetic --pages 3
+"""
+import argparse
+import os
+import re
+import zlib
+from html import escape
+
+import numpy as np
+import pandas as pd
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+LISTINGS_PER_PAGE = 35
+
+# Class names of a listing card's link and title on avito.ma results pages
+LISTING_CLASS = 'sc-1jge648-0 jZXrfL'
+TITLE_CLASS = 'sc-1x0vz2r-0 iHApav'
+
+# brand -> (share of listings, ways sellers write it, models, price factor)
+BRANDS = {
+    'HP': (0.30, ['HP', 'hp', 'Hp', 'PC portable HP'],
+           ['EliteBook 840 G{g}', 'ProBook 450 G{g}', 'EliteBook x360 1030 G{g}', 'Notebook 15',
+            'Pavilion 15', 'Omen 16', 'ZBook Firefly 14 G{g}'], 1.0),
+    'Dell': (0.22, ['Dell', 'DELL', 'dell'],
+             ['Latitude 54{g}0', 'Latitude 7{g}20', 'XPS 13', 'Precision 5{g}50', 'Vostro 3510',
+              'Inspiron 15'], 1.05),
+    'Lenovo': (0.18, ['Lenovo', 'LENOVO', 'PC Lenovo'],
+               ['ThinkPad T480', 'ThinkPad X1 Carbon Gen {g}', 'ThinkPad E14', 'IdeaPad 3',
+                'Legion 5', 'Yoga Slim 7'], 1.0),
+    'Apple': (0.10, ['Apple', 'PC', ''],
+              ['MacBook Air 13', 'MacBook Air 15', 'MacBook Pro 14″', 'MacBook Pro 16 pouces'], 1.6),
+    'Asus': (0.08, ['Asus', 'ASUS'],
+             ['Vivobook 15', 'TUF Gaming F15', 'ROG Strix G15', 'Zenbook 14'], 1.1),
+    'Acer': (0.05, ['Acer', 'ACER'], ['Aspire 5', 'Nitro 5', 'Swift 3'], 0.9),
+    'MSI': (0.03, ['MSI', 'Msi'], ['GF63 Thin', 'Katana 15', 'Modern 14'], 1.2),
+    'Samsung': (0.01, ['Samsung'], ['Galaxy Book3', 'Galaxy Book2 Pro'], 1.1),
+    'Huawei': (0.01, ['Huawei', 'HUAWEI'], ['MateBook D15', 'MateBook 14'], 1.0),
+    'Other': (0.02, ['Toshiba', 'Microsoft', 'Fujitsu'], ['Dynabook', 'Surface Laptop 4', 'Lifebook'], 0.8),
+}
+
+# (token, price tier); {n} is a generation number
+INTEL_CPUS = [
+    ('i3 {n}ème gen', 0), ('i5 {n}e', 1), ('I5 {n}EME GEN', 1), ('Core i5-{n}35G7', 1), ('i5 {n}th', 1),
+    ('i7 {n}ème génération', 2), ('I7 {n}Gen', 2), ('Core i7-{n}700HQ', 2), ('i9 {n}900HK', 3),
+    ('Intel Core Ultra 5', 2), ('Ultra 7', 3),
+]
+AMD_CPUS = [('Ryzen 5 {n}500U', 1), ('RYZEN 7 PRO', 2), ('Ryzen 3', 0), ('R7-5825U', 2)]
+APPLE_CPUS = [('M1', 1), ('puce M2', 2), ('M3', 2), ('M1 Pro', 3), ('M4', 3)]
+GENERATIONS = [6, 7, 8, 8, 10, 10, 11, 11, 12, 13]
+
+RAMS = np.array([4, 8, 8, 8, 16, 16, 16, 32])
+STORAGES = np.array([128, 256, 256, 512, 512, 1000])
+MEMORY_FORMATS = [
+    '{r}go/{s}go', '{r}Go RAM / {s}Go SSD', '{r}GB {s}GB SSD', '/ {r}Go / {s}Go', '{r}go ram {s} ssd',
+    '{r} Go RAM', '- {r}Go - {s}Go SSD', '{s}Go SSD',
+]
+EXTRAS = ['', '', '', 'garantie 6 mois', 'comme neuf', 'très bon état', 'prix négociable',
+          'Neuf sous blister', 'tactile', 'RTX 3050', 'Urgent', 'clavier AZERTY', 'écran 15,6"']
+ACCESSORIES = ['Chargeur HP 65W original', 'Sacoche pc portable 15 pouces', 'Barrette RAM 8go DDR4',
+               'Souris sans fil Logitech', 'Écran 24 pouces Dell']
+CITIES = ['casablanca', 'rabat', 'marrakech', 'fès', 'tanger', 'agadir', 'centre']
+
+def _memory_phrase(memory_format, ram, storage):
+    if storage == 1000:
+        memory_format = re.sub(r'\{s\}(\s?(go|Go|GB))?', '1To', memory_format)
+    return memory_format.format(r=ram, s=storage)
+
+def generate_listings(rows, seed=42, start_date='2025-12-01', days=30):
+    """
+    `rows` raw listings (scrape_date, title, price, link, page), the same
+    for the same seed. Columns match the scraper's new_listings table.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(BRANDS)
+    shares = np.array([BRANDS[b][0] for b in names])
+    brand = rng.choice(len(names), rows, p=shares / shares.sum())
+    is_apple = brand == names.index('Apple')
+    
+    # Brand spelling and model, picked uniformly within the row's brand
+    def pick(options_by_brand):
+        flat = [o for b in names for o in options_by_brand(b)]
+        counts = np.array([len(options_by_brand(b)) for b in names])
+        offsets = np.cumsum(counts) - counts
+        index = offsets[brand] + (rng.random(rows) * counts[brand]).astype('int64')
+        return np.array(flat, dtype=object)[index]
+    spelling = pick(lambda b: BRANDS[b][1])
+    generation = rng.choice(GENERATIONS, rows)
+    model = pd.Series([
+        m.replace('{g}', str(g % 10 or 1)) for m, g in zip(pick(lambda b: BRANDS[b][2]), generation)
+    ])
+    
+    # CPU token: Apple silicon for Macs, otherwise mostly Intel
+    cpus = INTEL_CPUS + AMD_CPUS
+    pc_weights = np.array([3.0] * len(INTEL_CPUS) + [1.0] * len(AMD_CPUS))
+    cpu_index = rng.choice(len(cpus), rows, p=pc_weights / pc_weights.sum())
+    apple_index = rng.integers(0, len(APPLE_CPUS), rows)
+    cpu_text = np.where(
+        is_apple,
+        np.array([c for c, _ in APPLE_CPUS], dtype=object)[apple_index],
+        np.array([c for c, _ in cpus], dtype=object)[cpu_index],
+    )
+    cpu_tier = np.where(is_apple, np.array([t for _, t in APPLE_CPUS])[apple_index],
+                        np.array([t for _, t in cpus])[cpu_index])
+    cpu_text = [c.replace('{n}', str(g)) if '{n}' in c else c for c, g in zip(cpu_text, generation)]
+    # Some sellers leave the CPU out
+    cpu_text = np.where(rng.random(rows) < 0.08, '', np.array(cpu_text, dtype=object))
+    
+    # RAM/storage combo, one pre-rendered phrase per (format, ram, storage)
+    ram_index = rng.integers(0, len(RAMS), rows)
+    storage_index = rng.integers(0, len(STORAGES), rows)
+    memory_format = rng.integers(0, len(MEMORY_FORMATS), rows)
+    phrases = np.array([
+        _memory_phrase(f, r, s) for f in MEMORY_FORMATS for r in RAMS for s in STORAGES
+    ], dtype=object)
+    memory = phrases[(memory_format * len(RAMS) + ram_index) * len(STORAGES) + storage_index]
+    ram = RAMS[ram_index]
+    storage = STORAGES[storage_index]
+    extra = rng.choice(np.array(EXTRAS, dtype=object), rows)
+    
+    title = (pd.Series(spelling) + ' ' + model + ' ' + pd.Series(cpu_text) + ' '
+             + pd.Series(memory) + ' ' + pd.Series(extra))
+    title = title.str.split().str.join(' ')
+    
+    # Price in DH: configuration plus log-normal noise, rounded like sellers do
+    factor = np.array([BRANDS[b][3] for b in names])[brand]
+    price = (1500 + 1400 * cpu_tier + 220 * ram + 2.5 * storage) * factor
+    price = np.round(price * rng.lognormal(0, 0.25, rows) / 50) * 50
+    
+    # Accessories and placeholder prices the cleaner rejects
+    accessory = rng.random(rows) < 0.03
+    title = title.where(~accessory, rng.choice(np.array(ACCESSORIES, dtype=object), rows))
+    price = np.where(accessory, np.round(rng.uniform(80, 900, rows) / 10) * 10, price)
+    price = np.where(rng.random(rows) < 0.01, 1.0, price)
+    
+    ids = rng.permutation(rows) + 50_000_000
+    city = rng.choice(np.array(CITIES, dtype=object), rows)
+    day = pd.Timestamp(start_date) + pd.to_timedelta(rng.integers(0, days, rows), unit='D')
+    return pd.DataFrame({
+        'scrape_date': day.strftime('%Y-%m-%d'),
+        'title': title.to_numpy(),
+        'price': price.astype('float64'),
+        'link': ('https://www.avito.ma/fr/' + pd.Series(city) + '/ordinateurs_portables/annonce_'
+                 + pd.Series(ids).astype(str) + '.htm').to_numpy(),
+        'page': np.arange(rows) // LISTINGS_PER_PAGE + 1,
+    })
+
+def render_page(listings):
+    """Results page HTML for a listings frame, in avito.ma's results markup"""
+    cards = []
+    for row in listings.itertuples(index=False):
+        amount = f"{row.price:,.0f}".replace(',', ' ')
+        path = row.link.split('avito.ma', 1)[-1]
+        cards.append(f"""
+<div class="sc-1nre5ec-1 crKvIr"><a class="{LISTING_CLASS}" href="{escape(path)}">
+  <div class="sc-bsm2tm-0"><img src="https://content.avito.ma/classifieds/images/{zlib.crc32(path.encode('utf-8'))}?t=images" alt="{escape(row.title)}" loading="lazy"></div>
+  <div class="sc-b57yxx-1">
+    <div class="sc-1x0vz2r-0 layWaX"><p class="sc-1x0vz2r-0 kQHNss">Ordinateurs portables</p><p class="sc-1x0vz2r-0 kQHNss">dans {escape(path.split('/')[2])}</p></div>
+    <p class="{TITLE_CLASS}" title="{escape(row.title)}">{escape(row.title)}</p>
+    <div class="sc-b57yxx-3"><span dir="auto">{amount}</span><span>DH</span></div>
+    <div class="sc-b57yxx-4"><span>il y a {len(path) % 50 + 1} minutes</span><span>Particulier</span></div>
+  </div>
+</a></div>""")
+    # Real pages ship a large state blob and scripts the parser must skip over
+    state = escape('{"props":{"pageProps":{"initialReduxState":' + '{"ad":null},' * 400 + '"x":1}}}')
+    return f"""<!DOCTYPE html>
+<html lang="fr"><head><meta charset="utf-8"><title>Ordinateurs portables - Avito</title>
+<script>window.dataLayer=window.dataLayer||[];function gtag(){{dataLayer.push(arguments);}}</script>
+<script id="__NEXT_DATA__" type="application/json">{state}</script>
+</head><body>
+<header><nav><a href="/fr/maroc">Avito</a><a href="/fr/maroc/informatique">Informatique</a></nav></header>
+<main><div class="sc-1nre5ec-0 listing">{''.join(cards)}
+</div><nav class="pagination"><a href="?o=2">Suivant</a></nav></main>
+<footer><p>© Avito</p></footer>
+</body></html>
+"""
+
+def write_fixture_pages(pages=3, directory=FIXTURES_DIR, seed=7):
+    """Write page_1.html ... page_N.html with LISTINGS_PER_PAGE listings each"""
+    os.makedirs(directory, exist_ok=True)
+    listings = generate_listings(pages * LISTINGS_PER_PAGE, seed=seed)
+    paths = []
+    for page in range(1, pages + 1):
+        path = os.path.join(directory, f"page_{page}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(render_page(listings[listings['page'] == page]))
+        paths.append(path)
+    return paths
+
+def load_fixture_pages(directory=FIXTURES_DIR):
+    """{page number: html} for the saved fixture pages"""
+    pages = {}
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('page_') and name.endswith('.html'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                pages[int(name[5:-5])] = f.read()
+    return pages
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate the saved HTML fixture pages")
+    parser.add_argument('--pages', type=int, default=3)
+    args = parser.parse_args()
+    for path in write_fixture_pages(args.pages):
+        print(f"Wrote {path}")
@@ -1,39 +1,99 @@
+import argparse
+import datetime
+import hashlib
+import os
 import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
 import pandas as pd
+import pyarrow as pa
 import re
 
+from dedup import cluster_listings, drop_stored_index, index_clusters, init_dedup
+from history import record_observations
+from metrics import CLEAN_COUNTERS, CLEAN_STAGES, EVENTS_PATH, RunMetrics
+from overrides import apply_overrides, init_title_index
+from queries import AGG_BINS, AGG_CELLS, PRICE_SKETCHES, SNAPSHOT_PATH, SNAPSHOT_VERSION_KEY, data_version
+from scoring import SCORE_VERSION, score_frame
+from sketches import PriceDigest
+
+RAW_DB = 'marketpulse_raw.db'
+PROD_DB = 'marketpulse.db'
+CLEAN_TABLE = 'laptops_clean_new'
+
+# Rows per chunk for the stages that run over the clean table (rescoring,
+# clustering, sketches), whatever the raw chunk size: memory stays bounded
+# and the result doesn't depend on --chunksize
+STAGE_CHUNKSIZE = 20_000
+
+# Width (DH) of the fixed price bins in the aggregate tables
+PRICE_BIN_WIDTH = 250
+
+# Columns added to the clean table after it was first created
+SCORE_COLUMNS = {'quality_score': 'REAL', 'value_ratio': 'REAL', 'score_version': 'TEXT'}
+CLUSTER_COLUMNS = {'cluster_id': 'INTEGER', 'is_repost': 'INTEGER'}
+SKETCH_COLUMNS = {'price_percentile': 'REAL'}
+
+# Price sketches only ever add listings; once their total count is this far
+# off the sketched rows (deleted or re-segmented listings), they are rebuilt
+SKETCH_DRIFT = 0.1
+
+BRAND_PATTERN = re.compile(
+    r'(samsung|apple|huawei|xiaomi|oneplus|oppo|vivo|realme|asus|lenovo|dell|hp|acer|msi|lg|sony|nokia|motorola|google|macbook)'
+)
+CPU_PATTERN = re.compile(r'(i[3579]|m[123]|ryzen\s?\d|ultra\s?\d)')
+MEMORY_PATTERN = re.compile(r'(\d+)\s?(go|gb)')
+
+# Values above this are treated as storage rather than RAM
+MAX_RAM_GB = 32
+# Longer numbers can't be sizes; they are clamped so ram fits in int64
+MAX_SIZE_DIGITS = 18
+
+# Bump PARSER_REVISION when the parsing rules change outside the patterns;
+# pattern edits change PARSER_VERSION on their own. Cached results from
+# another version are ignored and purged.
+PARSER_REVISION = 2
+PARSER_VERSION = hashlib.sha1(
+    "|".join([str(PARSER_REVISION), BRAND_PATTERN.pattern, CPU_PATTERN.pattern,
+              MEMORY_PATTERN.pattern, str(MAX_RAM_GB), str(MAX_SIZE_DIGITS)]).encode('utf-8')
+).hexdigest()[:12]
+
+def size_value(digits):
+    """Integer value of a memory size's digits, clamped to MAX_SIZE_DIGITS nines"""
+    digits = digits.lstrip("0")
+    return int(digits or 0) if len(digits) <= MAX_SIZE_DIGITS else int("9" * MAX_SIZE_DIGITS)
+
 def parse_specs(title):
     title_lower = title.lower()
     
     # 1. Brand Detection
-    brand_match = re.search(
-        r'(samsung|apple|huawei|xiaomi|oneplus|oppo|vivo|realme|asus|lenovo|dell|hp|acer|msi|lg|sony|nokia|motorola|google|macbook)',
-        title_lower
-    )
+    brand_match = BRAND_PATTERN.search(title_lower)
     if brand_match:
         found_brand = "Apple" if brand_match.group(0) == "macbook" else brand_match.group(0).capitalize()
     else:
         found_brand = "Other"
     
     # 2. CPU Detection
-    cpu_match = re.search(r'(i[3579]|m[123]|ryzen\s?\d|ultra\s?\d)', title_lower)
+    cpu_match = CPU_PATTERN.search(title_lower)
     cpu = cpu_match.group(0).upper().replace(" ", "-") if cpu_match else "Unknown"
     
     # 3. RAM Detection (IMPROVED LOGIC)
     # Find all memory sizes mentioned (in GB or GO)
-    memory_matches = re.findall(r'(\d+)\s?(go|gb)', title_lower)
+    memory_matches = MEMORY_PATTERN.findall(title_lower)
     
     ram = 0
     
     if memory_matches:
         # Extract all numbers
-        memory_values = [int(match[0]) for match in memory_matches]
+        memory_values = [size_value(match[0]) for match in memory_matches]
         
         if len(memory_values) == 1:
             # Only one value found
             value = memory_values[0]
             # If <= 32, it's likely RAM. If > 32, it's likely storage (ignore)
-            if value <= 32:
+            if value <= MAX_RAM_GB:
                 ram = value
             else:
                 ram = 0  # Storage mentioned, no RAM found
@@ -46,61 +106,704 @@ def parse_specs(title):
         else:
             # More than 2 values (rare case)
             # Take the smallest value that's <= 32 as RAM
-            valid_ram_values = [v for v in memory_values if v <= 32]
+            valid_ram_values = [v for v in memory_values if v <= MAX_RAM_GB]
             ram = min(valid_ram_values) if valid_ram_values else 0
     
     return found_brand, cpu, ram
 
-def run():
+def parse_specs_batch(titles):
+    """
+    parse_specs for a whole Series of titles.
+    
+    Returns a DataFrame with brand, cpu and ram columns, aligned on the
+    input index. A plain loop over parse_specs: each field is one regex
+    search, which pandas' str methods also run per title, so a column-wise
+    version only adds overhead (about 2x slower, see benchmarks/bench_parse.py).
+    """
+    specs = pd.DataFrame.from_records(list(map(parse_specs, titles.tolist())),
+                                      columns=['brand', 'cpu', 'ram'], index=titles.index)
+    specs['ram'] = specs['ram'].astype('int64')
+    return specs
+
+def parse_in_pool(pool, workers, titles):
+    """parse_specs_batch split into one ordered slice of titles per worker"""
+    if len(titles) < 2 * workers:
+        return parse_specs_batch(titles)
+    size = -(-len(titles) // workers)
+    slices = [titles.iloc[i:i + size] for i in range(0, len(titles), size)]
+    return pd.concat(pool.map(parse_specs_batch, slices))
+
+def normalize_titles(titles):
+    """Lowercase and trim - parse_specs gives the same result for both forms"""
+    return titles.str.lower().str.strip()
+
+def title_key(normalized_title):
+    return hashlib.blake2b(normalized_title.encode('utf-8'), digest_size=16).hexdigest()
+
+class ParseCache:
+    """
+    Memoizes parse results by normalized-title hash.
+    
+    An in-process LRU sits in front of the parse_cache table in the
+    production DB, so reposted titles skip regex work within a run and
+    across runs. Entries are tagged with PARSER_VERSION.
+    """
+    
+    def __init__(self, conn, maxsize=200_000):
+        self.conn = conn
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS parse_cache (
+                title_hash TEXT PRIMARY KEY,
+                parser_version TEXT,
+                brand TEXT,
+                cpu TEXT,
+                ram INTEGER
+            )
+        """)
+        conn.execute("DELETE FROM parse_cache WHERE parser_version != ?", (PARSER_VERSION,))
+    
+    def _remember(self, key, specs):
+        self.memory[key] = specs
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+    
+    def _load(self, keys):
+        """Fetch cached specs for keys from the DB through a temp-table join"""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_keys (title_hash TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM wanted_keys")
+        self.conn.executemany("INSERT INTO wanted_keys VALUES (?)", ((k,) for k in keys))
+        rows = self.conn.execute("""
+            SELECT c.title_hash, c.brand, c.cpu, c.ram
+            FROM parse_cache c JOIN wanted_keys w ON w.title_hash = c.title_hash
+            WHERE c.parser_version = ?
+        """, (PARSER_VERSION,)).fetchall()
+        return {key: (brand, cpu, ram) for key, brand, cpu, ram in rows}
+    
+    def parse(self, titles, parse=parse_specs_batch):
+        """
+        Same output as parse_specs_batch(titles), served from cache where
+        possible; titles missing from the cache go through `parse`.
+        """
+        normalized = normalize_titles(titles)
+        unique_titles = pd.unique(normalized)
+        keys = {t: title_key(t) for t in unique_titles}
+        
+        results = {}
+        pending = []
+        for title, key in keys.items():
+            if key in self.memory:
+                results[title] = self.memory[key]
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+            else:
+                pending.append(title)
+        
+        stored = self._load(keys[t] for t in pending) if pending else {}
+        missing = []
+        for title in pending:
+            specs = stored.get(keys[title])
+            if specs is None:
+                missing.append(title)
+            else:
+                results[title] = specs
+                self._remember(keys[title], specs)
+                self.db_hits += 1
+        
+        if missing:
+            self.misses += len(missing)
+            parsed = parse(pd.Series(missing, dtype=object))
+            new_rows = []
+            for title, specs in zip(missing, parsed.itertuples(index=False, name=None)):
+                specs = (specs[0], specs[1], int(specs[2]))
+                results[title] = specs
+                self._remember(keys[title], specs)
+                new_rows.append((keys[title], PARSER_VERSION) + specs)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO parse_cache VALUES (?, ?, ?, ?, ?)", new_rows
+            )
+        
+        specs = pd.DataFrame(
+            [results[t] for t in normalized], columns=['brand', 'cpu', 'ram'], index=titles.index
+        )
+        specs['ram'] = specs['ram'].astype('int64')
+        return specs
+    
+    def summary(self):
+        """Hit/miss counts, one per distinct normalized title looked up"""
+        hits = self.memory_hits + self.db_hits
+        return (f"Parse cache: {hits} hits ({self.memory_hits} memory, {self.db_hits} db), "
+                f"{self.misses} misses")
+
+def init_state(conn):
+    """Key/value table for cleaner bookkeeping (watermark, versions...)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS clean_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+
+def get_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM clean_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_state(conn, key, value):
+    conn.execute("""
+        INSERT INTO clean_state (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    """, (key, str(value)))
+
+def stamp_data_version(conn):
+    """
+    Record that the clean data changed: a new data_version (dashboard
+    caches are keyed on it) and the time, shown as the last clean.
+    """
+    now = datetime.datetime.now()
+    set_state(conn, 'data_version', now.strftime('%Y%m%dT%H%M%S%f'))
+    set_state(conn, 'cleaned_at', now.isoformat(timespec='seconds'))
+
+def table_exists(conn, name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+def iter_clean_rows(conn, columns, where, params=()):
+    """
+    Clean rows matching `where` as frames of up to STAGE_CHUNKSIZE rows
+    (row_id plus `columns`), in rowid order. Pages on rowid, so rows the
+    caller updates between chunks are never read twice.
+    """
+    last = 0
+    while True:
+        chunk = pd.read_sql(
+            f"SELECT rowid AS row_id, {columns} FROM {CLEAN_TABLE} "
+            f"WHERE ({where}) AND rowid > ? ORDER BY rowid LIMIT ?",
+            conn, params=(*params, last, STAGE_CHUNKSIZE)
+        )
+        if chunk.empty:
+            return
+        yield chunk
+        last = int(chunk['row_id'].iloc[-1])
+
+def clean_frame(df, cache=None, parse=parse_specs_batch):
+    """Parse specs for raw rows and split them into (kept, rejected)"""
+    specs = cache.parse(df['title'], parse) if cache is not None else parse(df['title'])
+    
+    # Combine with original data
+    df_clean = pd.concat([df, specs], axis=1)
+    
+    # Filter bad data (Price > 500 AND RAM > 0)
+    valid = (df_clean['price'] > 500) & (df_clean['ram'] > 0)
+    return add_scores(df_clean[valid]), df_clean[~valid]
+
+def add_scores(df):
+    """Attach quality_score/value_ratio computed with the current score tables"""
+    quality_score, value_ratio = score_frame(df)
+    return df.assign(quality_score=quality_score, value_ratio=value_ratio, score_version=SCORE_VERSION)
+
+def ensure_columns(conn, table, columns):
+    """Add any missing columns (name -> SQL type) to an existing table"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN "{name}" {sql_type}')
+
+def refresh_stale_scores(conn):
+    """Rescore rows scored with other score tables (or never scored), returns how many"""
+    rescored = 0
+    for stale in iter_clean_rows(conn, "cpu, ram, price", "score_version IS NOT ?", (SCORE_VERSION,)):
+        quality_score, value_ratio = score_frame(stale)
+        conn.executemany(
+            f"UPDATE {CLEAN_TABLE} SET quality_score = ?, value_ratio = ?, score_version = ? WHERE rowid = ?",
+            zip(quality_score.tolist(), value_ratio.tolist(), repeat(SCORE_VERSION), stale['row_id'].tolist())
+        )
+        rescored += len(stale)
+    return rescored
+
+def upsert_clean_rows(conn, df_final, df_rejected):
+    """Insert or refresh clean rows keyed on link, drop links that no longer pass"""
+    columns = list(df_final.columns)
+    placeholders = ", ".join("?" for _ in columns)
+    updates = ", ".join(f'"{c}" = excluded."{c}"' for c in columns if c != 'link')
+    quoted = ", ".join(f'"{c}"' for c in columns)
+    
+    conn.executemany(
+        f"""
+        INSERT INTO {CLEAN_TABLE} ({quoted}) VALUES ({placeholders})
+        ON CONFLICT(link) DO UPDATE SET {updates}
+        """,
+        df_final.astype(object).where(df_final.notna(), None).itertuples(index=False, name=None)
+    )
+    conn.executemany(
+        f"DELETE FROM {CLEAN_TABLE} WHERE link = ?",
+        ((link,) for link in df_rejected['link'])
+    )
+
+def prepare_clean_table(conn):
+    """
+    Bring the clean table up to date: score columns, indexes, the title
+    search index, and scores from the current score tables. Returns how
+    many rows were rescored.
+    """
+    ensure_columns(conn, CLEAN_TABLE, {**SCORE_COLUMNS, **CLUSTER_COLUMNS, **SKETCH_COLUMNS})
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_clean_link ON {CLEAN_TABLE}(link)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_clean_cluster ON {CLEAN_TABLE}(cluster_id)")
+    # Dashboard filters: equality on brand/cpu, ranges on ram/price
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_clean_filters ON {CLEAN_TABLE}(brand, cpu, ram, price)")
+    # Best-value top-N: walked in value_ratio order, filter columns covered
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_clean_value ON {CLEAN_TABLE}(value_ratio, brand, cpu, ram, price)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_clean_brand_value ON {CLEAN_TABLE}(brand, value_ratio, cpu, ram, price)")
+    # Title search and override matching (see overrides.py)
+    init_title_index(conn)
+    return refresh_stale_scores(conn)
+
+def assign_clusters(conn, links=(), clusters=()):
+    """
+    Give every unclustered clean row a repost cluster (see dedup.py), then
+    mark reposts in the touched clusters - those of the new rows, of
+    `links` and `clusters`. The most recently scraped listing of a cluster is the one
+    kept (is_repost = 0). Returns how many rows were clustered.
+    
+    Rows are clustered STAGE_CHUNKSIZE at a time; each chunk is matched
+    against the clusters of the chunks before it, as in incremental runs.
+    Earlier clusters are first put back in the connection's bucket index
+    from the clustered rows, in rowid order.
+    """
+    init_dedup(conn)
+    if conn.execute("SELECT 1 FROM cluster_signatures LIMIT 1").fetchone() is None:
+        for rows in iter_clean_rows(conn, "cluster_id, title, brand, cpu, ram", "cluster_id IS NOT NULL"):
+            index_clusters(conn, rows)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS touched_clusters (cluster_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM touched_clusters")
+    conn.executemany("INSERT OR IGNORE INTO touched_clusters VALUES (?)", ((c,) for c in clusters))
+    clustered = 0
+    for rows in iter_clean_rows(conn, "title, brand, cpu, ram", "cluster_id IS NULL"):
+        cluster_ids = cluster_listings(conn, rows)
+        conn.executemany(
+            f"UPDATE {CLEAN_TABLE} SET cluster_id = ? WHERE rowid = ?",
+            zip(cluster_ids.tolist(), rows['row_id'].tolist())
+        )
+        conn.executemany("INSERT OR IGNORE INTO touched_clusters VALUES (?)",
+                         ((c,) for c in cluster_ids.tolist()))
+        clustered += len(rows)
+    conn.executemany(
+        f"INSERT OR IGNORE INTO touched_clusters SELECT cluster_id FROM {CLEAN_TABLE} WHERE link = ?",
+        ((link,) for link in links)
+    )
+    conn.execute(f"""
+        UPDATE {CLEAN_TABLE} SET is_repost = rowid != (
+            SELECT c.rowid FROM {CLEAN_TABLE} c
+            WHERE c.cluster_id = {CLEAN_TABLE}.cluster_id
+            ORDER BY c.scrape_date DESC, c.rowid DESC LIMIT 1
+        )
+        WHERE cluster_id IN (SELECT cluster_id FROM touched_clusters)
+    """)
+    return clustered
+
+def init_sketches(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PRICE_SKETCHES} (
+            brand TEXT,
+            cpu TEXT,
+            ram INTEGER,
+            n INTEGER,
+            low REAL,
+            high REAL,
+            centroids BLOB,
+            PRIMARY KEY (brand, cpu, ram)
+        )
+    """)
+
+def update_price_sketches(conn, links=(), cells=()):
+    """
+    Fold unsketched clean rows (price_percentile still NULL) into their
+    cell's price digest, then set price_percentile for them and for
+    `links` from the updated digests. Digests are rebuilt from the whole
+    table when they drifted past SKETCH_DRIFT (or after a full rebuild),
+    and `cells` - (brand, cpu, ram) cells that lost or gained rows other
+    than by inserts, e.g. through overrides - from their current rows.
+    Returns how many rows were added to the digests.
+    
+    Unsketched rows are read twice in chunks: once to fold their prices
+    into the digests, then to set their percentiles from the final ones.
+    """
+    init_sketches(conn)
+    sketched = conn.execute(f"SELECT COUNT(price_percentile) FROM {CLEAN_TABLE}").fetchone()[0]
+    in_sketches = conn.execute(f"SELECT COALESCE(SUM(n), 0) FROM {PRICE_SKETCHES}").fetchone()[0]
+    if abs(in_sketches - sketched) > SKETCH_DRIFT * max(sketched, 1):
+        conn.execute(f"DELETE FROM {PRICE_SKETCHES}")
+        conn.execute(f"UPDATE {CLEAN_TABLE} SET price_percentile = NULL")
+    cells = [(brand, cpu, int(ram)) for brand, cpu, ram in cells]
+    conn.executemany(f"DELETE FROM {PRICE_SKETCHES} WHERE brand = ? AND cpu = ? AND ram = ?", cells)
+    conn.executemany(
+        f"UPDATE {CLEAN_TABLE} SET price_percentile = NULL WHERE brand = ? AND cpu = ? AND ram = ?", cells
+    )
+    
+    cell_columns = ['brand', 'cpu', 'ram']
+    columns = "brand, cpu, ram, price"
+    digests = {
+        (brand, cpu, ram): PriceDigest.from_bytes(blob, low, high)
+        for brand, cpu, ram, blob, low, high in conn.execute(
+            f"SELECT brand, cpu, ram, centroids, low, high FROM {PRICE_SKETCHES}"
+        )
+    }
+    changed = set()
+    added = 0
+    for new in iter_clean_rows(conn, columns, "price_percentile IS NULL"):
+        for (brand, cpu, ram), prices in new.groupby(cell_columns)['price']:
+            cell = (brand, cpu, int(ram))
+            digests[cell] = digests.get(cell, PriceDigest()).add(prices.to_numpy())
+            changed.add(cell)
+        added += len(new)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {PRICE_SKETCHES} VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((*cell, digests[cell].count, digests[cell].low, digests[cell].high, digests[cell].to_bytes())
+         for cell in changed)
+    )
+    
+    def set_percentiles(rows):
+        updates = []
+        for (brand, cpu, ram), cell_rows in rows.groupby(cell_columns):
+            digest = digests.get((brand, cpu, int(ram)))
+            if digest is not None:
+                updates += zip(digest.cdf(cell_rows['price'].to_numpy()).tolist(), cell_rows['row_id'].tolist())
+        conn.executemany(f"UPDATE {CLEAN_TABLE} SET price_percentile = ? WHERE rowid = ?", updates)
+    
+    # Rows of `links` that already had a percentile: their price may have moved
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS percentile_links (link TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM percentile_links")
+    conn.executemany("INSERT OR IGNORE INTO percentile_links VALUES (?)", ((link,) for link in links))
+    for refreshed in iter_clean_rows(conn, columns, "link IN (SELECT link FROM percentile_links) "
+                                                    "AND price_percentile IS NOT NULL"):
+        set_percentiles(refreshed)
+    for new in iter_clean_rows(conn, columns, "price_percentile IS NULL"):
+        set_percentiles(new)
+    return added
+
+def build_aggregates(conn):
+    """
+    Rebuild the dashboard's summary tables from the clean table: one row
+    per brand x cpu x ram cell (count, price sum/min/max) and per-cell
+    counts in fixed-width price bins. Quantiles come from the price
+    sketches. Returns the number of cells.
+    """
+    init_state(conn)
+    conn.execute(f"DROP TABLE IF EXISTS {AGG_CELLS}")
+    conn.execute(f"DROP TABLE IF EXISTS {AGG_BINS}")
+    conn.execute(f"""
+        CREATE TABLE {AGG_CELLS} (
+            brand TEXT,
+            cpu TEXT,
+            ram INTEGER,
+            n INTEGER,
+            sum_price REAL,
+            min_price REAL,
+            max_price REAL,
+            PRIMARY KEY (brand, cpu, ram)
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE {AGG_BINS} (
+            brand TEXT,
+            cpu TEXT,
+            ram INTEGER,
+            bin INTEGER,
+            n INTEGER,
+            PRIMARY KEY (brand, cpu, ram, bin)
+        )
+    """)
+    cells = conn.execute(f"""
+        INSERT INTO {AGG_CELLS} (brand, cpu, ram, n, sum_price, min_price, max_price)
+        SELECT brand, cpu, ram, COUNT(*), SUM(price), MIN(price), MAX(price)
+        FROM {CLEAN_TABLE} GROUP BY brand, cpu, ram
+    """)
+    conn.execute(f"""
+        INSERT INTO {AGG_BINS} (brand, cpu, ram, bin, n)
+        SELECT brand, cpu, ram, CAST(price / ? AS INTEGER), COUNT(*)
+        FROM {CLEAN_TABLE} GROUP BY 1, 2, 3, 4
+    """, (PRICE_BIN_WIDTH,))
+    set_state(conn, 'price_bin_width', PRICE_BIN_WIDTH)
+    return cells.rowcount
+
+# Compact Arrow types for the snapshot; other columns keep their inferred type
+SNAPSHOT_TYPES = {
+    'scrape_date': pa.string(),
+    'title': pa.string(),
+    'link': pa.string(),
+    'price': pa.float64(),
+    'page': pa.int32(),
+    'ram': pa.int16(),
+    'quality_score': pa.float32(),
+    'value_ratio': pa.float64(),
+    'cluster_id': pa.int64(),
+    'is_repost': pa.int8(),
+    'price_percentile': pa.float32(),
+}
+DICTIONARY_COLUMNS = ('brand', 'cpu', 'score_version')
+
+def write_snapshot(conn, path=SNAPSHOT_PATH, chunksize=100_000):
+    """
+    Write the clean table as an uncompressed Arrow IPC file the dashboard
+    can memory-map. brand/cpu are dictionary-encoded and ram is int16.
+    The schema metadata carries the DB's data_version, so the dashboard
+    only uses a snapshot written for the data it is reading.
+    
+    Streams the table in chunks; every batch shares one dictionary per
+    column, as the IPC file format requires. Returns the number of rows.
+    """
+    version = data_version(conn)
+    metadata = {SNAPSHOT_VERSION_KEY: version} if version is not None else {}
+    dictionaries = {
+        column: pa.array([r[0] for r in conn.execute(
+            f"SELECT DISTINCT {column} FROM {CLEAN_TABLE} WHERE {column} IS NOT NULL ORDER BY {column}"
+        )], pa.string())
+        for column in DICTIONARY_COLUMNS
+    }
+    
+    tmp_path = path + '.tmp'
+    writer = None
+    rows = 0
+    try:
+        for chunk in pd.read_sql(f"SELECT * FROM {CLEAN_TABLE}", conn, chunksize=chunksize):
+            arrays = []
+            for column in chunk.columns:
+                if column in dictionaries:
+                    codes = pd.Categorical(chunk[column], categories=dictionaries[column].to_pylist()).codes
+                    indices = pa.array(codes, pa.int16(), mask=codes < 0)
+                    arrays.append(pa.DictionaryArray.from_arrays(indices, dictionaries[column]))
+                else:
+                    arrays.append(pa.array(chunk[column], SNAPSHOT_TYPES.get(column), from_pandas=True))
+            batch = pa.RecordBatch.from_arrays(arrays, names=list(chunk.columns))
+            if writer is None:
+                schema = batch.schema.with_metadata(metadata)
+                writer = pa.ipc.new_file(tmp_path, schema)
+            else:
+                batch = batch.cast(schema)
+            writer.write_batch(batch)
+            rows += len(chunk)
+        if writer is None:
+            return 0
+        writer.close()
+        # Atomic swap: a dashboard mapping the old file keeps reading it
+        os.replace(tmp_path, path)
+    finally:
+        # Only left over when the write failed
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+def run(full=False, chunksize=None, workers=1, events_path=EVENTS_PATH):
+    """
+    Clean raw listings into the production table.
+    
+    By default only raw rows added since the last run (rowid above the
+    stored watermark) or refreshed by the scraper (scrape_date on or after
+    the last one seen) are parsed and upserted on link. With full=True, or
+    when the clean table doesn't exist yet, the table is rebuilt from
+    every raw row.
+    
+    With chunksize, raw rows are streamed and written `chunksize` at a
+    time instead of loaded at once; workers > 1 parses titles missing from
+    the parse cache in a process pool. The clean table comes out the same
+    either way.
+    
+    Stage timings and counts go to `events_path` and, at the end, to one
+    clean_runs row (see metrics.py).
+    """
     print("Starting Final Clean...")
+    metrics = RunMetrics(events_path, job='clean', stages=CLEAN_STAGES, counters=CLEAN_COUNTERS)
+    
+    conn_prod = sqlite3.connect(PROD_DB)
+    if drop_stored_index(conn_prod):
+        print(f"Dropped the repost bucket index stored in {PROD_DB}")
+    init_state(conn_prod)
+    if not table_exists(conn_prod, CLEAN_TABLE):
+        full = True
+    watermark = 0 if full else int(get_state(conn_prod, 'raw_rowid', 0))
+    last_date = '' if full else get_state(conn_prod, 'raw_scrape_date', '')
     
     # Connect to RAW DB
-    conn_raw = sqlite3.connect('marketpulse_raw.db')
+    conn_raw = sqlite3.connect(RAW_DB)
     try:
-        df = pd.read_sql("SELECT * FROM new_listings", conn_raw)
+        max_rowid, max_date = conn_raw.execute(
+            "SELECT COALESCE(MAX(rowid), 0), COALESCE(MAX(scrape_date), '') FROM new_listings"
+        ).fetchone()
+        if watermark > max_rowid:
+            # Raw DB was recreated (e.g. fresh CI checkout): rescan it, still upserting
+            print(f"Watermark {watermark} is past raw max rowid {max_rowid}, rescanning all rows")
+            watermark, last_date = 0, ''
+        query = "SELECT * FROM new_listings WHERE rowid > ?"
+        params = [watermark]
+        if last_date:
+            query += " OR scrape_date >= ?"
+            params.append(last_date)
+        chunks = pd.read_sql(query + " ORDER BY rowid", conn_raw, params=params, chunksize=chunksize)
+        if chunksize is None:
+            chunks = [chunks]
     except Exception as e:
         print(f"Error loading data: {e}")
-        return
-    finally:
+        metrics.event("load_failed", error=str(e))
+        metrics.close()
         conn_raw.close()
+        conn_prod.close()
+        return
     
-    print(f"Loaded {len(df)} raw items.")
+    mode = "full rebuild" if full else f"incremental, after rowid {watermark} / since {last_date or '-'}"
+    print(f"Cleaning raw items ({mode}).")
     
-    # Apply Cleaning (Vectorized approach)
-    specs = df['title'].apply(lambda x: pd.Series(parse_specs(x)))
-    specs.columns = ['brand', 'cpu', 'ram']
+    cache = ParseCache(conn_prod)
+    parse = parse_specs_batch
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        parse = partial(parse_in_pool, pool, workers)
     
-    # Combine with original data
-    df_clean = pd.concat([df, specs], axis=1)
+    raw_count = clean_count = rejected_count = price_rows = rescored = 0
+    links = []
+    sample = None
+    ram_counts = pd.Series(dtype='int64')
+    try:
+        # Upserts need the link index; a rebuild creates it after the inserts
+        if not full:
+            rescored = prepare_clean_table(conn_prod)
+        for i, df in enumerate(chunks):
+            with metrics.timer("clean", chunk=i, rows=len(df)):
+                df_final, df_rejected = clean_frame(df, cache, parse)
+            
+            # Save to PRODUCTION DB
+            with metrics.timer("write", chunk=i, rows=len(df_final)):
+                if full:
+                    df_final.to_sql(CLEAN_TABLE, conn_prod, if_exists='replace' if i == 0 else 'append', index=False)
+                else:
+                    upsert_clean_rows(conn_prod, df_final, df_rejected)
+                    links.extend(df_final['link'])
+                price_rows += record_observations(conn_prod, df_final)
+            
+            raw_count += len(df)
+            clean_count += len(df_final)
+            rejected_count += len(df_rejected)
+            if sample is None and not df_final.empty:
+                sample = df_final[['title', 'brand', 'cpu', 'ram', 'price']].head(10)
+            ram_counts = ram_counts.add(df_final['ram'].value_counts(), fill_value=0)
+            if chunksize is not None:
+                print(f"Chunk {i + 1}: {len(df)} raw items, {len(df_final)} clean")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        conn_raw.close()
+    print(f"Loaded {raw_count} raw items ({mode}).")
+    print(cache.summary())
     
-    # Filter bad data (Price > 500 AND RAM > 0)
-    df_final = df_clean[
-        (df_clean['price'] > 500) & 
-        (df_clean['ram'] > 0)
-    ]
-    
-    # Save to PRODUCTION DB
-    conn_prod = sqlite3.connect('marketpulse.db')
-    df_final.to_sql('laptops_clean_new', conn_prod, if_exists='replace', index=False)
+    if full:
+        with metrics.timer("write"):
+            rescored = prepare_clean_table(conn_prod)
+    with metrics.timer("overrides"):
+        corrected, excluded, excluded_clusters, override_cells = apply_overrides(conn_prod)
+        if corrected or excluded:
+            rescored += refresh_stale_scores(conn_prod)
+    if corrected or excluded:
+        print(f"Overrides: {corrected} rows corrected, {excluded} excluded")
+    print(f"Price history: {price_rows} new listings or price changes recorded")
+    # A rebuilt table is clustered from scratch, so only incremental runs pass links
+    with metrics.timer("cluster"):
+        clustered = assign_clusters(conn_prod, links, excluded_clusters)
+    reposts = conn_prod.execute(f"SELECT COUNT(*) FROM {CLEAN_TABLE} WHERE is_repost = 1").fetchone()[0]
+    print(f"Repost detection: {clustered} rows clustered, {reposts} reposts in the clean table")
+    with metrics.timer("sketch"):
+        sketched = update_price_sketches(conn_prod, links, override_cells)
+    print(f"Price sketches: {sketched} listings added to the segment digests")
+    if rescored:
+        print(f"Rescored {rescored} rows with score tables {SCORE_VERSION}")
+    with metrics.timer("aggregate"):
+        cells = build_aggregates(conn_prod)
+    print(f"Rebuilt aggregates for {cells} brand x cpu x ram cells")
+    set_state(conn_prod, 'raw_rowid', max_rowid)
+    set_state(conn_prod, 'raw_scrape_date', max_date)
+    stamp_data_version(conn_prod)
+    conn_prod.commit()
+    with metrics.timer("snapshot"):
+        snapshot_rows = write_snapshot(conn_prod)
+    print(f"Wrote {snapshot_rows} rows to {SNAPSHOT_PATH}")
+    total_clean = conn_prod.execute(f"SELECT COUNT(*) FROM {CLEAN_TABLE}").fetchone()[0]
     conn_prod.close()
     
+    for name, value in (('raw_rows', raw_count), ('cleaned', clean_count), ('rejected', rejected_count),
+                        ('price_rows', price_rows), ('corrected', corrected), ('excluded', excluded),
+                        ('rescored', rescored), ('clustered', clustered), ('sketched', sketched),
+                        ('snapshot_rows', snapshot_rows)):
+        metrics.count(name, value)
+    metrics.print_summary()
+    metrics.event("run", **metrics.summary())
+    metrics.save(PROD_DB)
+    metrics.close()
+    
     print(f"\n{'='*60}")
     print(f"Cleaning Complete!")
     print(f"{'='*60}")
-    print(f"Total raw items: {len(df)}")
-    print(f"Clean items saved: {len(df_final)}")
-    print(f"Filtered out: {len(df) - len(df_final)}")
+    print(f"Raw items processed: {raw_count}")
+    print(f"Clean items saved: {clean_count}")
+    print(f"Filtered out: {rejected_count}")
+    print(f"Total in clean table: {total_clean}")
     print(f"{'='*60}\n")
     
+    if sample is None:
+        return
+    
     # Show sample results
     print("Sample of cleaned data:")
-    print(df_final[['title', 'brand', 'cpu', 'ram', 'price']].head(10).to_string())
+    print(sample.to_string())
     
     # Show RAM distribution
     print(f"\n{'='*60}")
     print("RAM Distribution:")
-    print(df_final['ram'].value_counts().sort_index().to_string())
+    print(ram_counts.astype('int64').rename('count').rename_axis('ram').sort_index().to_string())
     print(f"{'='*60}")
 
+def migrate():
+    """
+    Bring a database cleaned by an older version up to date without reading
+    raw rows: columns and indexes, title index, scores, correction rules,
+    repost clusters, price sketches, summary tables and the snapshot.
+    """
+    conn_prod = sqlite3.connect(PROD_DB)
+    try:
+        drop_stored_index(conn_prod)
+        init_state(conn_prod)
+        rescored = prepare_clean_table(conn_prod)
+        corrected, excluded, excluded_clusters, override_cells = apply_overrides(conn_prod)
+        rescored += refresh_stale_scores(conn_prod)
+        clustered = assign_clusters(conn_prod, clusters=excluded_clusters)
+        sketched = update_price_sketches(conn_prod, cells=override_cells)
+        cells = build_aggregates(conn_prod)
+        stamp_data_version(conn_prod)
+        conn_prod.commit()
+        snapshot_rows = write_snapshot(conn_prod)
+    finally:
+        conn_prod.close()
+    print(f"✓ Migrated {PROD_DB}: {rescored} rescored, {corrected} corrected, {excluded} excluded, "
+          f"{clustered} clustered, {sketched} sketched, {cells} aggregate cells, {snapshot_rows} snapshot rows")
+
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clean raw Avito listings into marketpulse.db")
+    parser.add_argument('--full', action='store_true',
+                        help="rebuild the clean table from every raw row instead of only new ones")
+    parser.add_argument('--chunksize', type=int,
+                        help="stream raw rows this many at a time instead of loading them all")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes parsing titles missing from the parse cache (default 1)")
+    parser.add_argument('--migrate', action='store_true',
+                        help="only update a database cleaned by an older version (no raw rows read)")
+    parser.add_argument('--events', default=EVENTS_PATH,
+                        help=f"JSON lines file for run events (default {EVENTS_PATH})")
+    args = parser.parse_args()
+    if args.migrate:
+        migrate()
+    else:
+        run(full=args.full, chunksize=args.chunksize, workers=args.workers, events_path=args.events)
@@ -1,10 +1,11 @@
 # dashboard.py
 import streamlit as st
 import pandas as pd
-import sqlite3
 import plotly.express as px
 import plotly.graph_objects as go
 
+import queries
+
 # Page config
 st.set_page_config(
     page_title="MarketPulse - Laptop Insights",
@@ -31,65 +32,92 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Load data
-@st.cache_data
-def load_data():
-    conn = sqlite3.connect('marketpulse.db')
-    df = pd.read_sql("SELECT * FROM laptops_clean_new", conn)
-    conn.close()
-    return df
+# Database connection
+@st.cache_resource
+def get_connection():
+    # Read-only: the cleaner builds the summary tables, sketches and title
+    # index; queries fall back to the clean table when they are missing
+    return queries.connect()
 
-# Calculate quality score
-def calculate_quality_score(row):
-    """
-    Quality scoring system:
-    CPU: i3=30, i5=50, i7=70, i9=90, M1=60, M2=80, M3=100, 
-         Ryzen-3=35, Ryzen-5=55, Ryzen-7=75, Ryzen-9=95
-         Ultra-5=55, Ultra-7=75, Ultra-9=95
-    RAM: 4GB=20, 8GB=40, 16GB=70, 32GB=100, 64GB=120
-    """
-    cpu_scores = {
-        'I3': 30, 'I5': 50, 'I7': 70, 'I9': 90,
-        'M1': 60, 'M2': 80, 'M3': 100,
-        'RYZEN-3': 35, 'RYZEN-5': 55, 'RYZEN-7': 75, 'RYZEN-9': 95,
-        'ULTRA-5': 55, 'ULTRA-7': 75, 'ULTRA-9': 95
-    }
-    
-    ram_scores = {
-        4: 20, 8: 40, 16: 70, 32: 100, 64: 120
-    }
-    
-    cpu_score = cpu_scores.get(row['cpu'], 25)  # Default 25 for unknown
-    ram_score = ram_scores.get(row['ram'], row['ram'] * 5)  # Fallback formula
-    
-    total_score = cpu_score + ram_score
-    
-    # Value ratio: score per 1000 DH
-    value_ratio = (total_score / row['price']) * 1000 if row['price'] > 0 else 0
-    
-    return total_score, value_ratio
+@st.cache_resource
+def get_query_cache():
+    # One LRU for every session, emptied when the cleaner stamps a new data version
+    return queries.QueryCache(maxsize=256)
+
+@st.cache_resource(max_entries=1)
+def get_snapshot(version, mtime):
+    # mtime is only part of the cache key: a rewritten snapshot gets mapped
+    # again, and the previous mapping is released
+    return queries.load_snapshot(version=version)
+
+def listing_table(listings):
+    """Style listing rows; price_percentile is the price's rank within its brand x cpu x ram segment"""
+    listings = listings.assign(below_market=listings['price_percentile'] < queries.DEAL_PERCENTILE)
+    return listings.style.format({
+        'price': '{:.0f} DH',
+        'quality_score': '{:.0f}',
+        'value_ratio': '{:.2f}',
+        'price_percentile': '{:.0%}'
+    }, na_rep='-')
+
+def density_figure(cached, conn, snapshot, filters, count, columns):
+    """Binned listing density, with a sample of hoverable listings on top (WebGL)"""
+    x_edges, y_edges, counts = cached(queries.density_grid, conn, snapshot, filters)
+    sample = cached(queries.sample_rows, conn, filters, columns, count)
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        # Empty bins stay transparent
+        z=pd.DataFrame(counts.T).where(counts.T > 0).values,
+        colorscale='Blues',
+        colorbar={'title': 'Laptops'},
+        hovertemplate="Price %{x:.0f} DH<br>Quality %{y:.0f}<br>%{z:.0f} laptops<extra></extra>"
+    ))
+    fig.add_trace(go.Scattergl(
+        x=sample['price'],
+        y=sample['quality_score'],
+        mode='markers',
+        marker={'size': 4, 'color': 'rgba(255, 127, 14, 0.6)'},
+        customdata=sample[['title', 'brand', 'cpu', 'ram']],
+        hovertemplate="%{customdata[0]}<br>%{customdata[1]} | %{customdata[2]} | %{customdata[3]}GB"
+                      "<br>%{x:.0f} DH, quality %{y:.0f}<extra></extra>",
+        name=f"Sample of {len(sample):,}"
+    ))
+    fig.update_layout(
+        title=f"Quality Score vs Price ({count:,} laptops, density with a {len(sample):,}-listing sample)",
+        xaxis_title='Price (DH)',
+        yaxis_title='Quality Score'
+    )
+    return fig
 
 # Main app
 def main():
     st.markdown('<p class="main-header">MarketPulse - Laptop Market Analysis</p>', unsafe_allow_html=True)
     
-    # Load data
-    df = load_data()
-    
-    # Calculate quality scores
-    df[['quality_score', 'value_ratio']] = df.apply(
-        lambda row: pd.Series(calculate_quality_score(row)), axis=1
-    )
+    conn = get_connection()
+    missing = queries.missing_columns(conn)
+    if missing:
+        st.error(f"The database was cleaned by an older version (no {', '.join(missing)}). "
+                 f"Run `python cleaner.py --migrate` to update it.")
+        st.stop()
+    version = queries.data_version(conn)
+    snapshot = get_snapshot(version, queries.snapshot_mtime())
+    # Query results are memoized per filters until the data changes
+    cache = get_query_cache()
+    cache.sync(version)
+    cached = cache.call
+    options = cached(queries.filter_options, conn)
     
     # Sidebar filters
     st.sidebar.header("Filter Options")
     
     # Brand filter
-    brands = ['All'] + sorted(df['brand'].unique().tolist())
+    brands = ['All'] + options['brands']
     selected_brand = st.sidebar.selectbox("Select Brand", brands)
     
     # Price range
-    min_price, max_price = int(df['price'].min()), int(df['price'].max())
+    min_price, max_price = int(options['price_min']), int(options['price_max'])
     price_range = st.sidebar.slider(
         "Price Range (DH)",
         min_price, max_price,
@@ -97,47 +125,48 @@ def main():
     )
     
     # RAM filter
-    ram_options = sorted(df['ram'].unique().tolist())
+    ram_options = options['rams']
     min_ram = st.sidebar.selectbox("Minimum RAM (GB)", ram_options, index=0)
     
     # CPU filter
-    cpu_options = ['All'] + sorted(df['cpu'].unique().tolist())
+    cpu_options = ['All'] + options['cpus']
     selected_cpu = st.sidebar.selectbox("CPU Type", cpu_options)
     
-    # Apply filters
-    filtered_df = df.copy()
-    
-    if selected_brand != 'All':
-        filtered_df = filtered_df[filtered_df['brand'] == selected_brand]
+    # Repost filter
+    hide_reposts = st.sidebar.checkbox(
+        "Hide reposts", value=False,
+        help="Keep only the latest listing among near-identical titles"
+    )
     
-    filtered_df = filtered_df[
-        (filtered_df['price'] >= price_range[0]) & 
-        (filtered_df['price'] <= price_range[1]) &
-        (filtered_df['ram'] >= min_ram)
-    ]
+    # Filters are applied in SQL by every query below
+    filters = queries.Filters(selected_brand, price_range[0], price_range[1], min_ram, selected_cpu,
+                              hide_reposts)
+    summary = cached(queries.overview, conn, filters)
     
-    if selected_cpu != 'All':
-        filtered_df = filtered_df[filtered_df['cpu'] == selected_cpu]
+    if summary['count'] == 0:
+        st.warning("No laptops match these filters.")
+        return
     
     # Overview metrics
     st.header("Market Overview")
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Laptops", f"{len(filtered_df):,}")
+        st.metric("Total Laptops", f"{summary['count']:,}")
     with col2:
-        st.metric("Average Price", f"{filtered_df['price'].mean():,.0f} DH")
+        st.metric("Average Price", f"{summary['avg_price']:,.0f} DH")
     with col3:
-        st.metric("Brands Available", len(filtered_df['brand'].unique()))
+        st.metric("Brands Available", summary['brands'])
     with col4:
-        st.metric("Price Range", f"{filtered_df['price'].min():.0f} - {filtered_df['price'].max():.0f} DH")
+        st.metric("Price Range", f"{summary['min_price']:.0f} - {summary['max_price']:.0f} DH")
     
     # Two columns for charts
     col1, col2 = st.columns(2)
     
+    brand_counts = cached(queries.value_counts, conn, filters, 'brand')
+    
     with col1:
         st.subheader("Brand Distribution")
-        brand_counts = filtered_df['brand'].value_counts()
         fig_brand = px.pie(
             values=brand_counts.values,
             names=brand_counts.index,
@@ -147,22 +176,24 @@ def main():
         fig_brand.update_traces(textposition='inside', textinfo='percent+label')
         st.plotly_chart(fig_brand, use_container_width=True)
     
+    cpu_counts = cached(queries.value_counts, conn, filters, 'cpu')
+    
     with col2:
         st.subheader("CPU Distribution")
-        cpu_counts = filtered_df['cpu'].value_counts().head(10)
+        top_cpu_counts = cpu_counts.head(10)
         fig_cpu = px.bar(
-            x=cpu_counts.index,
-            y=cpu_counts.values,
+            x=top_cpu_counts.index,
+            y=top_cpu_counts.values,
             labels={'x': 'CPU Type', 'y': 'Count'},
             title="Top 10 CPU Types",
-            color=cpu_counts.values,
+            color=top_cpu_counts.values,
             color_continuous_scale='Blues'
         )
         st.plotly_chart(fig_cpu, use_container_width=True)
     
     # RAM distribution
     st.subheader("RAM Distribution")
-    ram_counts = filtered_df['ram'].value_counts().sort_index()
+    ram_counts = cached(queries.value_counts, conn, filters, 'ram').sort_index()
     fig_ram = px.bar(
         x=ram_counts.index,
         y=ram_counts.values,
@@ -177,51 +208,64 @@ def main():
     
     # Price distribution
     st.subheader("Price Distribution")
-    fig_price = px.histogram(
-        filtered_df,
-        x='price',
-        nbins=50,
+    median_price = cached(queries.median_price, conn, filters, summary['count'])
+    edges, width, counts = cached(
+        queries.price_histogram, conn, filters, summary['min_price'], summary['max_price'], bins=50
+    )
+    fig_price = px.bar(
+        x=[edge + width / 2 for edge in edges],
+        y=counts,
         title="Price Distribution",
-        labels={'price': 'Price (DH)', 'count': 'Number of Laptops'},
+        labels={'x': 'Price (DH)', 'y': 'Number of Laptops'},
         color_discrete_sequence=['#636EFA']
     )
+    fig_price.update_layout(bargap=0)
     fig_price.add_vline(
-        x=filtered_df['price'].median(),
+        x=median_price,
         line_dash="dash",
         line_color="red",
-        annotation_text=f"Median: {filtered_df['price'].median():.0f} DH"
+        annotation_text=f"Median: {median_price:.0f} DH"
     )
     st.plotly_chart(fig_price, use_container_width=True)
     
-    # Price vs Quality scatter
+    # Price vs Quality scatter: every point while that stays light, then a
+    # density with sampled points (see queries.scatter_mode)
     st.subheader("Price vs Quality Score")
-    fig_scatter = px.scatter(
-        filtered_df,
-        x='price',
-        y='quality_score',
-        color='brand',
-        size='ram',
-        hover_data=['title', 'cpu', 'ram'],
-        title="Quality Score vs Price (bubble size = RAM)",
-        labels={'price': 'Price (DH)', 'quality_score': 'Quality Score'}
-    )
+    scatter_columns = ['price', 'quality_score', 'brand', 'ram', 'title', 'cpu']
+    mode = queries.scatter_mode(summary['count'])
+    if mode == 'density':
+        fig_scatter = density_figure(cached, conn, snapshot, filters, summary['count'], scatter_columns)
+    else:
+        scatter_df = queries.filtered_frame(conn, snapshot, filters, scatter_columns)
+        fig_scatter = px.scatter(
+            scatter_df,
+            x='price',
+            y='quality_score',
+            color='brand',
+            size='ram',
+            hover_data=['title', 'cpu', 'ram'],
+            title="Quality Score vs Price (bubble size = RAM)",
+            labels={'price': 'Price (DH)', 'quality_score': 'Quality Score'},
+            render_mode=mode
+        )
     st.plotly_chart(fig_scatter, use_container_width=True)
     
     # Best value laptops
-    st.header("Top 20 Best Value Laptops")
-    st.markdown("*Based on Quality/Price Ratio - Higher is better*")
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        top_k = st.selectbox("Laptops per page", [20, 50, 100], index=0)
+        max_page = max(1, -(-summary['count'] // top_k))
+        top_page = st.number_input("Page", min_value=1, max_value=max_page, value=1, step=1)
+    with col1:
+        st.header(f"Top {top_k} Best Value Laptops")
+        st.markdown("*Based on Quality/Price Ratio - Higher is better. Below market: priced under the "
+                    f"{queries.DEAL_PERCENTILE:.0%} percentile of the same brand, CPU and RAM*")
     
-    top_value = filtered_df.nlargest(20, 'value_ratio')[
-        ['title', 'brand', 'cpu', 'ram', 'price', 'quality_score', 'value_ratio', 'link']
-    ].reset_index(drop=True)
+    top_value = cached(queries.top_value, conn, filters, k=top_k, page=int(top_page))
     
     # Display as interactive table
     st.dataframe(
-        top_value.style.format({
-            'price': '{:.0f} DH',
-            'quality_score': '{:.0f}',
-            'value_ratio': '{:.2f}'
-        }).background_gradient(subset=['value_ratio'], cmap='Greens'),
+        listing_table(top_value).background_gradient(subset=['value_ratio'], cmap='Greens'),
         use_container_width=True,
         height=400
     )
@@ -233,39 +277,45 @@ def main():
     
     with col1:
         st.subheader("Most popular brand")
-        top_brand = filtered_df['brand'].mode()[0]
-        brand_pct = (filtered_df['brand'] == top_brand).sum() / len(filtered_df) * 100
+        top_brand = brand_counts.index[0]
+        brand_pct = brand_counts.iloc[0] / summary['count'] * 100
         st.info(f"**{top_brand}** dominates with **{brand_pct:.1f}%** market share")
     
     with col2:
         st.subheader("Sweet spot price")
-        median_price = filtered_df['price'].median()
         st.info(f"**{median_price:.0f} DH** - Most laptops cluster around this price")
     
     with col3:
         st.subheader("Most common config")
-        common_ram = filtered_df['ram'].mode()[0]
-        common_cpu = filtered_df['cpu'].mode()[0]
+        common_ram = ram_counts.idxmax()
+        common_cpu = cpu_counts.index[0]
         st.info(f"**{common_cpu}** with **{common_ram}GB RAM** is most common")
     
     # Price by brand boxplot
     st.subheader("Price range by rrand")
-    top_brands = filtered_df['brand'].value_counts().head(8).index
-    df_top_brands = filtered_df[filtered_df['brand'].isin(top_brands)]
-    
-    fig_box = px.box(
-        df_top_brands,
-        x='brand',
-        y='price',
+    top_brands = brand_counts.head(8).index
+    brand_boxes = cached(queries.brand_price_boxes, conn, filters, top_brands)
+    
+    fig_box = go.Figure()
+    for box in brand_boxes.itertuples():
+        fig_box.add_trace(go.Box(
+            name=box.brand,
+            q1=[box.q1],
+            median=[box.median],
+            q3=[box.q3],
+            lowerfence=[box.lowerfence],
+            upperfence=[box.upperfence]
+        ))
+    fig_box.update_layout(
         title="Price Distribution by Top Brands",
-        labels={'price': 'Price (DH)', 'brand': 'Brand'},
-        color='brand'
+        xaxis_title='Brand',
+        yaxis_title='Price (DH)'
     )
     st.plotly_chart(fig_box, use_container_width=True)
     
     # Average price by RAM
     st.subheader("Average price by RAM capacity")
-    avg_price_ram = filtered_df.groupby('ram')['price'].mean().sort_index()
+    avg_price_ram = cached(queries.avg_price_by, conn, filters, 'ram')
     fig_ram_price = px.line(
         x=avg_price_ram.index,
         y=avg_price_ram.values,
@@ -276,22 +326,41 @@ def main():
     )
     st.plotly_chart(fig_ram_price, use_container_width=True)
     
+    # Title search, on the FTS5 title index
+    st.header("Search listings")
+    search_text = st.text_input("Title contains", placeholder="e.g. thinkpad x1 carbon")
+    if search_text.strip():
+        matches = cached(queries.search_titles, conn, filters, search_text)
+        if matches.empty:
+            st.info("No listings match this search and the filters.")
+        else:
+            st.dataframe(listing_table(matches), use_container_width=True)
+
     # Export data
     st.header("Export data")
-    csv = filtered_df.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label="Download filtered data as CSV",
-        data=csv,
-        file_name=f"marketpulse_laptops_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-        mime="text/csv"
-    )
+    export_format = st.radio("Format", ["CSV", "Parquet"], horizontal=True)
+    fmt = export_format.lower()
+    # The file is only built on request, streamed from SQLite, and offered
+    # for download while the filters and format stay the same
+    if st.button(f"Prepare {export_format} export"):
+        st.session_state.export = (filters, fmt, queries.export_file(filters, fmt))
+    export = st.session_state.get('export')
+    if export is not None and export[:2] == (filters, fmt):
+        st.download_button(
+            label=f"Download filtered data as {export_format}",
+            data=export[2],
+            file_name=f"marketpulse_laptops_{pd.Timestamp.now().strftime('%Y%m%d')}.{fmt}",
+            mime=queries.EXPORT_FORMATS[fmt]
+        )
     
     # Footer
+    cleaned_at = queries.last_cleaned(conn)
+    last_cleaned = pd.Timestamp(cleaned_at).strftime('%Y-%m-%d %H:%M') if cleaned_at else "unknown"
     st.markdown("---")
     st.markdown(
         f"<p style='text-align: center; color: gray;'>"
-        f"Data from Avito.ma | Last updated: {pd.Timestamp.now().strftime('%Y-%m-%d')} | "
-        f"Total items analyzed: {len(df):,}"
+        f"Data from Avito.ma | Last cleaned: {last_cleaned} | "
+        f"Total items analyzed: {options['total']:,}"
         f"</p>",
         unsafe_allow_html=True
     )
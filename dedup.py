@@ -0,0 +1,240 @@
+# dedup.py
+"""
+Near-duplicate (repost) detection over listing titles with MinHash + LSH.
+
+Titles are normalized, cut into 4-byte shingles and summarized by a
+MinHash signature of NUM_PERM values. Signatures are split into BANDS
+bands; two listings become candidates when any band (plus their parsed
+brand/cpu/ram) hashes to the same bucket, and they join a cluster when
+their estimated Jaccard similarity reaches SIMILARITY. No pairwise
+comparison over all titles is ever done.
+
+The bucket index and one representative signature per cluster live in
+TEMP tables of the cleaner's connection, rebuilt from the cluster ids
+stored in the clean table (index_clusters) before new listings are
+matched against every earlier cluster. They would about double the
+committed marketpulse.db, so they are never written to it.
+"""
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SIMILARITY = 0.8
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, (1 << 31) - 1, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, (1 << 31) - 1, NUM_PERM, dtype=np.uint64)
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+def normalize(title):
+    """Lowercase, punctuation and runs of spaces collapsed to one space"""
+    return _NON_WORD.sub(' ', title.lower()).strip()
+
+def minhash_signatures(titles, chunk_shingles=250_000):
+    """MinHash signatures (len(titles) x NUM_PERM, uint32) over 4-byte shingles"""
+    encoded = [normalize(t).encode('utf-8').ljust(4) for t in titles]
+    if not encoded:
+        return np.empty((0, NUM_PERM), dtype=np.uint32)
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint32)
+
+    # One shingle per byte position that has 3 more bytes in the same title
+    counts = lengths - 3
+    title_starts = np.cumsum(lengths) - lengths
+    positions = np.repeat(title_starts, counts) + (
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    )
+    shingles = ((data[positions] << 24) | (data[positions + 1] << 16)
+                | (data[positions + 2] << 8) | data[positions + 3]).astype(np.uint64)
+    shingle_starts = np.cumsum(counts) - counts
+
+    signatures = np.empty((len(encoded), NUM_PERM), dtype=np.uint32)
+    first = 0
+    while first < len(encoded):
+        # Whole titles per chunk so reduceat never spans a chunk boundary
+        last = int(np.searchsorted(shingle_starts, shingle_starts[first] + chunk_shingles, side='right'))
+        last = max(last, first + 1)
+        begin = shingle_starts[first]
+        end = shingle_starts[last] if last < len(encoded) else len(shingles)
+        hashed = (shingles[begin:end, None] * _A + _B) % _PRIME
+        signatures[first:last] = np.minimum.reduceat(hashed, shingle_starts[first:last] - begin, axis=0)
+        first = last
+    return signatures
+
+def band_keys(signatures, specs):
+    """One signed 64-bit bucket key per (row, band), salted with brand/cpu/ram"""
+    salt = np.fromiter(
+        (zlib.crc32(f"{b}|{c}|{r}".encode('utf-8')) for b, c, r in specs),
+        dtype=np.uint64, count=len(signatures)
+    )
+    keys = np.empty((len(signatures), BANDS), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for band in range(BANDS):
+            key = salt * np.uint64(0x9E3779B97F4A7C15) + np.uint64(band)
+            for value in signatures[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].T:
+                key = (key ^ value.astype(np.uint64)) * np.uint64(0x100000001B3)
+            keys[:, band] = key
+    return keys.view(np.int64)
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of signatures (row-wise for 2-D arrays)"""
+    return np.mean(a == b, axis=-1)
+
+def init_dedup(conn):
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS lsh_buckets (
+            band INTEGER,
+            bucket INTEGER,
+            cluster_id INTEGER,
+            PRIMARY KEY (band, bucket)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS cluster_signatures (
+            cluster_id INTEGER PRIMARY KEY,
+            signature BLOB
+        )
+    """)
+
+def drop_stored_index(conn):
+    """
+    Drop the bucket index that older versions kept in the database file
+    and reclaim its pages. Returns whether there was one.
+    """
+    stored = conn.execute(
+        "SELECT COUNT(*) FROM main.sqlite_master WHERE name IN ('lsh_buckets', 'cluster_signatures')"
+    ).fetchone()[0]
+    if not stored:
+        return False
+    conn.execute("DROP TABLE IF EXISTS main.lsh_buckets")
+    conn.execute("DROP TABLE IF EXISTS main.cluster_signatures")
+    conn.commit()
+    conn.execute("VACUUM")
+    return True
+
+def _keys_frame(df, **extra):
+    """Normalized titles and specs of df, the key rows are deduplicated on"""
+    return pd.DataFrame({
+        'title': [normalize(t) for t in df['title']],
+        'brand': df['brand'].to_numpy(), 'cpu': df['cpu'].to_numpy(), 'ram': df['ram'].to_numpy(),
+        **extra
+    })
+
+def index_clusters(conn, df):
+    """
+    Put already clustered rows of df (cluster_id, title, brand, cpu, ram)
+    back in the bucket index, as cluster_listings left them. Rows must come
+    in the order they were clustered: a cluster's first row is its
+    representative and the first cluster to reach a bucket keeps it.
+    """
+    init_dedup(conn)
+    distinct = _keys_frame(df, cluster_id=df['cluster_id'].to_numpy()).drop_duplicates(ignore_index=True)
+    if distinct.empty:
+        return
+    signatures = minhash_signatures(distinct['title'].tolist())
+    keys = band_keys(signatures, zip(distinct['brand'], distinct['cpu'], distinct['ram']))
+    cluster_ids = distinct['cluster_id'].to_numpy(dtype=np.int64)
+    
+    representatives = distinct['cluster_id'].drop_duplicates().index.to_numpy()
+    conn.executemany(
+        "INSERT OR IGNORE INTO cluster_signatures VALUES (?, ?)",
+        ((int(cluster_ids[i]), signatures[i].tobytes()) for i in representatives)
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh_buckets VALUES (?, ?, ?)",
+        zip(np.tile(np.arange(BANDS), len(distinct)).tolist(), keys.ravel().tolist(),
+            np.repeat(cluster_ids, BANDS).tolist())
+    )
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def cluster_listings(conn, df):
+    """
+    Assign a cluster id to each row of df (title, brand, cpu, ram).
+    
+    Rows are first matched against existing clusters through the stored
+    buckets, then the rest are clustered among themselves. New clusters and
+    the new rows' buckets are written back. Returns a Series of cluster ids
+    aligned on df.index.
+    """
+    init_dedup(conn)
+    if df.empty:
+        return pd.Series([], index=df.index, dtype='int64')
+    # Rows with the same normalized title and specs always share a cluster,
+    # so only distinct ones are hashed
+    keys_frame = _keys_frame(df)
+    distinct = keys_frame.drop_duplicates(ignore_index=True)
+    row_of = pd.MultiIndex.from_frame(distinct).get_indexer(pd.MultiIndex.from_frame(keys_frame))
+    n = len(distinct)
+    
+    signatures = minhash_signatures(distinct['title'].tolist())
+    keys = band_keys(signatures, zip(distinct['brand'], distinct['cpu'], distinct['ram']))
+    assigned = np.full(n, -1, dtype=np.int64)
+    
+    # 1. Match against clusters from earlier runs: first candidate (in band
+    #    order) similar enough to its cluster's representative wins
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_buckets (row INTEGER, band INTEGER, bucket INTEGER)")
+    conn.execute("DELETE FROM wanted_buckets")
+    conn.executemany(
+        "INSERT INTO wanted_buckets VALUES (?, ?, ?)",
+        zip(np.repeat(np.arange(n), BANDS).tolist(), np.tile(np.arange(BANDS), n).tolist(),
+            keys.ravel().tolist())
+    )
+    candidates = conn.execute("""
+        SELECT w.row, b.cluster_id, s.signature
+        FROM wanted_buckets w
+        JOIN lsh_buckets b ON b.band = w.band AND b.bucket = w.bucket
+        JOIN cluster_signatures s ON s.cluster_id = b.cluster_id
+        ORDER BY w.row, w.band
+    """).fetchall()
+    if candidates:
+        rows = np.fromiter((c[0] for c in candidates), dtype=np.int64, count=len(candidates))
+        cluster_ids = np.fromiter((c[1] for c in candidates), dtype=np.int64, count=len(candidates))
+        representatives = np.frombuffer(b''.join(c[2] for c in candidates), dtype=np.uint32)
+        similar = similarity(signatures[rows], representatives.reshape(-1, NUM_PERM)) >= SIMILARITY
+        matched_rows, first = np.unique(rows[similar], return_index=True)
+        assigned[matched_rows] = cluster_ids[similar][first]
+    
+    # 2. Cluster the remaining rows among themselves (union-find, each
+    #    bucket member verified against the bucket's first row)
+    pending = np.flatnonzero(assigned < 0)
+    parent = {int(i): int(i) for i in pending}
+    for band in range(BANDS):
+        _, first, inverse = np.unique(keys[pending, band], return_index=True, return_inverse=True)
+        heads = pending[first[inverse]]
+        linked = (heads != pending) & (similarity(signatures[pending], signatures[heads]) >= SIMILARITY)
+        for i, head in zip(pending[linked].tolist(), heads[linked].tolist()):
+            root_i, root_head = _find(parent, i), _find(parent, head)
+            if root_i != root_head:
+                parent[max(root_i, root_head)] = min(root_i, root_head)
+    
+    next_id = conn.execute("SELECT COALESCE(MAX(cluster_id), 0) + 1 FROM cluster_signatures").fetchone()[0]
+    root_ids = {}
+    new_clusters = []
+    for i in pending.tolist():
+        root = _find(parent, i)
+        if root not in root_ids:
+            root_ids[root] = next_id
+            new_clusters.append((next_id, signatures[root].tobytes()))
+            next_id += 1
+        assigned[i] = root_ids[root]
+    
+    conn.executemany("INSERT INTO cluster_signatures VALUES (?, ?)", new_clusters)
+    # Every member's buckets point at its cluster, widening what later reposts can hit
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh_buckets VALUES (?, ?, ?)",
+        zip(np.tile(np.arange(BANDS), n).tolist(), keys.ravel().tolist(),
+            np.repeat(assigned, BANDS).tolist())
+    )
+    return pd.Series(assigned[row_of], index=df.index, dtype='int64')
@@ -0,0 +1,169 @@
+# history.py
+"""
+Append-only price history for clean listings.
+
+The clean table only holds the latest state of each listing, so price
+movements are recorded here instead: one row per listing per observed
+price change (not per day), stored as a delta from the previous price.
+Days are integers (days since 1970-01-01) and links are interned to
+integer ids, so growth stays proportional to actual changes.
+
+    listing_ids    link -> link_id, brand, first/last seen, current price
+    price_changes  (link_id, day) -> price delta; the first row holds the full price
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+EPOCH = datetime.date(1970, 1, 1)
+
+def to_day(date_text):
+    return (datetime.date.fromisoformat(date_text) - EPOCH).days
+
+def from_day(day):
+    return EPOCH + datetime.timedelta(days=int(day))
+
+def init_history(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS listing_ids (
+            link_id INTEGER PRIMARY KEY,
+            link TEXT UNIQUE,
+            brand TEXT,
+            first_seen INTEGER,
+            last_seen INTEGER,
+            last_change INTEGER,
+            last_price REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_changes (
+            link_id INTEGER,
+            day INTEGER,
+            price_delta REAL,
+            PRIMARY KEY (link_id, day)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_listing_ids_brand ON listing_ids(brand)")
+
+def record_observations(conn, df):
+    """
+    Record (link, scrape_date, price, brand) observations.
+
+    New links get their first price; a price that differs from the last
+    recorded one appends a delta row (or amends it when it happened on the
+    same day); otherwise only last_seen moves. Observations older than a
+    listing's last_seen are ignored, so re-cleaning the same rows is a no-op.
+    Returns the number of price rows written.
+    """
+    init_history(conn)
+    if df.empty:
+        return 0
+
+    observations = df[['link', 'scrape_date', 'price', 'brand']].copy()
+    observations['day'] = [to_day(d) for d in observations['scrape_date']]
+    # Latest observation per link wins within a batch
+    observations = observations.sort_values('day').drop_duplicates('link', keep='last')
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS observed_links (link TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM observed_links")
+    conn.executemany("INSERT INTO observed_links VALUES (?)", ((l,) for l in observations['link']))
+    known = pd.read_sql("""
+        SELECT i.link, i.link_id, i.last_seen, i.last_change, i.last_price
+        FROM listing_ids i JOIN observed_links o ON o.link = i.link
+    """, conn)
+    merged = observations.merge(known, on='link', how='left')
+
+    new = merged[merged['link_id'].isna()]
+    seen = merged[merged['link_id'].notna()]
+    seen = seen[seen['day'] >= seen['last_seen']]
+    changed = seen[seen['price'] != seen['last_price']]
+
+    # New listings: intern the link, first row carries the full price
+    conn.executemany(
+        "INSERT INTO listing_ids (link, brand, first_seen, last_seen, last_change, last_price) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        zip(new['link'], new['brand'], new['day'].tolist(), new['day'].tolist(),
+            new['day'].tolist(), new['price'].tolist())
+    )
+    conn.executemany(
+        "INSERT INTO price_changes (link_id, day, price_delta) "
+        "SELECT link_id, ?, ? FROM listing_ids WHERE link = ?",
+        zip(new['day'].tolist(), new['price'].tolist(), new['link'])
+    )
+
+    # Price changes: append a delta, or fold into the row already written that day
+    conn.executemany(
+        "INSERT INTO price_changes (link_id, day, price_delta) VALUES (?, ?, ?) "
+        "ON CONFLICT(link_id, day) DO UPDATE SET price_delta = price_delta + excluded.price_delta",
+        zip(changed['link_id'].astype('int64').tolist(), changed['day'].tolist(),
+            (changed['price'] - changed['last_price']).tolist())
+    )
+    conn.executemany(
+        "UPDATE listing_ids SET last_change = ?, last_price = ? WHERE link_id = ?",
+        zip(changed['day'].tolist(), changed['price'].tolist(),
+            changed['link_id'].astype('int64').tolist())
+    )
+    conn.executemany(
+        "UPDATE listing_ids SET last_seen = ?, brand = ? WHERE link_id = ?",
+        zip(seen['day'].tolist(), seen['brand'], seen['link_id'].astype('int64').tolist())
+    )
+    return len(new) + len(changed)
+
+def price_trajectory(conn, link):
+    """Price of one listing at each recorded change, plus first/last seen dates"""
+    rows = conn.execute("""
+        SELECT c.day, SUM(c.price_delta) OVER (ORDER BY c.day) AS price
+        FROM price_changes c JOIN listing_ids i ON i.link_id = c.link_id
+        WHERE i.link = ?
+        ORDER BY c.day
+    """, (link,)).fetchall()
+    seen = conn.execute(
+        "SELECT first_seen, last_seen FROM listing_ids WHERE link = ?", (link,)
+    ).fetchone()
+    if seen is None:
+        return None
+    return {
+        'first_seen': from_day(seen[0]),
+        'last_seen': from_day(seen[1]),
+        'changes': pd.DataFrame(
+            [(from_day(day), price) for day, price in rows], columns=['date', 'price']
+        ),
+    }
+
+def weekly_median_price(conn, brand=None):
+    """
+    Median price per week per brand, counting each listing in every week it
+    was on the market (first_seen to last_seen) at the price in effect.
+    """
+    clause, params = ("WHERE i.brand = ?", [brand]) if brand else ("", [])
+    segments = pd.read_sql(f"""
+        SELECT c.link_id, i.brand, i.last_seen, c.day,
+               SUM(c.price_delta) OVER w AS price,
+               LEAD(c.day) OVER w AS next_day
+        FROM price_changes c JOIN listing_ids i ON i.link_id = c.link_id
+        {clause}
+        WINDOW w AS (PARTITION BY c.link_id ORDER BY c.day)
+        ORDER BY c.link_id, c.day
+    """, conn, params=params)
+    if segments.empty:
+        return pd.DataFrame(columns=['brand', 'week', 'median_price', 'listings'])
+
+    # Weeks start on Monday; day 0 (1970-01-01) was a Thursday
+    end_day = segments['next_day'].sub(1).fillna(segments['last_seen']).clip(upper=segments['last_seen'])
+    first_week = (segments['day'] + 3) // 7
+    last_week = (end_day.astype('int64') + 3) // 7
+    spans = (last_week - first_week + 1).clip(lower=1).to_numpy()
+
+    starts = np.repeat(np.cumsum(spans) - spans, spans)
+    expanded = pd.DataFrame({
+        'link_id': np.repeat(segments['link_id'].to_numpy(), spans),
+        'brand': np.repeat(segments['brand'].to_numpy(), spans),
+        'price': np.repeat(segments['price'].to_numpy(), spans),
+        'week': np.repeat(first_week.to_numpy(), spans) + (np.arange(spans.sum()) - starts),
+    })
+    # A listing that changed price mid-week counts once, at its latest price
+    expanded = expanded.drop_duplicates(['link_id', 'week'], keep='last')
+    weekly = expanded.groupby(['brand', 'week'])['price'].agg(['median', 'size']).reset_index()
+    weekly['week'] = [from_day(w * 7 - 3) for w in weekly['week']]
+    return weekly.rename(columns={'median': 'median_price', 'size': 'listings'})
@@ -0,0 +1,212 @@
+# metrics.py
+"""
+Scrape and clean run instrumentation.
+
+A RunMetrics object collects counters (pages, items, duplicates, failures,
+retries), time spent per pipeline stage and per page, and latency
+histograms. While the run progresses every page and batch is emitted as a
+JSON line; at the end the totals can be written as a Prometheus textfile
+(for node_exporter's textfile collector) and appended as one row to the
+scrape_runs table, so daily runs can be charted against each other.
+Clean runs are recorded the same way, with their own stages and counters,
+in clean_runs.
+
+The run tables live in marketpulse.db rather than the raw DB, which the
+daily CI job recreates on every run. The events file is shared by both
+jobs and rotated to EVENTS_PATH.1 once it grows past EVENTS_MAX_BYTES.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+RUNS_DB = 'marketpulse.db'
+
+# One JSON object per page/stage/batch, appended across runs
+EVENTS_PATH = 'scrape_events.jsonl'
+EVENTS_MAX_BYTES = 20 * 2**20
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+
+# Stages timed by the pipeline: waiting on the rate limiter, page loads,
+# listing extraction and DB writes
+STAGES = ('wait', 'fetch', 'parse', 'write')
+
+COUNTERS = ('pages_fetched', 'pages_parsed', 'pages_failed', 'retries', 'listings',
+            'inserted', 'updated', 'skipped', 'batches')
+
+# Stages and counters of a cleaner run
+CLEAN_STAGES = ('clean', 'write', 'overrides', 'cluster', 'sketch', 'aggregate', 'snapshot')
+CLEAN_COUNTERS = ('raw_rows', 'cleaned', 'rejected', 'price_rows', 'corrected', 'excluded',
+                  'rescored', 'clustered', 'sketched', 'snapshot_rows')
+
+def open_events(path, max_bytes=EVENTS_MAX_BYTES):
+    """Open `path` for appending, first moving it to path.1 if it's past max_bytes"""
+    if os.path.exists(path) and os.path.getsize(path) > max_bytes:
+        os.replace(path, path + '.1')
+    return open(path, 'a', encoding='utf-8')
+
+class Histogram:
+    """Cumulative-bucket histogram, keeping raw values for exact percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(value)
+
+    def bucket_counts(self):
+        """(upper bound, cumulative count) pairs, ending with +Inf"""
+        counts = [(bound, sum(1 for v in self.values if v <= bound)) for bound in self.buckets]
+        return counts + [(float('inf'), len(self.values))]
+
+    def percentile(self, q):
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class RunMetrics:
+    """
+    Thread-safe metrics for one scrape (or clean) run.
+
+    Args:
+        events_path: append one JSON object per line here (None: no events)
+        prometheus_path: write_prometheus() target (None: skipped)
+        job: 'scrape' or 'clean'; names the {job}_runs table and metrics
+        stages, counters: what the job times and counts
+    """
+
+    def __init__(self, events_path=None, prometheus_path=None, job='scrape',
+                 stages=STAGES, counters=COUNTERS):
+        self.run_id = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.started = time.time()
+        self.prometheus_path = prometheus_path
+        self.job = job
+        self.stages = stages
+        self.lock = threading.Lock()
+        self.counters = Counter({name: 0 for name in counters})
+        self.stage_seconds = Counter({stage: 0.0 for stage in stages})
+        self.histograms = {stage: Histogram() for stage in stages}
+        self.events = open_events(events_path) if events_path else None
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def event(self, kind, **fields):
+        """Emit one JSON line: timestamp, run id, event kind and fields"""
+        if self.events is None:
+            return
+        line = json.dumps({'ts': round(time.time(), 3), 'run_id': self.run_id, 'job': self.job,
+                           'event': kind, **fields}, ensure_ascii=False)
+        with self.lock:
+            self.events.write(line + '\n')
+            self.events.flush()
+
+    @contextmanager
+    def timer(self, stage, **fields):
+        """Time a block as `stage`; emits a stage event carrying `fields` (e.g. page)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.stage_seconds[stage] += seconds
+                self.histograms[stage].observe(seconds)
+            self.event('stage', stage=stage, seconds=round(seconds, 4), **fields)
+
+    def summary(self):
+        """Flat dict of the run totals, one {job}_runs row"""
+        with self.lock:
+            row = {
+                'run_id': self.run_id,
+                'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'elapsed': round(time.time() - self.started, 3),
+                **self.counters,
+            }
+            for stage in self.stages:
+                row[f'{stage}_seconds'] = round(self.stage_seconds[stage], 3)
+            if 'fetch' in self.histograms:
+                fetch = self.histograms['fetch']
+                row['fetch_p50'] = fetch.percentile(0.5)
+                row['fetch_p95'] = fetch.percentile(0.95)
+        return row
+
+    def print_summary(self):
+        summary = self.summary()
+        total = sum(summary[f'{stage}_seconds'] for stage in self.stages) or 1.0
+        print(f"{'Stage':<9} {'seconds':>9} {'share':>7}")
+        for stage in self.stages:
+            seconds = summary[f'{stage}_seconds']
+            print(f"{stage:<9} {seconds:>9.1f} {seconds / total:>7.1%}")
+        if summary.get('fetch_p50') is not None:
+            print(f"Page load p50 {summary['fetch_p50']:.2f}s | p95 {summary['fetch_p95']:.2f}s")
+
+    def write_prometheus(self, path=None):
+        """Write the totals in Prometheus text format, atomically replacing `path`"""
+        path = path or self.prometheus_path
+        if path is None:
+            return
+        summary = self.summary()
+        prefix = f"marketpulse_{self.job}"
+        lines = []
+        for name in self.counters:
+            metric = f"{prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {summary[name]}"]
+        lines.append(f"# TYPE {prefix}_stage_seconds gauge")
+        for stage in self.stages:
+            lines.append(f'{prefix}_stage_seconds{{stage="{stage}"}} {summary[stage + "_seconds"]}')
+        lines.append(f"# TYPE {prefix}_stage_latency_seconds histogram")
+        with self.lock:
+            for stage in self.stages:
+                histogram = self.histograms[stage]
+                for bound, count in histogram.bucket_counts():
+                    le = '+Inf' if bound == float('inf') else bound
+                    lines.append(f'{prefix}_stage_latency_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'{prefix}_stage_latency_seconds_sum{{stage="{stage}"}} {sum(histogram.values)}')
+                lines.append(f'{prefix}_stage_latency_seconds_count{{stage="{stage}"}} {len(histogram.values)}')
+        lines += [f"# TYPE {prefix}_duration_seconds gauge",
+                  f"{prefix}_duration_seconds {summary['elapsed']}",
+                  f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+                  f"{prefix}_last_run_timestamp_seconds {self.started:.0f}"]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def save(self, db_path=RUNS_DB):
+        """Append the run summary to the {job}_runs table"""
+        summary = self.summary()
+        table = f"{self.job}_runs"
+        percentiles = [f"{name} REAL" for name in ('fetch_p50', 'fetch_p95') if name in summary]
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    run_id TEXT PRIMARY KEY,
+                    started TEXT,
+                    elapsed REAL,
+                    {', '.join(f'{name} INTEGER' for name in self.counters)},
+                    {', '.join([f'{stage}_seconds REAL' for stage in self.stages] + percentiles)}
+                )
+            """)
+            columns = ", ".join(summary)
+            placeholders = ", ".join("?" for _ in summary)
+            conn.execute(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})",
+                         list(summary.values()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        if self.events is not None:
+            self.events.close()
+            self.events = None
@@ -0,0 +1,270 @@
+# overrides.py
+"""
+Manual corrections that survive re-cleans, and full-text search on titles.
+
+title_fts is an FTS5 index over the clean table's titles. Triggers keep it
+in sync with inserts, upserts and deletes, and it is rebuilt whenever the
+cleaner has replaced the table (the triggers are gone then).
+
+The overrides table holds correction rules. A rule selects listings by an
+FTS5 query on the title or by exact link, then either sets brand, cpu
+and/or ram or excludes the listings from the clean table. The cleaner
+applies every rule after each run, one index lookup per rule, so fixes
+are no longer lost when the table is rebuilt.
+
+    python overrides.py search '"hp stream" 32go'
+    python overrides.py add --match '"hp stream" 32go' --exclude --note "32Go is storage"
+    python overrides.py add --link https://www.avito.ma/fr/... --ram 8
+    python overrides.py list
+    python overrides.py remove 3
+    python overrides.py apply
+"""
+import argparse
+import datetime
+import sqlite3
+
+import pandas as pd
+
+from queries import CLEAN_TABLE, DB_PATH, TITLE_INDEX
+
+OVERRIDE_FIELDS = ('brand', 'cpu', 'ram')
+
+# Index sync triggers, named after the event they follow
+TITLE_TRIGGERS = {
+    f'{TITLE_INDEX}_insert': f"""
+        AFTER INSERT ON {CLEAN_TABLE} BEGIN
+            INSERT INTO {TITLE_INDEX}(rowid, title) VALUES (new.rowid, new.title);
+        END""",
+    f'{TITLE_INDEX}_delete': f"""
+        AFTER DELETE ON {CLEAN_TABLE} BEGIN
+            INSERT INTO {TITLE_INDEX}({TITLE_INDEX}, rowid, title) VALUES ('delete', old.rowid, old.title);
+        END""",
+    f'{TITLE_INDEX}_update': f"""
+        AFTER UPDATE OF title ON {CLEAN_TABLE} BEGIN
+            INSERT INTO {TITLE_INDEX}({TITLE_INDEX}, rowid, title) VALUES ('delete', old.rowid, old.title);
+            INSERT INTO {TITLE_INDEX}(rowid, title) VALUES (new.rowid, new.title);
+        END""",
+}
+
+def init_title_index(conn):
+    """
+    Create title_fts and its triggers; rebuild the index when they were
+    missing (new index, or a clean table replaced since). Returns whether
+    it was rebuilt.
+    """
+    # External content: the index stores no copy of the titles
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TITLE_INDEX} USING fts5(
+            title, content='{CLEAN_TABLE}', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    existing = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (CLEAN_TABLE,)
+    )}
+    if set(TITLE_TRIGGERS) <= existing:
+        return False
+    for name, body in TITLE_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    conn.execute(f"INSERT INTO {TITLE_INDEX}({TITLE_INDEX}) VALUES ('rebuild')")
+    return True
+
+def init_overrides(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS overrides (
+            rule_id INTEGER PRIMARY KEY,
+            pattern TEXT,
+            link TEXT,
+            brand TEXT,
+            cpu TEXT,
+            ram INTEGER,
+            is_excluded INTEGER NOT NULL DEFAULT 0,
+            note TEXT,
+            created TEXT,
+            CHECK ((pattern IS NULL) != (link IS NULL))
+        )
+    """)
+
+def add_rule(conn, pattern=None, link=None, brand=None, cpu=None, ram=None, exclude=False, note=None):
+    """
+    Store a correction rule selecting listings by FTS5 `pattern` or exact
+    `link`. Raises ValueError for an invalid rule. Returns its rule_id.
+    """
+    if (pattern is None) == (link is None):
+        raise ValueError("A rule needs either a title pattern or a link")
+    if not exclude and brand is None and cpu is None and ram is None:
+        raise ValueError("A rule needs --exclude or at least one of brand, cpu, ram")
+    if exclude and not (brand is None and cpu is None and ram is None):
+        raise ValueError("An excluding rule can't also override fields")
+    if ram is not None and ram <= 0:
+        raise ValueError("RAM overrides must be positive; exclude the listing instead")
+    init_overrides(conn)
+    if pattern is not None:
+        init_title_index(conn)
+        try:
+            conn.execute(f"SELECT COUNT(*) FROM {TITLE_INDEX} WHERE {TITLE_INDEX} MATCH ?", (pattern,))
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Invalid FTS5 pattern {pattern!r}: {e}")
+    cursor = conn.execute(
+        "INSERT INTO overrides (pattern, link, brand, cpu, ram, is_excluded, note, created) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (pattern, link, brand, cpu, ram, int(exclude), note,
+         datetime.datetime.now().isoformat(timespec='seconds'))
+    )
+    return cursor.lastrowid
+
+def rule_matches(conn):
+    """
+    (row_id, rule_id) pairs for every rule and the clean rows it selects:
+    FTS5 lookups for patterns, the link index for links.
+    """
+    return pd.read_sql(f"""
+        SELECT f.rowid AS row_id, o.rule_id
+        FROM overrides o JOIN {TITLE_INDEX} f ON f.{TITLE_INDEX} MATCH o.pattern
+        WHERE o.pattern IS NOT NULL
+        UNION ALL
+        SELECT c.rowid, o.rule_id
+        FROM overrides o JOIN {CLEAN_TABLE} c ON c.link = o.link
+        WHERE o.link IS NOT NULL
+    """, conn)
+
+def apply_overrides(conn):
+    """
+    Apply every rule to the clean table. When several rules set the same
+    field of a row, the latest rule wins. Corrected rows lose their
+    score_version so they get rescored.
+    
+    Returns (rows corrected, rows excluded, cluster ids of excluded rows,
+    brand/cpu/ram cells that lost or gained rows), the last for
+    cleaner.update_price_sketches.
+    """
+    init_overrides(conn)
+    init_title_index(conn)
+    rules = pd.read_sql("SELECT * FROM overrides", conn)
+    if rules.empty:
+        return 0, 0, [], set()
+    hits = rule_matches(conn).merge(rules, on='rule_id').sort_values('rule_id')
+    
+    excluded = hits.loc[hits['is_excluded'] == 1, 'row_id'].unique().tolist()
+    fields = hits[hits['is_excluded'] == 0].groupby('row_id')[list(OVERRIDE_FIELDS)].last()
+    fields = fields.drop(index=excluded, errors='ignore')
+    fields = fields.astype(object).where(fields.notna(), None)
+    if 'ram' in fields:
+        fields['ram'] = [None if r is None else int(r) for r in fields['ram']]
+    
+    corrected = 0
+    cells = set()
+    for row_id, brand, cpu, ram in fields.itertuples(name=None):
+        old = conn.execute(f"SELECT brand, cpu, ram FROM {CLEAN_TABLE} WHERE rowid = ?", (int(row_id),)).fetchone()
+        cursor = conn.execute(f"""
+            UPDATE {CLEAN_TABLE}
+            SET brand = COALESCE(?1, brand), cpu = COALESCE(?2, cpu), ram = COALESCE(?3, ram),
+                score_version = NULL
+            WHERE rowid = ?4
+              AND (brand IS NOT COALESCE(?1, brand) OR cpu IS NOT COALESCE(?2, cpu)
+                   OR ram IS NOT COALESCE(?3, ram))
+        """, (brand, cpu, ram, int(row_id)))
+        if cursor.rowcount:
+            corrected += 1
+            cells.add(old)
+            cells.add((old[0] if brand is None else brand, old[1] if cpu is None else cpu,
+                       old[2] if ram is None else ram))
+    
+    clusters = []
+    if excluded:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS excluded_rows (row_id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM excluded_rows")
+        conn.executemany("INSERT INTO excluded_rows VALUES (?)", ((int(r),) for r in excluded))
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({CLEAN_TABLE})")}
+        if 'cluster_id' in columns:
+            clusters = [r[0] for r in conn.execute(
+                f"SELECT DISTINCT cluster_id FROM {CLEAN_TABLE} "
+                f"WHERE rowid IN (SELECT row_id FROM excluded_rows) AND cluster_id IS NOT NULL"
+            )]
+        cells.update(conn.execute(
+            f"SELECT DISTINCT brand, cpu, ram FROM {CLEAN_TABLE} WHERE rowid IN (SELECT row_id FROM excluded_rows)"
+        ))
+        conn.execute(f"DELETE FROM {CLEAN_TABLE} WHERE rowid IN (SELECT row_id FROM excluded_rows)")
+    return corrected, len(excluded), clusters, cells
+
+def search(conn, pattern, limit=50):
+    """Clean rows whose title matches an FTS5 query, best matches first"""
+    return pd.read_sql(f"""
+        SELECT c.brand, c.cpu, c.ram, c.price, c.title, c.link
+        FROM {TITLE_INDEX} f JOIN {CLEAN_TABLE} c ON c.rowid = f.rowid
+        WHERE f.{TITLE_INDEX} MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+    """, conn, params=(pattern, limit))
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage correction rules for the clean listings table")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    search_parser = commands.add_parser('search', help="show clean listings matching an FTS5 title query")
+    search_parser.add_argument('pattern')
+    search_parser.add_argument('--limit', type=int, default=50)
+    
+    add_parser = commands.add_parser('add', help="add a correction rule")
+    target = add_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--match', dest='pattern', help="FTS5 query on the title, e.g. '\"hp stream\" 32go'")
+    target.add_argument('--link', help="exact listing URL")
+    add_parser.add_argument('--brand')
+    add_parser.add_argument('--cpu')
+    add_parser.add_argument('--ram', type=int)
+    add_parser.add_argument('--exclude', action='store_true', help="drop matching listings from the clean table")
+    add_parser.add_argument('--note')
+    
+    commands.add_parser('list', help="list the rules")
+    remove_parser = commands.add_parser('remove', help="delete a rule")
+    remove_parser.add_argument('rule_id', type=int)
+    commands.add_parser('apply', help="apply the rules now instead of on the next clean")
+    args = parser.parse_args()
+    
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if args.command == 'search':
+            init_title_index(conn)
+            conn.commit()
+            results = search(conn, args.pattern, args.limit)
+            print(results.to_string(index=False) if not results.empty else "No matching listings")
+        elif args.command == 'add':
+            try:
+                rule_id = add_rule(conn, args.pattern, args.link, args.brand, args.cpu, args.ram,
+                                   args.exclude, args.note)
+            except ValueError as e:
+                parser.error(str(e))
+            conn.commit()
+            print(f"✓ Added rule {rule_id}, applied on the next clean (or run: python overrides.py apply)")
+        elif args.command == 'list':
+            init_overrides(conn)
+            rules = pd.read_sql("SELECT * FROM overrides ORDER BY rule_id", conn)
+            rules = rules.astype(object).where(rules.notna(), '')
+            print(rules.to_string(index=False) if not rules.empty else "No rules")
+        elif args.command == 'remove':
+            init_overrides(conn)
+            removed = conn.execute("DELETE FROM overrides WHERE rule_id = ?", (args.rule_id,)).rowcount
+            conn.commit()
+            # Corrections already written stay until the next full clean
+            print(f"✓ Removed rule {args.rule_id}" if removed else f"No rule {args.rule_id}")
+        elif args.command == 'apply':
+            # The cleaner imports this module, so only import it here
+            from cleaner import (assign_clusters, build_aggregates, prepare_clean_table,
+                                 refresh_stale_scores, stamp_data_version, update_price_sketches,
+                                 write_snapshot)
+            prepare_clean_table(conn)
+            corrected, excluded, clusters, cells = apply_overrides(conn)
+            rescored = refresh_stale_scores(conn)
+            assign_clusters(conn, clusters=clusters)
+            # Price percentiles (deal flags) of the cells that gained or lost rows
+            update_price_sketches(conn, cells=cells)
+            build_aggregates(conn)
+            stamp_data_version(conn)
+            conn.commit()
+            write_snapshot(conn)
+            print(f"✓ {corrected} rows corrected ({rescored} rescored), {excluded} excluded")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
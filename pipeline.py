@@ -0,0 +1,281 @@
+# pipeline.py
+"""
+Staged scraping pipeline: fetch -> parse -> write.
+
+Each stage runs in its own thread and hands work to the next one through
+a bounded queue, so a slow stage makes the ones before it wait instead of
+piling pages up in memory. Politeness is enforced by a token bucket in
+front of the fetch stage rather than sleeps inside the loop.
+
+The fetch stage can run several workers (e.g. one browser session each)
+pulling pages from a shared task list, each behind its own token bucket;
+parsing and the single writer are shared by all of them.
+
+The stages are plain callables, so the same pipeline runs against Avito
+with Selenium or against a local HTTP server serving fixture pages.
+"""
+import heapq
+import queue
+import threading
+import time
+
+from metrics import RunMetrics
+
+_DONE = object()
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, bursting up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, stop_event=None):
+        """Block until a token is available. Returns False if stop_event fired first."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return False
+
+def run_pipeline(pages, page_url, fetch, parse, write, rate=0.27, burst=1,
+                 batch_size=10, queue_size=4, metrics=None, until=None,
+                 retries=2, backoff=5.0, on_failure=None):
+    """
+    Scrape `pages` through fetch/parse/write stages running concurrently.
+
+    Args:
+        pages: iterable of page numbers, fetched in order
+        page_url: page number -> URL
+        fetch: URL -> HTML, or a list of such callables to fetch with one
+            worker thread each; a callable is only ever called from its
+            own worker thread
+        parse: (html, page, url) -> list of listing dicts; an empty list
+            marks the end of the listings and stops further fetching
+        write: list of listing dicts -> None or a dict of inserted/updated/skipped
+            counts, called from the single writer thread
+        rate: pages per second allowed by each fetch worker's token bucket
+        burst: token bucket capacity
+        batch_size: flush to `write` every N parsed pages
+        queue_size: bound of each inter-stage queue (backpressure)
+        metrics: RunMetrics receiving stage timings, counters and events
+        until: optional (page, listings) -> bool, called after each parsed
+            page; True stops fetching pages after that one
+        retries: extra fetch attempts for a page whose fetch raised
+        backoff: seconds before the first retry, doubled for each later one
+        on_failure: optional (page, stage, error, attempt, final) callback,
+            called from the failing stage's thread on every failed attempt
+
+    Returns a stats dict with counts, failed pages, throughput, why the run
+    stopped early ('end', 'until', 'interrupted', or None) and stop_page,
+    the first page past the end (None unless ended by 'end' or 'until').
+    Pages before stop_page still get their retries. With several fetch
+    workers, pages reach parse and `until` roughly but not strictly in order.
+    """
+    fetchers = list(fetch) if isinstance(fetch, (list, tuple)) else [fetch]
+    html_queue = queue.Queue(maxsize=queue_size)
+    listing_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    # Shared by the fetch workers: fresh pages, retries and the stats
+    task_lock = threading.Lock()
+    retry_queue = []
+    fresh = iter(pages)
+    active_fetchers = [len(fetchers)]
+    metrics = metrics or RunMetrics()
+    stats = {
+        "pages_fetched": 0,
+        "pages_parsed": 0,
+        "listings": 0,
+        "listings_written": 0,
+        "failed_pages": [],
+        "last_page": None,
+        "stopped": None,
+        "stop_page": None,
+    }
+    
+    def fail(page, stage, error, attempt, final):
+        metrics.event("page_failed", page=page, stage=stage, attempt=attempt, final=final, error=str(error))
+        if final:
+            stats["failed_pages"].append(page)
+            metrics.count("pages_failed")
+        if on_failure is not None:
+            on_failure(page, stage, error, attempt, final)
+
+    def put(q, item, droppable=False):
+        # Fetched pages are dropped once stopped (parse would skip them anyway);
+        # parsed listings and end markers always go through
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if droppable and stop.is_set():
+                    return
+
+    def wanted(page):
+        # After the listings end (or `until` fires) only earlier pages matter
+        return stats["stop_page"] is None or page < stats["stop_page"]
+
+    def end_at(page, reason):
+        if stats["stop_page"] is None or page < stats["stop_page"]:
+            stats["stop_page"] = page
+            stats["stopped"] = reason
+
+    def next_task():
+        """
+        (page, attempt) to fetch next: a due retry, else a fresh page, else
+        wait for the next retry. None once there's nothing left (or stopped).
+        """
+        # Failed fetches wait in a retry queue (exponential backoff) and are
+        # interleaved with fresh pages once their delay is up
+        while not stop.is_set():
+            with task_lock:
+                if retry_queue and retry_queue[0][0] <= time.monotonic():
+                    _, page, attempt = heapq.heappop(retry_queue)
+                    if wanted(page):
+                        return page, attempt
+                    continue
+                page = next(fresh, _DONE)
+                if page is not _DONE and wanted(page):
+                    return page, 1
+                # No fresh pages left: wait for the next retry, if any
+                if not retry_queue:
+                    return None
+                delay = retry_queue[0][0] - time.monotonic()
+            if stop.wait(max(0.0, delay)):
+                return None
+        return None
+    
+    def fetch_stage(fetch_page, bucket):
+        try:
+            while True:
+                task = next_task()
+                if task is None:
+                    break
+                page, attempt = task
+                with metrics.timer("wait", page=page):
+                    allowed = bucket.acquire(stop)
+                if not allowed:
+                    break
+                url = page_url(page)
+                try:
+                    with metrics.timer("fetch", page=page, attempt=attempt):
+                        html = fetch_page(url)
+                except Exception as e:
+                    final = attempt > retries
+                    print(f"\nError fetching page {page} (attempt {attempt}): {e}")
+                    fail(page, "fetch", e, attempt, final)
+                    if not final:
+                        with task_lock:
+                            heapq.heappush(retry_queue, (time.monotonic() + backoff * 2 ** (attempt - 1),
+                                                         page, attempt + 1))
+                        metrics.count("retries")
+                    continue
+                with task_lock:
+                    stats["pages_fetched"] += 1
+                metrics.count("pages_fetched")
+                put(html_queue, (page, url, html), droppable=True)
+        finally:
+            # The last worker to finish tells the parse stage
+            with task_lock:
+                active_fetchers[0] -= 1
+                last = active_fetchers[0] == 0
+            if last:
+                put(html_queue, _DONE)
+
+    def parse_stage():
+        try:
+            while True:
+                item = html_queue.get()
+                if item is _DONE:
+                    break
+                page, url, html = item
+                if stop.is_set() or not wanted(page):
+                    continue
+                try:
+                    with metrics.timer("parse", page=page):
+                        listings = parse(html, page, url)
+                except Exception as e:
+                    # Same HTML would fail again, so parse errors aren't retried
+                    print(f"\nError parsing page {page}: {e}")
+                    fail(page, "parse", e, 1, True)
+                    continue
+                if not listings:
+                    print(f"\nNo items found on page {page} - might be end of listings")
+                    end_at(page, "end")
+                    continue
+                stats["pages_parsed"] += 1
+                stats["listings"] += len(listings)
+                stats["last_page"] = max(page, stats["last_page"] or page)
+                metrics.count("pages_parsed")
+                metrics.count("listings", len(listings))
+                metrics.event("page", page=page, listings=len(listings))
+                print(f"Page {page} | Total: {stats['listings']} items", end="\r")
+                put(listing_queue, listings)
+                if until is not None and until(page, listings):
+                    end_at(page + 1, "until")
+        finally:
+            put(listing_queue, _DONE)
+
+    def write_stage():
+        batch = []
+        batch_pages = 0
+        while True:
+            item = listing_queue.get()
+            if item is not _DONE:
+                batch.extend(item)
+                batch_pages += 1
+            if batch and (item is _DONE or batch_pages >= batch_size):
+                try:
+                    with metrics.timer("write", listings=len(batch)):
+                        counts = write(batch)
+                    stats["listings_written"] += len(batch)
+                    metrics.count("batches")
+                    for key, value in (counts or {}).items():
+                        metrics.count(key, value)
+                except Exception as e:
+                    print(f"\nError writing batch of {len(batch)} items: {e}")
+                    metrics.event("write_failed", listings=len(batch), error=str(e))
+                batch = []
+                batch_pages = 0
+            if item is _DONE:
+                break
+
+    threads = [
+        threading.Thread(target=fetch_stage, args=(fetch_page, TokenBucket(rate, burst)),
+                         name=f"fetch-{i}", daemon=True)
+        for i, fetch_page in enumerate(fetchers)
+    ] + [
+        threading.Thread(target=parse_stage, name="parse", daemon=True),
+        threading.Thread(target=write_stage, name="write", daemon=True),
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        print("\n\nScraping stopped by user, flushing pending items...")
+        stats["stopped"] = "interrupted"
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed"] = elapsed
+    stats["pages_per_sec"] = stats["pages_parsed"] / elapsed if elapsed else 0.0
+    stats["listings_per_sec"] = stats["listings"] / elapsed if elapsed else 0.0
+    return stats
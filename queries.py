@@ -0,0 +1,539 @@
+# queries.py
+"""
+Query layer for the dashboard.
+
+Sidebar filters are turned into parameterized SQL against marketpulse.db
+so each widget fetches only the aggregate or the columns it draws,
+instead of loading the whole clean table into pandas. The cleaner creates
+the (brand, cpu, ram, price) index these filters run on.
+"""
+import os
+import pathlib
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from sketches import PriceDigest, merge_all
+
+DB_PATH = 'marketpulse.db'
+CLEAN_TABLE = 'laptops_clean_new'
+
+# Pre-aggregated tables built by the cleaner (see cleaner.build_aggregates)
+AGG_CELLS = 'agg_cells'
+AGG_BINS = 'agg_price_bins'
+
+# Per-cell price t-digests maintained by the cleaner (see sketches.py)
+PRICE_SKETCHES = 'price_sketches'
+
+# Price vs Quality scatter: every point up to SCATTER_MAX_POINTS, drawn with
+# WebGL above SCATTER_WEBGL_POINTS; beyond, a binned density plus a sample
+# of hoverable points, so the page size no longer grows with the data
+SCATTER_WEBGL_POINTS = 2_000
+SCATTER_MAX_POINTS = 50_000
+SCATTER_SAMPLE = 2_000
+DENSITY_BINS = (80, 50)
+
+# Listings priced below this percentile of their brand x cpu x ram segment
+# are flagged as below market
+DEAL_PERCENTILE = 0.25
+
+# FTS5 index over the clean table's titles (see overrides.py)
+TITLE_INDEX = 'title_fts'
+
+# Columnar copy of the clean table written by the cleaner (see cleaner.write_snapshot)
+SNAPSHOT_PATH = 'marketpulse_snapshot.arrow'
+# Schema metadata key holding the data_version the snapshot was written at
+SNAPSHOT_VERSION_KEY = 'data_version'
+
+# 'All' means no filter for brand and cpu; hide_reposts keeps one listing
+# per repost cluster (see dedup.py)
+Filters = namedtuple('Filters', ['brand', 'price_min', 'price_max', 'min_ram', 'cpu', 'hide_reposts'],
+                     defaults=[False])
+
+def clean_state(conn, key):
+    """A value the cleaner stored in clean_state, None when absent"""
+    try:
+        row = conn.execute("SELECT value FROM clean_state WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def data_version(conn):
+    """Stamp written by every cleaner run (see cleaner.stamp_data_version)"""
+    return clean_state(conn, 'data_version')
+
+def last_cleaned(conn):
+    """When the cleaner last changed the data, as an ISO timestamp (None if never stamped)"""
+    return clean_state(conn, 'cleaned_at')
+
+class QueryCache:
+    """
+    Bounded LRU of query results, keyed on the query and its arguments
+    (filter tuples, columns...) and valid for one data version: sync()
+    drops every entry once the cleaner has stamped a new version.
+    Shared by all dashboard sessions, hence the lock.
+    """
+    
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def sync(self, version):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+    
+    @staticmethod
+    def _key_part(value):
+        # A snapshot is identified by the data version it was written at
+        if isinstance(value, pa.Table):
+            return ('snapshot', snapshot_version(value))
+        if isinstance(value, (list, tuple, pd.Index)):
+            return tuple(value)
+        return value
+    
+    def call(self, query, conn, *args, **kwargs):
+        """query(conn, *args, **kwargs), from the cache when already computed"""
+        key = (query.__name__, tuple(self._key_part(a) for a in args),
+               tuple(sorted((k, self._key_part(v)) for k, v in kwargs.items())))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            version = self.version
+        result = query(conn, *args, **kwargs)
+        with self.lock:
+            # Not stored when the version moved on while computing
+            if version == self.version:
+                self.entries[key] = result
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return result
+
+# Columns the cleaner adds to the clean table: a database cleaned by an
+# older version lacks some of them until `python cleaner.py --migrate`
+DERIVED_COLUMNS = ('quality_score', 'value_ratio', 'is_repost', 'price_percentile')
+
+def connect(db_path=DB_PATH):
+    # Shared across Streamlit's script threads, and opened read-only: only
+    # the cleaner (and overrides.py) write to the database
+    uri = f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+def missing_columns(conn, columns=DERIVED_COLUMNS):
+    """Which of `columns` the clean table doesn't have"""
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({CLEAN_TABLE})")}
+    return [column for column in columns if column not in present]
+
+def where(filters, with_price=True):
+    """SQL WHERE clause and its parameters for a Filters tuple"""
+    clauses = []
+    params = []
+    if filters.brand != 'All':
+        clauses.append("brand = ?")
+        params.append(filters.brand)
+    if filters.cpu != 'All':
+        clauses.append("cpu = ?")
+        params.append(filters.cpu)
+    clauses.append("ram >= ?")
+    params.append(filters.min_ram)
+    if with_price:
+        clauses += ["price >= ?", "price <= ?"]
+        params += [filters.price_min, filters.price_max]
+    if filters.hide_reposts:
+        clauses.append("is_repost IS NOT 1")
+    return "WHERE " + " AND ".join(clauses), params
+
+def has_aggregates(conn):
+    row = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)",
+        (AGG_CELLS, AGG_BINS)
+    ).fetchone()
+    return row[0] == 2
+
+def use_aggregates(conn, filters):
+    """
+    The per-cell tables answer a query exactly when the price filter keeps
+    every row, since brand/cpu/ram filters select whole cells. Cells count
+    reposts too, so hiding them needs the clean table.
+    """
+    if filters.hide_reposts or not has_aggregates(conn):
+        return False
+    low, high = conn.execute(f"SELECT MIN(min_price), MAX(max_price) FROM {AGG_CELLS}").fetchone()
+    return low is not None and filters.price_min <= low and filters.price_max >= high
+
+def price_bin_width(conn):
+    row = conn.execute("SELECT value FROM clean_state WHERE key = 'price_bin_width'").fetchone()
+    return float(row[0])
+
+def binned_prices(conn, filters):
+    """(bin, count) pairs over the selected cells, ordered by bin"""
+    clause, params = where(filters, with_price=False)
+    return conn.execute(
+        f"SELECT bin, SUM(n) FROM {AGG_BINS} {clause} GROUP BY bin ORDER BY bin", params
+    ).fetchall()
+
+def has_sketches(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (PRICE_SKETCHES,)
+    ).fetchone()
+    return row is not None and conn.execute(f"SELECT 1 FROM {PRICE_SKETCHES} LIMIT 1").fetchone() is not None
+
+def use_sketches(conn, filters):
+    """Like the aggregate cells, the sketches count reposts"""
+    return not filters.hide_reposts and has_sketches(conn)
+
+def sketch_quantiles(conn, filters, qs):
+    """
+    Price quantiles of the filtered rows from the merged digests of the
+    selected cells. A price range keeps the part of the merged
+    distribution inside it, so any filters can be answered.
+    """
+    clause, params = where(filters, with_price=False)
+    digest = merge_all(
+        PriceDigest.from_bytes(blob, low, high)
+        for blob, low, high in conn.execute(
+            f"SELECT centroids, low, high FROM {PRICE_SKETCHES} {clause}", params
+        )
+    )
+    low, high = digest.cdf([filters.price_min, filters.price_max])
+    return digest.quantile(low + np.asarray(qs) * (high - low)).tolist()
+
+def filter_options(conn):
+    """Values offered by the sidebar widgets"""
+    if has_aggregates(conn):
+        table, min_col, max_col, count = AGG_CELLS, 'min_price', 'max_price', 'SUM(n)'
+    else:
+        table, min_col, max_col, count = CLEAN_TABLE, 'price', 'price', 'COUNT(*)'
+    brands = [r[0] for r in conn.execute(f"SELECT DISTINCT brand FROM {table} ORDER BY brand")]
+    cpus = [r[0] for r in conn.execute(f"SELECT DISTINCT cpu FROM {table} ORDER BY cpu")]
+    rams = [r[0] for r in conn.execute(f"SELECT DISTINCT ram FROM {table} ORDER BY ram")]
+    price_min, price_max, total = conn.execute(
+        f"SELECT MIN({min_col}), MAX({max_col}), {count} FROM {table}"
+    ).fetchone()
+    return {
+        'brands': brands,
+        'cpus': cpus,
+        'rams': rams,
+        'price_min': price_min,
+        'price_max': price_max,
+        'total': total,
+    }
+
+def overview(conn, filters):
+    """Count, average/min/max price and number of brands for the filtered rows"""
+    if use_aggregates(conn, filters):
+        clause, params = where(filters, with_price=False)
+        count, avg_price, min_price, max_price, brands = conn.execute(
+            f"SELECT COALESCE(SUM(n), 0), SUM(sum_price) / SUM(n), MIN(min_price), MAX(max_price), "
+            f"COUNT(DISTINCT brand) FROM {AGG_CELLS} {clause}", params
+        ).fetchone()
+    else:
+        clause, params = where(filters)
+        count, avg_price, min_price, max_price, brands = conn.execute(
+            f"SELECT COUNT(*), AVG(price), MIN(price), MAX(price), COUNT(DISTINCT brand) "
+            f"FROM {CLEAN_TABLE} {clause}", params
+        ).fetchone()
+    return {
+        'count': count,
+        'avg_price': avg_price,
+        'min_price': min_price,
+        'max_price': max_price,
+        'brands': brands,
+    }
+
+def value_counts(conn, filters, column, limit=None):
+    """Rows per value of `column`, most frequent first (ties by value)"""
+    if use_aggregates(conn, filters):
+        clause, params = where(filters, with_price=False)
+        sql = (f"SELECT {column}, SUM(n) AS count FROM {AGG_CELLS} {clause} "
+               f"GROUP BY {column} ORDER BY count DESC, {column}")
+    else:
+        clause, params = where(filters)
+        sql = (f"SELECT {column}, COUNT(*) AS count FROM {CLEAN_TABLE} {clause} "
+               f"GROUP BY {column} ORDER BY count DESC, {column}")
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    rows = conn.execute(sql, params).fetchall()
+    return pd.Series([n for _, n in rows], index=[v for v, _ in rows], dtype='int64')
+
+def median_price(conn, filters, count):
+    """
+    Median price: from the price sketches when they apply, otherwise exact
+    from the middle one or two rows of the price order.
+    """
+    if not count:
+        return None
+    if use_sketches(conn, filters):
+        return sketch_quantiles(conn, filters, [0.5])[0]
+    clause, params = where(filters)
+    return conn.execute(
+        f"SELECT AVG(price) FROM (SELECT price FROM {CLEAN_TABLE} {clause} "
+        f"ORDER BY price LIMIT ? OFFSET ?)",
+        params + [2 - count % 2, (count - 1) // 2]
+    ).fetchone()[0]
+
+def price_histogram(conn, filters, min_price, max_price, bins=50):
+    """
+    Equal-width price bins: (left edges, width, counts). From the aggregates,
+    the stored fixed-width bins are merged down to at most `bins` bars;
+    otherwise `bins` bins are computed between min_price and max_price.
+    """
+    if use_aggregates(conn, filters):
+        stored = binned_prices(conn, filters)
+        if stored:
+            base_width = price_bin_width(conn)
+            first, last = stored[0][0], stored[-1][0]
+            merge = -(-(last - first + 1) // bins)
+            counts = [0] * ((last - first) // merge + 1)
+            for b, n in stored:
+                counts[(b - first) // merge] += n
+            width = base_width * merge
+            edges = [(first + i * merge) * base_width for i in range(len(counts))]
+            return edges, width, counts
+    
+    width = (max_price - min_price) / bins or 1.0
+    clause, params = where(filters)
+    rows = conn.execute(
+        f"SELECT MIN(CAST((price - ?) / ? AS INTEGER), ?) AS bin, COUNT(*) "
+        f"FROM {CLEAN_TABLE} {clause} GROUP BY bin",
+        [min_price, width, bins - 1] + params
+    ).fetchall()
+    counts = [0] * bins
+    for b, n in rows:
+        counts[b] += n
+    edges = [min_price + i * width for i in range(bins)]
+    return edges, width, counts
+
+def avg_price_by(conn, filters, column):
+    if use_aggregates(conn, filters):
+        clause, params = where(filters, with_price=False)
+        rows = conn.execute(
+            f"SELECT {column}, SUM(sum_price) / SUM(n) FROM {AGG_CELLS} {clause} "
+            f"GROUP BY {column} ORDER BY {column}", params
+        ).fetchall()
+        return pd.Series([p for _, p in rows], index=[v for v, _ in rows], dtype='float64')
+    
+    clause, params = where(filters)
+    rows = conn.execute(
+        f"SELECT {column}, AVG(price) FROM {CLEAN_TABLE} {clause} GROUP BY {column} ORDER BY {column}",
+        params
+    ).fetchall()
+    return pd.Series([p for _, p in rows], index=[v for v, _ in rows], dtype='float64')
+
+def fetch_rows(conn, filters, columns, extra_where="", extra_params=(), order_by=None,
+               limit=None, offset=0):
+    """Only the requested columns of the filtered rows"""
+    clause, params = where(filters)
+    sql = f"SELECT {', '.join(columns)} FROM {CLEAN_TABLE} {clause}{extra_where}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    if limit:
+        sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+    return pd.read_sql(sql, conn, params=params + list(extra_params))
+
+# Arrow types for the clean table's declared SQLite column types
+SQL_ARROW_TYPES = {'TEXT': pa.string(), 'REAL': pa.float64(), 'INTEGER': pa.int64()}
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+def export_rows(conn, filters, out, fmt='csv', chunksize=50_000):
+    """
+    Write every column of the filtered rows to the binary file `out` as CSV
+    or Parquet, streaming the query chunksize rows at a time so memory stays
+    bounded whatever the result size. Returns the number of rows written.
+    """
+    clause, params = where(filters)
+    chunks = pd.read_sql(f"SELECT * FROM {CLEAN_TABLE} {clause}", conn, params=params,
+                         chunksize=chunksize)
+    rows = 0
+    if fmt == 'csv':
+        for i, chunk in enumerate(chunks):
+            out.write(chunk.to_csv(index=False, header=i == 0).encode('utf-8'))
+            rows += len(chunk)
+        return rows
+    
+    # One schema for every row group, from the declared column types, so
+    # a chunk where a column is all NULL can't change it
+    schema = pa.schema([
+        (name, SQL_ARROW_TYPES.get(sql_type.upper(), pa.string()))
+        for _, name, sql_type, *_ in conn.execute(f"PRAGMA table_info({CLEAN_TABLE})")
+    ])
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+def export_file(filters, fmt='csv', db_path=DB_PATH):
+    """
+    Filtered rows exported as the bytes of a CSV or Parquet file.
+    
+    Rows are streamed from SQLite into a named temporary file, which is
+    read back once complete: st.download_button takes bytes (or a few
+    file types), not the temporary file object. Opens its own connection;
+    the dashboard only calls this when "Prepare export" is clicked.
+    """
+    conn = connect(db_path)
+    try:
+        with tempfile.NamedTemporaryFile(suffix=f'.{fmt}') as out:
+            export_rows(conn, filters, out, fmt)
+            out.flush()
+            out.seek(0)
+            return out.read()
+    finally:
+        conn.close()
+
+TOP_VALUE_COLUMNS = ['title', 'brand', 'cpu', 'ram', 'price', 'quality_score', 'value_ratio',
+                     'price_percentile', 'link']
+
+def top_value(conn, filters, k=20, page=1, columns=TOP_VALUE_COLUMNS):
+    """
+    Page `page` (from 1) of the best value listings, k per page.
+    
+    SQLite walks idx_clean_value (or idx_clean_brand_value when a brand is
+    selected) in value_ratio order, checks the filters on the index
+    entries and stops after k matches, so no sort over the filtered set.
+    """
+    return fetch_rows(conn, filters, columns, order_by='value_ratio DESC',
+                      limit=k, offset=(page - 1) * k)
+
+def title_query(text):
+    """FTS5 query matching titles that contain every word of `text`"""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+def has_title_index(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TITLE_INDEX,)
+    ).fetchone() is not None
+
+def search_titles(conn, filters, text, k=50, columns=TOP_VALUE_COLUMNS):
+    """
+    Best value listings whose title contains every word of `text`, via
+    title_fts, or a LIKE scan of the titles when the index isn't built yet.
+    """
+    if has_title_index(conn):
+        return fetch_rows(conn, filters, columns,
+                          extra_where=f" AND rowid IN (SELECT rowid FROM {TITLE_INDEX} WHERE {TITLE_INDEX} MATCH ?)",
+                          extra_params=[title_query(text)], order_by='value_ratio DESC', limit=k)
+    words = text.split()
+    return fetch_rows(conn, filters, columns,
+                      extra_where="".join(" AND title LIKE ? ESCAPE '\\'" for _ in words),
+                      extra_params=["%" + re.sub(r'([%_\\])', r'\\\1', word) + "%" for word in words],
+                      order_by='value_ratio DESC', limit=k)
+
+def box_stats(q1, median, q3, low, high):
+    """Tukey box: whiskers at 1.5 IQR, clamped to the observed range"""
+    iqr = q3 - q1
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': max(low, q1 - 1.5 * iqr),
+        'upperfence': min(high, q3 + 1.5 * iqr),
+    }
+
+def brand_price_boxes(conn, filters, brands):
+    """Box plot statistics of price per brand, from the price sketches when they apply"""
+    boxes = []
+    if use_sketches(conn, filters):
+        for brand in brands:
+            brand_filters = filters._replace(brand=brand)
+            summary = overview(conn, brand_filters)
+            q1, median, q3 = sketch_quantiles(conn, brand_filters, [0.25, 0.5, 0.75])
+            boxes.append({'brand': brand, **box_stats(q1, median, q3,
+                                                      summary['min_price'], summary['max_price'])})
+        return pd.DataFrame(boxes)
+    
+    if not len(brands):
+        return pd.DataFrame(columns=['brand', 'q1', 'median', 'q3', 'lowerfence', 'upperfence'])
+    placeholders = ", ".join("?" for _ in brands)
+    prices = fetch_rows(conn, filters, ['brand', 'price'],
+                        extra_where=f" AND brand IN ({placeholders})", extra_params=list(brands))
+    for brand in brands:
+        price = prices.loc[prices['brand'] == brand, 'price']
+        q1, median, q3 = price.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        # Whiskers end on actual data points, as in px.box
+        low = price[price >= q1 - 1.5 * iqr].min()
+        high = price[price <= q3 + 1.5 * iqr].max()
+        boxes.append({'brand': brand, **box_stats(q1, median, q3, low, high)})
+    return pd.DataFrame(boxes)
+
+def scatter_mode(count):
+    """'svg', 'webgl' or 'density' rendering for a scatter of `count` points"""
+    if count > SCATTER_MAX_POINTS:
+        return 'density'
+    return 'webgl' if count > SCATTER_WEBGL_POINTS else 'svg'
+
+def sample_rows(conn, filters, columns, count, n=SCATTER_SAMPLE):
+    """About n of the `count` filtered rows, every k-th rowid: the same sample on every rerun"""
+    step = max(1, count // n)
+    return fetch_rows(conn, filters, columns, extra_where=" AND rowid % ? = 0", extra_params=[step])
+
+def density_grid(conn, snapshot, filters, x='price', y='quality_score', bins=DENSITY_BINS):
+    """
+    2D histogram of the filtered rows: (x bin edges, y bin edges, counts
+    shaped (x bins, y bins)). Only the two columns are read, from the
+    snapshot when it is loaded.
+    """
+    points = filtered_frame(conn, snapshot, filters, [x, y]).dropna()
+    counts, x_edges, y_edges = np.histogram2d(points[x], points[y], bins=bins)
+    return x_edges, y_edges, counts
+
+def snapshot_mtime(path=SNAPSHOT_PATH):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def snapshot_version(snapshot):
+    """data_version the snapshot was written at (None if unstamped)"""
+    version = (snapshot.schema.metadata or {}).get(SNAPSHOT_VERSION_KEY.encode())
+    return version.decode() if version is not None else None
+
+def load_snapshot(path=SNAPSHOT_PATH, version=None):
+    """
+    Memory-map the Arrow snapshot (zero-copy). None when there isn't one,
+    or when it was written at another data version than `version` (a
+    stale local file, or a clean whose snapshot write failed): the
+    dashboard then reads SQLite.
+    """
+    if not os.path.exists(path):
+        return None
+    snapshot = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    if snapshot_version(snapshot) != version:
+        return None
+    return snapshot
+
+def snapshot_filter(filters):
+    """Filters tuple as an Arrow compute expression"""
+    expression = ((pc.field('ram') >= filters.min_ram)
+                  & (pc.field('price') >= filters.price_min)
+                  & (pc.field('price') <= filters.price_max))
+    if filters.brand != 'All':
+        expression &= pc.field('brand') == filters.brand
+    if filters.cpu != 'All':
+        expression &= pc.field('cpu') == filters.cpu
+    if filters.hide_reposts:
+        expression &= pc.field('is_repost').is_null() | (pc.field('is_repost') == 0)
+    return expression
+
+def filtered_frame(conn, snapshot, filters, columns):
+    """Filtered rows for row-level widgets: from the snapshot when loaded, else SQLite"""
+    # Snapshots written before repost detection can't hide reposts
+    if snapshot is not None and (not filters.hide_reposts or 'is_repost' in snapshot.schema.names):
+        return snapshot.filter(snapshot_filter(filters)).select(columns).to_pandas()
+    return fetch_rows(conn, filters, columns)
@@ -0,0 +1,43 @@
+# scoring.py
+"""
+Quality scoring system:
+CPU: i3=30, i5=50, i7=70, i9=90, M1=60, M2=80, M3=100,
+     Ryzen-3=35, Ryzen-5=55, Ryzen-7=75, Ryzen-9=95
+     Ultra-5=55, Ultra-7=75, Ultra-9=95
+RAM: 4GB=20, 8GB=40, 16GB=70, 32GB=100, 64GB=120
+
+Unknown CPUs score 25 and unlisted RAM sizes score ram * 5.
+Value ratio: score per 1000 DH.
+
+The tables live in score_tables.json. SCORE_VERSION is a hash of them,
+stored next to each scored row so the cleaner can rescore when they change.
+"""
+import hashlib
+import json
+import os
+
+SCORE_TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'score_tables.json')
+
+def load_score_tables(path=SCORE_TABLES_PATH):
+    with open(path, encoding='utf-8') as f:
+        tables = json.load(f)
+    # JSON keys are strings, RAM is matched as an integer
+    tables['ram_scores'] = {int(k): v for k, v in tables['ram_scores'].items()}
+    return tables
+
+def score_version(tables):
+    canonical = json.dumps(tables, sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+SCORE_TABLES = load_score_tables()
+SCORE_VERSION = score_version(SCORE_TABLES)
+
+def score_frame(df, tables=SCORE_TABLES):
+    """Return (quality_score, value_ratio) Series for a frame with cpu, ram and price columns"""
+    cpu_score = df['cpu'].map(tables['cpu_scores']).fillna(tables['default_cpu_score'])
+    ram_score = df['ram'].map(tables['ram_scores']).fillna(df['ram'] * tables['ram_score_per_gb'])
+    quality_score = (cpu_score + ram_score).astype('float64')
+    
+    price = df['price'].astype('float64')
+    value_ratio = (quality_score / price.where(price > 0) * 1000).fillna(0.0)
+    return quality_score, value_ratio
@@ -2,16 +2,69 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import pandas as pd
-import time
+from selenium.webdriver.support.ui import WebDriverWait
+from selectolax.lexbor import LexborHTMLParser
+from urllib.parse import urljoin
+import urllib.request
+import argparse
 import datetime
+import os
+import shutil
 import sqlite3
-import random
+import tempfile
+import threading
+
+from metrics import EVENTS_PATH, RunMetrics
+from pipeline import run_pipeline
+
+BASE_URL = "https://www.avito.ma/fr/maroc/ordinateurs_portables"
+
+# Avito markup - update here when the site's generated class names change
+SELECTORS = {
+    "listing": "a.sc-1jge648-0.jZXrfL",
+    "title": "p.sc-1x0vz2r-0.iHApav",
+}
+PRICE_MARKER = "DH"
+
+# Politeness: at least this many seconds between page requests (token
+# bucket in pipeline.py), on average like the old 2.5-5s random sleep.
+# Kept apart from page load time, which the browser profile brings down.
+MIN_PAGE_INTERVAL = 3.75
+PAGE_RATE = 1 / MIN_PAGE_INTERVAL
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+PAGE_LOAD_TIMEOUT = 30
+# Seconds to wait for the listing cards once the page's HTML is parsed
+LISTING_WAIT = 15
+
+# Requests the throughput profile never sends (Network.setBlockedURLs
+# patterns): images, media, fonts and ad/analytics hosts. The listing
+# cards are in the page HTML and need none of them.
+BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.mp4", "*.webm", "*.m3u8", "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*content.avito.ma/*",
+    "*googletagmanager.com/*", "*google-analytics.com/*", "*doubleclick.net/*",
+    "*googlesyndication.com/*", "*facebook.net/*", "*criteo.com/*", "*criteo.net/*",
+    "*hotjar.com/*", "*tiktok.com/*",
+]
+
+RAW_DB = 'marketpulse_raw.db'
+PROD_DB = 'marketpulse.db'
+LISTING_COLUMNS = ("scrape_date", "title", "price", "link", "page")
+
+# Incremental mode stops after this many pages in a row without a new link
+STOP_AFTER_KNOWN_PAGES = 3
+
+# Fetch attempts per page within a run (first try + retries), and over all
+# runs before a failed page is no longer resumed
+PAGE_RETRIES = 2
+RETRY_BACKOFF = 5.0
+MAX_PAGE_ATTEMPTS = 6
 
 def init_db():
     """Create database with unique constraint on link"""
-    conn = sqlite3.connect('marketpulse_raw.db')
+    conn = sqlite3.connect(RAW_DB)
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS new_listings (
@@ -22,185 +75,517 @@ def init_db():
             page INTEGER
         )
     ''')
+    # The cleaner picks up refreshed rows by scrape_date
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_listings_scrape_date ON new_listings(scrape_date)")
+    # Page ledger: one row per page of each crawl (see PageLedger)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_pages (
+            crawl TEXT,
+            page INTEGER,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            listings INTEGER,
+            error TEXT,
+            created TEXT,
+            updated TEXT,
+            PRIMARY KEY (crawl, page)
+        )
+    ''')
     conn.commit()
     conn.close()
 
-def get_last_scraped_page():
-    """Resume from last successful page"""
-    try:
-        conn = sqlite3.connect('marketpulse_raw.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT MAX(page) FROM new_listings")
-        result = cursor.fetchone()[0]
-        conn.close()
-        return result if result else 0
-    except:
-        return 0
+def now_text():
+    return datetime.datetime.now().isoformat(timespec='seconds')
 
-def save_batch_to_db(data):
-    """Append new items without duplicates"""
-    if not data: 
-        return
+class PageLedger:
+    """
+    Status of every page of a crawl in the scrape_pages table.
     
-    conn = sqlite3.connect('marketpulse_raw.db')
-    df = pd.DataFrame(data)
+    A crawl starts with all its pages 'pending'. A page becomes 'done' in
+    the same transaction that stores its listings (see ListingWriter), so
+    a crash never loses a saved page nor keeps an unsaved one. Failed
+    attempts are counted; a page out of retries is 'failed'. Pages left
+    behind when the listings end (or incremental mode stops) are 'skipped'.
     
-    # Use 'append' instead of 'replace', ignore duplicates
-    try:
-        df.to_sql('new_listings', conn, if_exists='append', index=False)
-        print(f"✓ Saved {len(data)} new items")
-    except sqlite3.IntegrityError:
-        # Handle duplicates by inserting one by one
-        saved = 0
-        for _, row in df.iterrows():
-            try:
-                row.to_frame().T.to_sql('new_listings', conn, if_exists='append', index=False)
-                saved += 1
-            except sqlite3.IntegrityError:
-                continue  # Skip duplicate
-        print(f"✓ Saved {saved}/{len(data)} items (skipped duplicates)")
+    A crawl that still has pending or retryable failed pages is resumed by
+    the next run, which fetches exactly those pages.
+    """
     
-    conn.close()
+    def __init__(self, db_path=RAW_DB):
+        # Failures are recorded from the fetch/parse threads
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.crawl = None
+    
+    def open_crawl(self, start_page, end_page, resume=True):
+        """
+        Resume the latest crawl if it is unfinished, or start a new one over
+        start_page..end_page. Returns (pages to fetch, resumed). Only the
+        latest crawl is ever resumed, so starting a new one abandons the rest.
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute("""
+                SELECT crawl FROM scrape_pages
+                WHERE crawl = (SELECT MAX(crawl) FROM scrape_pages)
+                  AND (status = 'pending' OR (status = 'failed' AND attempts < ?))
+                LIMIT 1
+            """, (MAX_PAGE_ATTEMPTS,)).fetchone()
+            if resume and row is not None:
+                self.crawl = row[0]
+            else:
+                row = None
+                self.crawl = datetime.datetime.now().isoformat(timespec='microseconds')
+                self.conn.executemany(
+                    "INSERT INTO scrape_pages (crawl, page, created, updated) VALUES (?, ?, ?, ?)",
+                    ((self.crawl, page, self.crawl, self.crawl) for page in range(start_page, end_page + 1))
+                )
+            pages = [r[0] for r in self.conn.execute("""
+                SELECT page FROM scrape_pages
+                WHERE crawl = ? AND (status = 'pending' OR (status = 'failed' AND attempts < ?))
+                ORDER BY page
+            """, (self.crawl, MAX_PAGE_ATTEMPTS))]
+        return pages, row is not None
+    
+    def mark_done(self, conn, listings):
+        """Mark the pages of `listings` done, on the writer's connection and transaction"""
+        counts = {}
+        for item in listings:
+            counts[item["page"]] = counts.get(item["page"], 0) + 1
+        conn.executemany("""
+            UPDATE scrape_pages SET status = 'done', attempts = attempts + 1, listings = ?,
+                error = NULL, updated = ?
+            WHERE crawl = ? AND page = ?
+        """, ((n, now_text(), self.crawl, page) for page, n in counts.items()))
+    
+    def mark_failed(self, page, stage, error, attempt, final):
+        """pipeline on_failure callback: count the attempt, 'failed' once out of retries"""
+        with self.lock, self.conn:
+            self.conn.execute("""
+                UPDATE scrape_pages SET attempts = attempts + 1, error = ?, updated = ?,
+                    status = CASE WHEN ? THEN 'failed' ELSE status END
+                WHERE crawl = ? AND page = ?
+            """, (f"{stage}: {error}", now_text(), final, self.crawl, page))
+    
+    def skip_pending(self, from_page):
+        """The listings ended before from_page: nothing left to fetch from there on"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE scrape_pages SET status = 'skipped', updated = ? "
+                "WHERE crawl = ? AND status = 'pending' AND page >= ?",
+                (now_text(), self.crawl, from_page)
+            )
+    
+    def summary(self):
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM scrape_pages WHERE crawl = ? GROUP BY status", (self.crawl,)
+            ).fetchall())
+    
+    def close(self):
+        self.conn.close()
 
-def scrape_mass_avito(start_page=1, end_page=500, batch_size=10):
+def load_known_links():
+    """
+    Every link seen before: the raw table plus the clean table and price
+    history in the production DB, which survive runs where the raw DB
+    starts empty (CI).
+    """
+    known = set()
+    for db_path, query in ((RAW_DB, "SELECT link FROM new_listings"),
+                           (PROD_DB, "SELECT link FROM laptops_clean_new"),
+                           (PROD_DB, "SELECT link FROM listing_ids")):
+        if not os.path.exists(db_path):
+            continue
+        conn = sqlite3.connect(db_path)
+        try:
+            known.update(row[0] for row in conn.execute(query))
+        except sqlite3.OperationalError:
+            pass  # table not created yet
+        finally:
+            conn.close()
+    return known
+
+class NewLinkTracker:
+    """
+    Stop condition for incremental scrapes: counts the links on each page
+    that aren't in `known` and reports True after `patience` pages in a row
+    without any. Listings are newest first, so by then the rest is old.
     """
-    Scrape Avito with resume capability and duplicate handling
     
-    Args:
-        start_page: Starting page (default: 1)
-        end_page: Ending page (use 500 for ~15,000 items)
-        batch_size: Save progress every N pages
+    def __init__(self, known, patience=STOP_AFTER_KNOWN_PAGES):
+        self.known = known
+        self.patience = patience
+        self.streak = 0
+        self.new_links = 0
+    
+    def __call__(self, page, listings):
+        links = {item["link"] for item in listings}
+        new = links - self.known
+        self.known |= new
+        self.new_links += len(new)
+        self.streak = 0 if new else self.streak + 1
+        if self.streak >= self.patience:
+            print(f"\nNo new links on the last {self.streak} pages, stopping at page {page}")
+            return True
+        return False
+
+class ListingWriter:
     """
-    print(f"Launching Scraper (Pages {start_page} to {end_page})...")
+    Writes scraped listings to the raw DB over one connection kept open
+    for the whole run (WAL mode).
     
-    # Initialize database
-    init_db()
+    Each batch is a single transaction: new links are inserted, known
+    links get their price/scrape_date/page refreshed when they changed,
+    and identical rows are skipped. With a ledger, the batch's pages are
+    marked done in that same transaction.
+    """
+    
+    def __init__(self, db_path=RAW_DB, ledger=None):
+        # Created by the caller, then used only from the pipeline's writer thread
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.ledger = ledger
+        self.totals = {"inserted": 0, "updated": 0, "skipped": 0}
     
-    # Check for resume
-    last_page = get_last_scraped_page()
-    if last_page > 0:
-        resume = input(f"Found existing data up to page {last_page}. Resume from page {last_page + 1}? (y/n): ")
-        if resume.lower() == 'y':
-            start_page = last_page + 1
+    def _existing_links(self, links):
+        existing = set()
+        links = list(links)
+        for i in range(0, len(links), 500):
+            chunk = links[i:i + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self.conn.execute(
+                f"SELECT link FROM new_listings WHERE link IN ({placeholders})", chunk
+            )
+            existing.update(row[0] for row in rows)
+        return existing
     
-    # Setup Selenium
+    def write(self, listings):
+        """Upsert a batch of listing dicts, returns inserted/updated/skipped counts"""
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        if not listings:
+            return counts
+        
+        rows = [tuple(item[c] for c in LISTING_COLUMNS) for item in listings]
+        links = {row[3] for row in rows}
+        
+        with self.conn:
+            new_links = links - self._existing_links(links)
+            before = self.conn.total_changes
+            self.conn.executemany("""
+                INSERT INTO new_listings (scrape_date, title, price, link, page)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(link) DO UPDATE SET
+                    price = excluded.price,
+                    scrape_date = excluded.scrape_date,
+                    page = excluded.page
+                WHERE price IS NOT excluded.price
+                   OR scrape_date IS NOT excluded.scrape_date
+                   OR page IS NOT excluded.page
+            """, rows)
+            changed = self.conn.total_changes - before
+            if self.ledger is not None:
+                self.ledger.mark_done(self.conn, listings)
+        
+        counts["inserted"] = len(new_links)
+        counts["updated"] = changed - counts["inserted"]
+        counts["skipped"] = len(rows) - changed
+        for key, value in counts.items():
+            self.totals[key] += value
+        print(f"✓ Saved {counts['inserted']} new, refreshed {counts['updated']}, "
+              f"skipped {counts['skipped']} unchanged")
+        return counts
+    
+    def close(self):
+        self.conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def save_batch_to_db(data):
+    """Append new items without duplicates (one-off write, see ListingWriter)"""
+    with ListingWriter() as writer:
+        return writer.write(data)
+
+def parse_price(lines):
+    """First amount marked with DH among a card's text lines, 0.0 if none parses"""
+    for i, line in enumerate(lines):
+        if PRICE_MARKER not in line:
+            continue
+        # Amount and currency can be rendered as separate text nodes
+        if line.strip() == PRICE_MARKER and i > 0:
+            line = lines[i - 1] + line
+        try:
+            clean = (line.replace(PRICE_MARKER, "").replace(" ", "").replace("\u202f", "")
+                     .replace("\xa0", "").replace(",", "."))
+            return float(clean)
+        except ValueError:
+            continue
+    return 0.0
+
+def extract_listings(html, page, page_url=BASE_URL, scrape_date=None, selectors=SELECTORS):
+    """
+    Parse every listing card out of a results page's HTML.
+    
+    Pure function: no browser or network needed, so it can run on saved
+    pages. Returns the same dicts the scraper stores, skipping cards
+    without a title or a positive price.
+    """
+    scrape_date = scrape_date or str(datetime.date.today())
+    tree = LexborHTMLParser(html)
+    
+    listings = []
+    for card in tree.css(selectors["listing"]):
+        lines = [line for line in card.text(separator="\n", strip=True).split("\n") if line]
+        
+        title_node = card.css_first(selectors["title"])
+        if title_node is not None:
+            title = title_node.text(strip=True)
+        else:
+            title = lines[0] if lines else "Unknown"
+        
+        price = parse_price(lines)
+        href = card.attributes.get("href")
+        
+        if price > 0 and title != "Unknown" and href:
+            listings.append({
+                "scrape_date": scrape_date,
+                "title": title,
+                "price": price,
+                "link": urljoin(page_url, href),
+                "page": page
+            })
+    return listings
+
+def page_url(page, base_url=BASE_URL):
+    return base_url if page == 1 else f"{base_url}?o={page}"
+
+def fetch_http(url, timeout=30):
+    """Plain HTTP fetcher, for servers that don't need a browser (e.g. fixture pages)"""
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read().decode(response.headers.get_content_charset() or "utf-8")
+
+def create_driver(throughput=True, blocked_urls=BLOCKED_URLS, profile_dir=None, driver_path=None):
+    """
+    Chrome for scraping. The throughput profile runs headless, returns
+    from driver.get() as soon as the HTML is parsed (eager page load) and
+    blocks `blocked_urls`; fetch_browser then waits for the listing cards
+    explicitly. throughput=False is the full headed browser, for debugging.
+    profile_dir: Chrome user data directory (default: a fresh one per session)
+    driver_path: chromedriver to use (default: resolved by webdriver-manager)
+    """
     options = webdriver.ChromeOptions()
+    if profile_dir is not None:
+        options.add_argument(f"--user-data-dir={profile_dir}")
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
     
-    # Optional: Run headless for faster scraping
-    # options.add_argument("--headless")
+    if throughput:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1366,900")
+        options.page_load_strategy = 'eager'
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
     
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    driver.set_page_load_timeout(30)
+    driver = webdriver.Chrome(service=Service(driver_path or ChromeDriverManager().install()), options=options)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    if throughput:
+        # The headless user agent says HeadlessChrome: send the installed
+        # browser's own one as plain Chrome, so it never goes stale
+        user_agent = driver.execute_cdp_cmd("Browser.getVersion", {})["userAgent"]
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setUserAgentOverride",
+                               {"userAgent": user_agent.replace("HeadlessChrome/", "Chrome/")})
+        if blocked_urls:
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(blocked_urls)})
+    return driver
+
+def fetch_browser(driver, url, selector=SELECTORS["listing"], timeout=LISTING_WAIT):
+    """
+    Load `url` and return its HTML as soon as listing cards are in the DOM,
+    or once the page has finished loading without any (past the last
+    page). Raises selenium's TimeoutException after `timeout` seconds, which
+    the pipeline retries like any failed fetch.
+    """
+    driver.get(url)
+    WebDriverWait(driver, timeout).until(
+        lambda d: d.find_elements(By.CSS_SELECTOR, selector)
+        or d.execute_script("return document.readyState") == "complete"
+    )
+    return driver.page_source
+
+class BrowserFetcher:
+    """
+    One Chrome session with its own profile directory, as a pipeline fetch
+    callable. The browser starts on the first fetch, so the sessions of
+    several workers start in parallel, each in its worker's thread. The
+    chromedriver path is resolved once beforehand, so workers don't
+    download it concurrently into the same cache.
+    """
+    
+    def __init__(self, driver_path, throughput=True):
+        self.driver_path = driver_path
+        self.throughput = throughput
+        self.driver = None
+        self.profile_dir = None
     
-    base_url = "https://www.avito.ma/fr/maroc/ordinateurs_portables"
+    def __call__(self, url):
+        if self.driver is None:
+            self.profile_dir = tempfile.mkdtemp(prefix="marketpulse-chrome-")
+            self.driver = create_driver(self.throughput, profile_dir=self.profile_dir,
+                                        driver_path=self.driver_path)
+        return fetch_browser(self.driver, url)
     
-    batch_products = []
-    total_scraped = 0
-    failed_pages = []
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+        if self.profile_dir is not None:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
 
+def scrape_mass_avito(start_page=1, end_page=500, batch_size=10, base_url=BASE_URL,
+                      use_browser=True, rate=PAGE_RATE, events_path=EVENTS_PATH,
+                      prometheus_path=None, incremental=False,
+                      stop_after=STOP_AFTER_KNOWN_PAGES, headed=False, workers=1):
+    """
+    Scrape Avito with resume capability and duplicate handling
+    
+    Fetching, parsing and DB writes run as concurrent pipeline stages
+    (see pipeline.py). `workers` browser sessions fetch pages in parallel,
+    each capped by its own token bucket, and all results go through the
+    single writer. Failed fetches are retried with exponential backoff.
+    Workers share the pages of one category (base_url): the raw table, the
+    page ledger and the cleaner are laptop-specific, so other categories
+    would first need a category column there.
+    
+    Every page is tracked in the scrape_pages ledger: if the last crawl
+    didn't finish (crash, failed pages), this run resumes it and fetches
+    only its missing pages, ignoring start_page/end_page.
+    
+    Args:
+        start_page: Starting page (default: 1)
+        end_page: Ending page (use 500 for ~15,000 items)
+        batch_size: Save progress every N pages
+        base_url: Listing URL, page N is fetched as base_url?o=N
+        use_browser: Fetch through Chrome; False uses plain HTTP (local fixtures)
+        rate: Maximum pages fetched per second by each worker
+            (1 / minimum seconds between its requests)
+        events_path: JSON lines file for per-page/per-stage events (None: off)
+        prometheus_path: also write the run totals as a Prometheus textfile
+        incremental: always start a new crawl (an unfinished one is abandoned),
+            and stop after `stop_after` pages in a row with no link we don't
+            already know; known links met on the way still get their price
+            refreshed
+        headed: full headed Chrome instead of the headless throughput profile
+        workers: Number of parallel fetch workers (browser sessions)
+    
+    The run summary is appended to the scrape_runs table of marketpulse.db.
+    """
+    # Initialize database
+    init_db()
+    
+    # Resume the last crawl's missing pages, or start a new crawl
+    ledger = PageLedger()
+    pages, resumed = ledger.open_crawl(start_page, end_page, resume=not incremental)
+    if resumed:
+        print(f"Resuming crawl {ledger.crawl}: {len(pages)} pages left "
+              f"({', '.join(map(str, pages[:10]))}{'...' if len(pages) > 10 else ''})")
+    else:
+        print(f"Launching Scraper (Pages {start_page} to {end_page})...")
+    
+    if use_browser:
+        driver_path = ChromeDriverManager().install()
+        fetchers = [BrowserFetcher(driver_path, throughput=not headed) for _ in range(workers)]
+    else:
+        fetchers = [fetch_http] * workers
+    
+    tracker = None
+    if incremental:
+        tracker = NewLinkTracker(load_known_links(), stop_after)
+        print(f"Incremental mode: {len(tracker.known)} known links")
+    
+    writer = ListingWriter(ledger=ledger)
+    metrics = RunMetrics(events_path, prometheus_path)
     try:
-        for page in range(start_page, end_page + 1):
-            try:
-                print(f"Page {page}/{end_page} | Total: {total_scraped} items", end="\r")
-                
-                url = base_url if page == 1 else f"{base_url}?o={page}"
-                driver.get(url)
-                
-                # Random human-like delay
-                time.sleep(random.uniform(2.5, 5))
-                
-                # Check if page loaded correctly
-                items = driver.find_elements(By.CSS_SELECTOR, "a.sc-1jge648-0.jZXrfL")
-                
-                if not items:
-                    print(f"\nNo items found on page {page} - might be end of listings")
-                    break
-                
-                page_count = 0
-                for item in items:
-                    try:
-                        link = item.get_attribute("href")
-                        
-                        # Title extraction
-                        try: 
-                            title = item.find_element(By.CSS_SELECTOR, "p.sc-1x0vz2r-0.iHApav").text
-                        except: 
-                            title = item.text.split('\n')[0] if item.text else "Unknown"
-
-                        # Price extraction
-                        price = 0.0
-                        for line in item.text.split('\n'):
-                            if "DH" in line:
-                                try:
-                                    clean = line.replace("DH", "").replace(" ", "").replace("\u202f", "").replace(",", ".")
-                                    price = float(clean)
-                                    break
-                                except: 
-                                    continue
-                        
-                        if price > 0 and title != "Unknown":
-                            batch_products.append({
-                                "scrape_date": str(datetime.date.today()),
-                                "title": title,
-                                "price": price,
-                                "link": link,
-                                "page": page
-                            })
-                            page_count += 1
-                            
-                    except Exception as e:
-                        continue
-                
-                total_scraped += page_count
-                
-                # Save batch progress
-                if page % batch_size == 0:
-                    print(f"\nCheckpoint at page {page}...")
-                    save_batch_to_db(batch_products)
-                    batch_products = []
-                
-                # Longer pause every 50 pages to avoid detection
-                if page % 50 == 0:
-                    pause = random.uniform(10, 20)
-                    print(f"\nTaking a {pause:.1f}s break...")
-                    time.sleep(pause)
-                    
-            except TimeoutException:
-                print(f"\nTimeout on page {page}")
-                failed_pages.append(page)
-                continue
-            except Exception as e:
-                print(f"\nError on page {page}: {e}")
-                failed_pages.append(page)
-                continue
-
-    except KeyboardInterrupt:
-        print("\n\nScraping stopped by user")
+        stats = run_pipeline(
+            pages,
+            page_url=lambda page: page_url(page, base_url),
+            fetch=fetchers,
+            parse=extract_listings,
+            write=writer.write,
+            rate=rate,
+            batch_size=batch_size,
+            metrics=metrics,
+            until=tracker,
+            retries=PAGE_RETRIES,
+            backoff=RETRY_BACKOFF,
+            on_failure=ledger.mark_failed,
+        )
+        if stats['stop_page'] is not None:
+            ledger.skip_pending(stats['stop_page'])
+        page_status = ledger.summary()
     finally:
-        # Save remaining items
-        if batch_products:
-            print(f"\nSaving final batch...")
-            save_batch_to_db(batch_products)
-        
-        driver.quit()
-        
-        # Final report
-        print(f"\n{'='*50}")
-        print(f"Scraping Complete!")
-        print(f"Total items scraped: {total_scraped}")
-        if failed_pages:
-            print(f"Failed pages: {failed_pages}")
-        print(f"{'='*50}")
-        
-        # Show database stats
-        conn = sqlite3.connect('marketpulse_raw.db')
-        count = pd.read_sql("SELECT COUNT(*) as total FROM new_listings", conn)
-        conn.close()
-        print(f"Total in database: {count['total'][0]} items")
+        writer.close()
+        ledger.close()
+        for fetcher in fetchers:
+            if isinstance(fetcher, BrowserFetcher):
+                fetcher.close()
+    
+    # Final report
+    print(f"\n{'='*50}")
+    print(f"Scraping Complete!")
+    print(f"Total items scraped: {stats['listings']}")
+    if tracker is not None:
+        print(f"New links: {tracker.new_links} | Stopped after page {stats['last_page']}")
+    print(f"New: {writer.totals['inserted']} | Refreshed: {writer.totals['updated']} | "
+          f"Unchanged: {writer.totals['skipped']}")
+    if stats['failed_pages']:
+        print(f"Failed pages: {sorted(stats['failed_pages'])} (retried on the next run)")
+    print("Crawl pages: " + " | ".join(f"{status}: {n}" for status, n in sorted(page_status.items())))
+    print(f"Elapsed: {stats['elapsed']:.1f}s | "
+          f"{stats['pages_per_sec']:.2f} pages/s | {stats['listings_per_sec']:.1f} listings/s")
+    metrics.print_summary()
+    print(f"{'='*50}")
+    
+    metrics.event("run", **metrics.summary())
+    metrics.write_prometheus()
+    metrics.save()
+    metrics.close()
+    
+    # Show database stats
+    conn = sqlite3.connect(RAW_DB)
+    count = conn.execute("SELECT COUNT(*) FROM new_listings").fetchone()[0]
+    conn.close()
+    print(f"Total in database: {count} items")
+    return stats
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Avito laptop listings into marketpulse_raw.db")
+    parser.add_argument('--events', default=EVENTS_PATH,
+                        help=f"JSON lines file for run events (default {EVENTS_PATH})")
+    parser.add_argument('--prometheus', help="also write run metrics to this Prometheus textfile")
+    parser.add_argument('--incremental', action='store_true',
+                        help="stop once pages only hold links already in the database")
+    parser.add_argument('--stop-after', type=int, default=STOP_AFTER_KNOWN_PAGES,
+                        help=f"incremental mode: pages in a row without a new link before stopping "
+                             f"(default {STOP_AFTER_KNOWN_PAGES})")
+    parser.add_argument('--min-interval', type=float, default=MIN_PAGE_INTERVAL,
+                        help=f"politeness: minimum seconds between page requests of each worker "
+                             f"(default {MIN_PAGE_INTERVAL})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="parallel browser sessions fetching pages (default 1)")
+    parser.add_argument('--headed', action='store_true',
+                        help="run a visible Chrome with every resource loaded instead of the headless profile")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
     # Scrape all ~15,000 items (approximately 430 pages)
-    scrape_mass_avito(start_page=1, end_page=500, batch_size=10)
\ No newline at end of file
+    scrape_mass_avito(start_page=1, end_page=500, batch_size=10,
+                      rate=1 / args.min_interval, events_path=args.events,
+                      prometheus_path=args.prometheus, incremental=args.incremental,
+                      stop_after=args.stop_after, headed=args.headed, workers=args.workers)
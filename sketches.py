@@ -0,0 +1,108 @@
+# sketches.py
+"""
+Mergeable price quantile sketches (t-digest).
+
+A PriceDigest summarizes a set of prices as a few dozen weighted
+centroids: small near the extremes, larger around the median, sized by
+the k1 scale function so quantile error stays low in the tails. Digests
+of several segments merge into one, so the dashboard can answer the
+median of any brand/cpu/ram selection from per-segment digests, and a
+price's percentile within its segment is one interpolation over the
+centroids.
+
+The cleaner keeps one digest per brand x cpu x ram cell in the
+price_sketches table and folds each run's new listings into it.
+"""
+import numpy as np
+
+# Upper bound on the number of centroids is about COMPRESSION / 2
+COMPRESSION = 200
+
+def _k(q, compression):
+    """k1 scale function: centroids span at most one k unit"""
+    return compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+
+def compress(means, weights, compression=COMPRESSION):
+    """Merge weighted points into centroids, sorted by mean"""
+    order = np.argsort(means, kind='stable')
+    means, weights = means[order], weights[order]
+    cumulative = np.cumsum(weights)
+    q_mid = (cumulative - weights / 2) / cumulative[-1]
+    group = np.floor(_k(q_mid, compression) - _k(0.0, compression)).astype('int64')
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    merged_weights = np.add.reduceat(weights, starts)
+    merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+    return merged_means, merged_weights
+
+class PriceDigest:
+    """t-digest of prices: centroid means and weights plus the exact min/max"""
+    
+    def __init__(self, means=(), weights=(), low=np.inf, high=-np.inf):
+        self.means = np.asarray(means, dtype='float64')
+        self.weights = np.asarray(weights, dtype='float64')
+        self.low = float(low)
+        self.high = float(high)
+    
+    @classmethod
+    def from_values(cls, values):
+        digest = cls()
+        digest.add(values)
+        return digest
+    
+    @property
+    def count(self):
+        return int(round(self.weights.sum()))
+    
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        if not len(values):
+            return self
+        self._absorb(values, np.ones(len(values)), values.min(), values.max())
+        return self
+    
+    def merge(self, other):
+        if len(other.means):
+            self._absorb(other.means, other.weights, other.low, other.high)
+        return self
+    
+    def _absorb(self, means, weights, low, high):
+        self.means, self.weights = compress(np.r_[self.means, means], np.r_[self.weights, weights])
+        self.low = min(self.low, low)
+        self.high = max(self.high, high)
+    
+    def _curve(self):
+        """(quantile, price) points the estimates interpolate between"""
+        cumulative = np.cumsum(self.weights)
+        q_mid = (cumulative - self.weights / 2) / cumulative[-1]
+        return np.r_[0.0, q_mid, 1.0], np.r_[self.low, self.means, self.high]
+    
+    def quantile(self, qs):
+        """Estimated prices at quantiles `qs` (NaN for an empty digest)"""
+        if not len(self.means):
+            return np.full(np.shape(qs), np.nan)
+        q, price = self._curve()
+        return np.interp(qs, q, price)
+    
+    def cdf(self, prices):
+        """Estimated share of prices at or below each of `prices`"""
+        if not len(self.means):
+            return np.full(np.shape(prices), np.nan)
+        q, price = self._curve()
+        return np.interp(np.asarray(prices, dtype='float64'), price, q)
+    
+    def to_bytes(self):
+        return np.stack([self.means, self.weights]).tobytes()
+    
+    @classmethod
+    def from_bytes(cls, blob, low, high):
+        means, weights = np.frombuffer(blob, dtype='float64').reshape(2, -1)
+        return cls(means, weights, low, high)
+
+def merge_all(digests):
+    """One digest for several, compressing all their centroids in one pass"""
+    digests = [d for d in digests if len(d.means)]
+    if not digests:
+        return PriceDigest()
+    means, weights = compress(np.concatenate([d.means for d in digests]),
+                              np.concatenate([d.weights for d in digests]))
+    return PriceDigest(means, weights, min(d.low for d in digests), max(d.high for d in digests))
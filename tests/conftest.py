@@ -0,0 +1,17 @@
+# tests/conftest.py
+"""Shared fixtures. The modules under test live at the repository root."""
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def clean_db(tmp_path):
+    """Copy of the shipped marketpulse.db, safe to modify"""
+    path = tmp_path / 'marketpulse.db'
+    shutil.copy(os.path.join(ROOT, 'marketpulse.db'), path)
+    return str(path)
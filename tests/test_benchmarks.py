@@ -0,0 +1,24 @@
+# tests/test_benchmarks.py
+"""The benchmark suite at a tiny size, so it keeps running end to end."""
+import json
+import subprocess
+import sys
+
+from conftest import ROOT
+
+def run_all(*args):
+    return subprocess.run([sys.executable, '-m', 'benchmarks.run_all', '--rows', '2000', *args],
+                          cwd=ROOT, capture_output=True, text=True, timeout=300)
+
+def test_run_all_saves_and_compares(tmp_path):
+    output = str(tmp_path / 'results.json')
+    saved = run_all('--output', output)
+    assert saved.returncode == 0, saved.stderr
+    with open(output) as f:
+        results = json.load(f)['results']
+    assert {'cleaner_run_full_chunked', 'build_aggregates', 'dashboard_queries_filtered'} <= set(results)
+    
+    # A huge tolerance: only the compare flow is under test, not the timings
+    compared = run_all('--compare', output, '--tolerance', '1000')
+    assert compared.returncode == 0, compared.stderr
+    assert 'REGRESSION' not in compared.stdout
@@ -0,0 +1,100 @@
+# tests/test_cleaner.py
+"""cleaner.run over synthetic raw listings, in a temporary working directory."""
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import cleaner
+import scraper
+from benchmarks.synthetic import generate_listings
+from queries import AGG_CELLS, PRICE_SKETCHES
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # cleaner and scraper use DB paths relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def add_raw(listings):
+    scraper.init_db()
+    conn = sqlite3.connect(scraper.RAW_DB)
+    listings.to_sql('new_listings', conn, if_exists='append', index=False)
+    conn.commit()
+    conn.close()
+
+def read_table(name, order_by):
+    conn = sqlite3.connect(cleaner.PROD_DB)
+    frame = pd.read_sql(f"SELECT * FROM {name} ORDER BY {order_by}", conn)
+    conn.close()
+    return frame
+
+def test_chunked_pool_run_matches_single_process(workdir, monkeypatch):
+    # Several chunks in every stage that streams the clean table
+    monkeypatch.setattr(cleaner, 'STAGE_CHUNKSIZE', 700)
+    listings = generate_listings(3000, seed=5)
+    outputs = []
+    for name, kwargs in (('single', {}), ('chunked', {'chunksize': 400, 'workers': 2})):
+        os.mkdir(name)
+        os.chdir(name)
+        add_raw(listings)
+        cleaner.run(full=True, events_path=None, **kwargs)
+        outputs.append([read_table(cleaner.CLEAN_TABLE, 'link'),
+                        read_table(PRICE_SKETCHES, 'brand, cpu, ram'),
+                        read_table(AGG_CELLS, 'brand, cpu, ram')])
+        os.chdir(workdir)
+    
+    single, chunked = outputs
+    assert len(single[0]) > 2000
+    assert single[0]['cluster_id'].nunique() < len(single[0])
+    for expected, actual in zip(single, chunked):
+        pd.testing.assert_frame_equal(actual, expected)
+
+def test_incremental_run_parses_new_rows_and_upserts_changes(workdir, monkeypatch):
+    first = generate_listings(600, seed=11, start_date='2025-11-01', days=30)
+    scraper.init_db()
+    scraper.save_batch_to_db(first.to_dict('records'))
+    cleaner.run(events_path=None)
+    before = read_table(cleaner.CLEAN_TABLE, 'link').set_index('link')
+    
+    # A day later: new listings, two price changes and one placeholder price
+    new = generate_listings(50, seed=12, start_date='2025-12-01', days=1)
+    new['link'] = new['link'].str.replace('annonce_', 'annonce_new_')
+    changed, dropped = list(before.index[:2]), before.index[2]
+    refreshed = first[first['link'].isin(changed + [dropped])].assign(scrape_date='2025-12-01')
+    refreshed['price'] = [1.0 if link == dropped else price + 1000
+                          for link, price in zip(refreshed['link'], refreshed['price'])]
+    scraper.save_batch_to_db(pd.concat([new, refreshed]).to_dict('records'))
+    
+    parsed = []
+    clean_frame = cleaner.clean_frame
+    def recording_clean_frame(df, *args, **kwargs):
+        parsed.extend(df['link'])
+        return clean_frame(df, *args, **kwargs)
+    monkeypatch.setattr(cleaner, 'clean_frame', recording_clean_frame)
+    cleaner.run(events_path=None)
+    
+    # Only rows added or refreshed since the first run, plus those scraped on
+    # its last day (the scraper may have added more of them after it)
+    last_day = first['link'][first['scrape_date'] == first['scrape_date'].max()]
+    assert sorted(parsed) == sorted(set(new['link']) | set(refreshed['link']) | set(last_day))
+    assert len(parsed) < len(first)
+    
+    after = read_table(cleaner.CLEAN_TABLE, 'link').set_index('link')
+    assert dropped not in after.index
+    for link in changed:
+        assert after.loc[link, 'price'] == before.loc[link, 'price'] + 1000
+        assert after.loc[link, 'value_ratio'] < before.loc[link, 'value_ratio']
+    added = set(after.index) - set(before.index)
+    assert added and added <= set(new['link'])
+    assert len(after) == len(before) - 1 + len(added)
+    unchanged = before.index.difference(changed + [dropped])
+    kept = ['title', 'price', 'quality_score', 'scrape_date', 'cluster_id']
+    pd.testing.assert_frame_equal(after.loc[unchanged, kept], before.loc[unchanged, kept])
+    
+    # The repost bucket index is rebuilt each run, never stored in the DB file
+    conn = sqlite3.connect(cleaner.PROD_DB)
+    assert not cleaner.table_exists(conn, 'lsh_buckets')
+    assert not cleaner.table_exists(conn, 'cluster_signatures')
+    conn.close()
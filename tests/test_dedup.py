@@ -0,0 +1,39 @@
+# tests/test_dedup.py
+import sqlite3
+
+import pandas as pd
+
+from benchmarks.bench_dedup import synthetic_titles
+from dedup import cluster_listings, drop_stored_index, index_clusters
+
+def test_rebuilt_index_matches_like_the_live_one():
+    rows = synthetic_titles(2500, seed=3)
+    first = rows.iloc[:2000]
+    # New listings, and reposts of the first batch with the case changed
+    reposts = first.iloc[::4].assign(title=first['title'].iloc[::4].str.upper())
+    second = pd.concat([rows.iloc[2000:], reposts], ignore_index=True)
+    
+    conn = sqlite3.connect(':memory:')
+    first_ids = cluster_listings(conn, first)
+    live = cluster_listings(conn, second)
+    conn.close()
+    
+    # A later run only has the cluster ids stored in the clean table
+    conn = sqlite3.connect(':memory:')
+    index_clusters(conn, first.assign(cluster_id=first_ids))
+    rebuilt = cluster_listings(conn, second)
+    conn.close()
+    
+    assert live.isin(first_ids).sum() >= len(reposts)
+    pd.testing.assert_series_equal(rebuilt, live)
+
+def test_stored_index_is_dropped(clean_db):
+    conn = sqlite3.connect(clean_db)
+    conn.execute("CREATE TABLE lsh_buckets (band INTEGER, bucket INTEGER, cluster_id INTEGER)")
+    conn.execute("CREATE TABLE cluster_signatures (cluster_id INTEGER PRIMARY KEY, signature BLOB)")
+    conn.commit()
+    assert drop_stored_index(conn)
+    assert not drop_stored_index(conn)
+    names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master")]
+    conn.close()
+    assert 'lsh_buckets' not in names and 'cluster_signatures' not in names
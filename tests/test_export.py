@@ -0,0 +1,50 @@
+# tests/test_export.py
+import io
+import os
+
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+from streamlit.testing.v1 import AppTest
+
+import queries
+from conftest import ROOT
+
+ALL = queries.Filters('All', 0, 10**9, 0, 'All')
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_export_file_goes_through_download_button_conversion(clean_db, fmt):
+    # What st.download_button does with the prepared export
+    data, _ = convert_data_to_bytes_and_infer_mime(
+        queries.export_file(ALL, fmt, db_path=clean_db), RuntimeError("unsupported")
+    )
+    
+    conn = queries.connect(clean_db)
+    expected = pd.read_sql(f"SELECT * FROM {queries.CLEAN_TABLE}", conn)
+    conn.close()
+    read = pd.read_csv if fmt == 'csv' else pd.read_parquet
+    exported = read(io.BytesIO(data))
+    assert len(exported) == len(expected)
+    assert list(exported.columns) == list(expected.columns)
+
+def test_export_file_applies_filters(clean_db):
+    filters = ALL._replace(brand='Dell', min_ram=16)
+    exported = pd.read_csv(io.BytesIO(queries.export_file(filters, 'csv', db_path=clean_db)))
+    assert len(exported) > 0
+    assert set(exported['brand']) == {'Dell'}
+    assert exported['ram'].min() >= 16
+
+def test_dashboard_offers_download_once_prepared(clean_db, tmp_path, monkeypatch):
+    # The dashboard reads marketpulse.db from the working directory
+    monkeypatch.chdir(tmp_path)
+    at = AppTest.from_file(os.path.join(ROOT, 'dashboard.py'), default_timeout=120).run()
+    assert not at.exception
+    assert not at.get('download_button')
+    
+    next(b for b in at.button if b.label == "Prepare CSV export").click().run()
+    assert not at.exception
+    assert [b.label for b in at.get('download_button')] == ["Download filtered data as CSV"]
+    
+    # A prepared file isn't offered for another format
+    next(r for r in at.radio if r.label == "Format").set_value("Parquet").run()
+    assert not at.get('download_button')
@@ -0,0 +1,86 @@
+# tests/test_extract.py
+"""
+extract_listings against saved results pages, field by field.
+
+The synthetic fixtures spell out Avito's class names (benchmarks/synthetic.py)
+instead of reusing scraper.SELECTORS. Pages captured from avito.ma with
+benchmarks/capture_page.py go in benchmarks/fixtures/real, next to the
+JSON of their expected fields.
+"""
+import glob
+import json
+import os
+
+import pytest
+
+import scraper
+from benchmarks.capture_page import REAL_FIXTURES_DIR, trim
+from benchmarks.synthetic import LISTING_CLASS, TITLE_CLASS, generate_listings, load_fixture_pages
+
+FIELDS = ['title', 'price', 'link', 'page']
+
+def card(title=None, amount='4 500', href='/fr/rabat/ordinateurs_portables/annonce_1.htm', currency='DH'):
+    title_html = f'<p class="{TITLE_CLASS}">{title}</p>' if title is not None else ''
+    price_html = f'<div><span dir="auto">{amount}</span><span>{currency}</span></div>' if amount else ''
+    return (f'<a class="{LISTING_CLASS}" href="{href}"><div><p>Ordinateurs portables</p>'
+            f'{title_html}{price_html}<span>Particulier</span></div></a>')
+
+def test_synthetic_pages_give_back_every_generated_field():
+    # write_fixture_pages() renders generate_listings(3 pages, seed=7)
+    pages = load_fixture_pages()
+    expected = generate_listings(len(pages) * 35, seed=7)
+    for page, html in pages.items():
+        listings = scraper.extract_listings(html, page)
+        rows = expected[expected['page'] == page]
+        assert [[item[f] for f in FIELDS] for item in listings] == rows[FIELDS].values.tolist()
+
+@pytest.mark.parametrize('amount, price', [
+    ('4 500', 4500.0),
+    ('12 000', 12000.0),
+    ('7\xa0990', 7990.0),
+    ('850', 850.0),
+])
+def test_price_formats(amount, price):
+    listings = scraper.extract_listings(card('HP EliteBook 840 i5 8go', amount), 1)
+    assert [item['price'] for item in listings] == [price]
+
+def test_cards_without_title_or_price_are_skipped():
+    html = "".join([
+        card('Dell Latitude 5420 i7 16go', '6 000'),
+        card('Lenovo ThinkPad prix à discuter', amount=None),
+        card('Chargeur', '0'),
+        card(None, None),
+    ])
+    listings = scraper.extract_listings(html, 4, page_url=scraper.page_url(4))
+    assert [{f: item[f] for f in FIELDS} for item in listings] == [{
+        'title': 'Dell Latitude 5420 i7 16go',
+        'price': 6000.0,
+        'link': 'https://www.avito.ma/fr/rabat/ordinateurs_portables/annonce_1.htm',
+        'page': 4,
+    }]
+
+def test_selector_change_breaks_extraction():
+    page = load_fixture_pages()[1]
+    selectors = {**scraper.SELECTORS, 'listing': 'a.sc-renamed'}
+    assert scraper.extract_listings(page, 1, selectors=selectors) == []
+
+def test_capture_trim_keeps_the_first_cards_only():
+    page = load_fixture_pages()[1]
+    html = trim(page.replace('Particulier', 'Boutique Info 06 61 23 45 67'), cards=5,
+                redact=['Boutique Info'])
+    assert '<script' not in html and 'content.avito.ma' not in html
+    assert '06 61' not in html and 'Boutique' not in html
+    assert scraper.extract_listings(html, 1) == scraper.extract_listings(page, 1)[:5]
+
+REAL_PAGES = sorted(glob.glob(os.path.join(REAL_FIXTURES_DIR, '*.html')))
+
+@pytest.mark.skipif(not REAL_PAGES, reason="no avito.ma capture in benchmarks/fixtures/real "
+                                           "(python -m benchmarks.capture_page)")
+@pytest.mark.parametrize('path', REAL_PAGES, ids=os.path.basename)
+def test_captured_avito_pages(path):
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+    with open(path[:-len('.html')] + '.json', encoding='utf-8') as f:
+        expected = json.load(f)
+    listings = scraper.extract_listings(html, expected['page'])
+    assert [{k: item[k] for k in ('title', 'price', 'link')} for item in listings] == expected['listings']
@@ -0,0 +1,75 @@
+# tests/test_history.py
+import datetime
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from history import price_trajectory, record_observations, weekly_median_price
+
+DELL_A = 'https://www.avito.ma/fr/rabat/ordinateurs_portables/a.htm'
+DELL_C = 'https://www.avito.ma/fr/fes/ordinateurs_portables/c.htm'
+HP_B = 'https://www.avito.ma/fr/casablanca/ordinateurs_portables/b.htm'
+
+def observe(conn, *rows):
+    return record_observations(conn, pd.DataFrame(rows, columns=['link', 'scrape_date', 'price', 'brand']))
+
+def price_rows(conn, link):
+    return conn.execute("""
+        SELECT c.day, c.price_delta FROM price_changes c JOIN listing_ids i ON i.link_id = c.link_id
+        WHERE i.link = ? ORDER BY c.day
+    """, (link,)).fetchall()
+
+def day(text):
+    return (datetime.date.fromisoformat(text) - datetime.date(1970, 1, 1)).days
+
+@pytest.fixture
+def conn():
+    # Monday 2025-12-01: A and C (Dell), B (HP). A is still listed a week
+    # later at a lower price, B drops twice on Tuesday
+    conn = sqlite3.connect(':memory:')
+    assert observe(conn, (DELL_A, '2025-12-01', 5000.0, 'Dell'), (HP_B, '2025-12-01', 3000.0, 'HP'),
+                   (DELL_C, '2025-12-01', 6000.0, 'Dell')) == 3
+    assert observe(conn, (DELL_A, '2025-12-02', 5000.0, 'Dell'), (HP_B, '2025-12-02', 2800.0, 'HP')) == 1
+    assert observe(conn, (HP_B, '2025-12-02', 2700.0, 'HP')) == 1
+    assert observe(conn, (DELL_A, '2025-12-09', 4500.0, 'Dell')) == 1
+    yield conn
+    conn.close()
+
+def test_unchanged_prices_write_no_rows(conn):
+    # A was seen again at 5000 on the 2nd: only its last_seen moved
+    assert price_rows(conn, DELL_A) == [(day('2025-12-01'), 5000.0), (day('2025-12-09'), -500.0)]
+    assert observe(conn, (DELL_A, '2025-12-09', 4500.0, 'Dell')) == 0
+    assert price_rows(conn, DELL_A)[-1] == (day('2025-12-09'), -500.0)
+
+def test_price_changes_are_deltas_amended_within_a_day(conn):
+    # 3000 -> 2800 -> 2700 on the same day: one delta row of -300
+    assert price_rows(conn, HP_B) == [(day('2025-12-01'), 3000.0), (day('2025-12-02'), -300.0)]
+    last_price, last_change = conn.execute(
+        "SELECT last_price, last_change FROM listing_ids WHERE link = ?", (HP_B,)).fetchone()
+    assert (last_price, last_change) == (2700.0, day('2025-12-02'))
+
+def test_observations_older_than_last_seen_are_ignored(conn):
+    assert observe(conn, (DELL_A, '2025-11-30', 9999.0, 'Dell')) == 0
+    assert len(price_rows(conn, DELL_A)) == 2
+
+def test_price_trajectory_decodes_absolute_prices(conn):
+    trajectory = price_trajectory(conn, DELL_A)
+    assert trajectory['first_seen'] == datetime.date(2025, 12, 1)
+    assert trajectory['last_seen'] == datetime.date(2025, 12, 9)
+    assert trajectory['changes'].values.tolist() == [
+        [datetime.date(2025, 12, 1), 5000.0], [datetime.date(2025, 12, 9), 4500.0]]
+    assert price_trajectory(conn, HP_B)['changes']['price'].tolist() == [3000.0, 2700.0]
+    assert price_trajectory(conn, 'https://www.avito.ma/unknown.htm') is None
+
+def test_weekly_median_price(conn):
+    weekly = weekly_median_price(conn)
+    rows = sorted(weekly[['brand', 'week', 'median_price', 'listings']].itertuples(index=False, name=None))
+    assert rows == [
+        # A at 5000 and C at 6000; A drops to 4500 in the second week
+        ('Dell', datetime.date(2025, 12, 1), 5500.0, 2),
+        ('Dell', datetime.date(2025, 12, 8), 4500.0, 1),
+        # B counts once in its week, at its latest price
+        ('HP', datetime.date(2025, 12, 1), 2700.0, 1),
+    ]
+    assert set(weekly_median_price(conn, 'HP')['brand']) == {'HP'}
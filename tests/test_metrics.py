@@ -0,0 +1,42 @@
+# tests/test_metrics.py
+import json
+import os
+import sqlite3
+
+import cleaner
+import metrics
+from benchmarks.synthetic import generate_listings
+
+def test_events_file_is_rotated_past_the_cap(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    with open(path, 'w') as f:
+        f.write('x' * 100)
+    
+    metrics.open_events(path, max_bytes=1000).close()
+    assert os.path.getsize(path) == 100
+    events = metrics.open_events(path, max_bytes=50)
+    events.close()
+    assert os.path.getsize(path) == 0
+    assert os.path.getsize(path + '.1') == 100
+
+def test_clean_run_is_recorded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect(cleaner.RAW_DB)
+    generate_listings(500, seed=3).to_sql('new_listings', conn, index=False)
+    conn.close()
+    
+    cleaner.run(events_path='events.jsonl')
+    
+    conn = sqlite3.connect(cleaner.PROD_DB)
+    raw_rows, cleaned, rejected = conn.execute("SELECT raw_rows, cleaned, rejected FROM clean_runs").fetchone()
+    clean_count = conn.execute(f"SELECT COUNT(*) FROM {cleaner.CLEAN_TABLE}").fetchone()[0]
+    conn.close()
+    assert raw_rows == 500
+    assert cleaned == clean_count > 0
+    assert cleaned + rejected == raw_rows
+    
+    with open('events.jsonl', encoding='utf-8') as f:
+        events = [json.loads(line) for line in f]
+    assert {e['job'] for e in events} == {'clean'}
+    assert {e['stage'] for e in events if e['event'] == 'stage'} == set(metrics.CLEAN_STAGES)
+    assert events[-1]['event'] == 'run'
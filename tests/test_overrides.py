@@ -0,0 +1,60 @@
+# tests/test_overrides.py
+import sqlite3
+import sys
+
+import pytest
+
+import overrides
+from queries import AGG_CELLS, CLEAN_TABLE, PRICE_SKETCHES
+from sketches import PriceDigest
+
+@pytest.fixture
+def prod_db(clean_db, monkeypatch, tmp_path):
+    # overrides.py works on marketpulse.db in the working directory
+    monkeypatch.chdir(tmp_path)
+    return clean_db
+
+def run_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['overrides.py', *args])
+    overrides.main()
+
+def sketch_counts(conn):
+    in_sketches = dict(((b, c, r), n) for b, c, r, n in conn.execute(
+        f"SELECT brand, cpu, ram, n FROM {PRICE_SKETCHES}"))
+    in_table = dict(((b, c, r), n) for b, c, r, n in conn.execute(
+        f"SELECT brand, cpu, ram, COUNT(*) FROM {CLEAN_TABLE} GROUP BY 1, 2, 3"))
+    return in_sketches, in_table
+
+def test_apply_refreshes_sketches_and_percentiles(prod_db, monkeypatch):
+    conn = sqlite3.connect(prod_db)
+    link, price = conn.execute(
+        f"SELECT link, price FROM {CLEAN_TABLE} WHERE brand = 'Dell' AND cpu = 'I5' AND ram = 8 LIMIT 1"
+    ).fetchone()
+    conn.close()
+    
+    run_cli(monkeypatch, 'add', '--link', link, '--brand', 'Lenovo', '--ram', '16')
+    run_cli(monkeypatch, 'add', '--match', 'macbook', '--exclude')
+    run_cli(monkeypatch, 'apply')
+    
+    conn = sqlite3.connect(prod_db)
+    brand, ram, percentile = conn.execute(
+        f"SELECT brand, ram, price_percentile FROM {CLEAN_TABLE} WHERE link = ?", (link,)
+    ).fetchone()
+    assert (brand, ram) == ('Lenovo', 16)
+    blob, low, high = conn.execute(
+        f"SELECT centroids, low, high FROM {PRICE_SKETCHES} WHERE brand = 'Lenovo' AND cpu = 'I5' AND ram = 16"
+    ).fetchone()
+    assert percentile == pytest.approx(PriceDigest.from_bytes(blob, low, high).cdf([price])[0])
+    
+    # Every digest counts exactly the rows of its cell, moved and excluded rows included
+    in_sketches, in_table = sketch_counts(conn)
+    assert in_sketches == in_table
+    assert conn.execute(f"SELECT COUNT(*) FROM {CLEAN_TABLE} WHERE price_percentile IS NULL").fetchone()[0] == 0
+    conn.close()
+
+def test_agg_cells_has_no_bin_quartiles(prod_db, monkeypatch):
+    run_cli(monkeypatch, 'apply')
+    conn = sqlite3.connect(prod_db)
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({AGG_CELLS})")]
+    conn.close()
+    assert columns == ['brand', 'cpu', 'ram', 'n', 'sum_price', 'min_price', 'max_price']
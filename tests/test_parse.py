@@ -0,0 +1,92 @@
+# tests/test_parse.py
+import sqlite3
+
+import pandas as pd
+
+import cleaner
+from benchmarks.bench_parse import fuzz_titles
+from cleaner import ParseCache, parse_specs, parse_specs_batch
+
+# Titles scraped from avito.ma, with the specs a reader gets from them
+REAL_TITLES = [
+    ("HP Elite BOOK I5 8eme Gen 8gb 256GO SSD", ("Hp", "I5", 8)),
+    ("MacBook Pro i9 2019, 15inch, 32 GB Ram, 2 TB", ("Apple", "I9", 32)),
+    ("Lenovo ThinkPad X260 i5 6200U RAM 8 Go 180 SSD", ("Lenovo", "I5", 8)),
+    ("PC Portable HP Core i7 – 12 Go RAM", ("Hp", "I7", 12)),
+    ("Lenovo Yoga 82NC – i7-11370H, 16Go RAM, 512Go, 14", ("Lenovo", "I7", 16)),
+    ("dell latitude i5 8th 256gb ssd 8gb ram ddr4", ("Dell", "I5", 8)),
+    ("Pc Dell i7 10 ème génération 256 GB et 8 GB Ram", ("Dell", "I7", 8)),
+    ("HP Pavilion 16-af0xxx – Ultra 5 125U, 16Go, 512Go", ("Hp", "ULTRA-5", 16)),
+    ("MacBook Air M1 (2020) – 13″, 8GB RAM", ("Apple", "M1", 8)),
+    ("Macbook air m2 2022 8gb 500gb", ("Apple", "M2", 8)),
+    ("🛍 Lenovo Ryzen 5 8Go RAM 512Go SSD Comme Neuf 🛍", ("Lenovo", "RYZEN-5", 8)),
+    ("Lenovo IdeaPad 5 Ryzen 7 5700U, 8gb ram", ("Lenovo", "RYZEN-7", 8)),
+    ("MSI Vector 17 HX A14VIG / i9-14900HX / 32GB / QHDp", ("Msi", "I9", 32)),
+    ("Huawei MateBook D i5, 8Go RAM, SSD 224Go", ("Huawei", "I5", 8)),
+    ("Asus Expertbook B9 le plus léger au monde 16Go 1000Go", ("Asus", "Unknown", 16)),
+    ("💻 Lenovo Neuf Allemand i5-13420H 24Go RAM 1To SSD", ("Lenovo", "I5", 24)),
+]
+
+def test_real_titles():
+    titles = pd.Series([title for title, _ in REAL_TITLES])
+    expected = [specs for _, specs in REAL_TITLES]
+    assert [parse_specs(t) for t in titles] == expected
+    assert list(parse_specs_batch(titles).itertuples(index=False, name=None)) == expected
+
+def test_fuzzed_titles_parse():
+    # Odd spacing, 40-digit numbers, unicode and empty titles must not raise
+    specs = parse_specs_batch(fuzz_titles(5_000, seed=1))
+    assert specs['ram'].between(0, int("9" * cleaner.MAX_SIZE_DIGITS)).all()
+
+def test_long_numbers_are_clamped():
+    assert parse_specs("x" + "9" * 5000 + "go 8go") == ("Other", "Unknown", 8)
+    assert parse_specs("1" * 25 + "go " + "2" * 30 + "go")[2] == int("9" * 18)
+
+def test_batch_keeps_index_and_int_ram():
+    specs = parse_specs_batch(pd.Series(["Dell i7 16go 512go", "hp 0000go"], index=[7, 7]))
+    assert list(specs.index) == [7, 7]
+    assert specs['ram'].dtype == 'int64'
+    assert list(specs.itertuples(index=False, name=None)) == [("Dell", "I7", 16), ("Hp", "Unknown", 0)]
+
+CACHE_TITLES = pd.Series(["Dell Latitude i7 16go 512go", "DELL latitude I7 16Go 512Go", "MacBook Air M2 8go",
+                          "HP EliteBook i5 8go/256go", "Dell Latitude i7 16go 512go"], index=[3, 1, 4, 1, 5])
+
+class CountingParser:
+    def __init__(self):
+        self.titles = []
+    
+    def __call__(self, titles):
+        self.titles.extend(titles)
+        return parse_specs_batch(titles)
+
+def test_parse_cache_hits_memory_then_db():
+    conn = sqlite3.connect(':memory:')
+    parser = CountingParser()
+    cache = ParseCache(conn)
+    expected = parse_specs_batch(CACHE_TITLES)
+    
+    # Titles equal once normalized are parsed once
+    pd.testing.assert_frame_equal(cache.parse(CACHE_TITLES, parser), expected)
+    assert len(parser.titles) == cache.misses == 3
+    
+    pd.testing.assert_frame_equal(cache.parse(CACHE_TITLES, parser), expected)
+    assert (cache.memory_hits, len(parser.titles)) == (3, 3)
+    
+    # A new run starts with an empty LRU and reads the parse_cache table
+    cache = ParseCache(conn)
+    pd.testing.assert_frame_equal(cache.parse(CACHE_TITLES, parser), expected)
+    assert (cache.db_hits, cache.misses, len(parser.titles)) == (3, 0, 3)
+
+def test_parse_cache_drops_entries_of_other_parser_versions(monkeypatch):
+    conn = sqlite3.connect(':memory:')
+    ParseCache(conn).parse(CACHE_TITLES)
+    # Stand-in for results the previous parser got wrong
+    conn.execute("UPDATE parse_cache SET brand = 'Wrong'")
+    
+    monkeypatch.setattr(cleaner, 'PARSER_VERSION', 'next')
+    parser = CountingParser()
+    cache = ParseCache(conn)
+    assert conn.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0] == 0
+    pd.testing.assert_frame_equal(cache.parse(CACHE_TITLES, parser), parse_specs_batch(CACHE_TITLES))
+    assert cache.misses == len(parser.titles) == 3
+    assert {v for (v,) in conn.execute("SELECT parser_version FROM parse_cache")} == {'next'}
@@ -0,0 +1,144 @@
+# tests/test_pipeline.py
+"""
+End to end scrapes over plain HTTP: scrape_mass_avito against a local
+ThreadingHTTPServer serving the fixture pages, with injected failures.
+"""
+import sqlite3
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import scraper
+from benchmarks.synthetic import load_fixture_pages
+
+EMPTY_PAGE = b"<html><body><p>Aucune annonce</p></body></html>"
+
+class FixtureSite:
+    """
+    Fixture page N at /listings?o=N, an empty results page past the last
+    one. failures[page] is how many requests for that page get a 500
+    before it is served (-1: always).
+    """
+    
+    def __init__(self):
+        self.pages = {page: html.encode('utf-8') for page, html in load_fixture_pages().items()}
+        self.failures = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        site = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                page = int(urllib.parse.parse_qs(url.query).get('o', ['1'])[0])
+                with site.lock:
+                    site.requests.append(page)
+                    left = site.failures.get(page, 0)
+                    if left:
+                        site.failures[page] = left - 1
+                if left:
+                    self.send_error(500)
+                    return
+                body = site.pages.get(page, EMPTY_PAGE)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/listings"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def site():
+    # One server per test: links are resolved against its URL
+    fixtures = FixtureSite()
+    yield fixtures
+    fixtures.close()
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Raw DB, runs DB and events all live in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scraper, 'RETRY_BACKOFF', 0.05)
+    return tmp_path
+
+def scrape(site, **kwargs):
+    return scraper.scrape_mass_avito(1, 8, batch_size=2, base_url=site.base_url, use_browser=False,
+                                     rate=200, events_path='events.jsonl', **kwargs)
+
+def ledger():
+    conn = sqlite3.connect(scraper.RAW_DB)
+    rows = conn.execute(
+        "SELECT page, status, attempts, listings FROM scrape_pages "
+        "WHERE crawl = (SELECT MAX(crawl) FROM scrape_pages) ORDER BY page"
+    ).fetchall()
+    conn.close()
+    return {page: (status, attempts, listings) for page, status, attempts, listings in rows}
+
+def raw_rows():
+    conn = sqlite3.connect(scraper.RAW_DB)
+    count, pages = conn.execute("SELECT COUNT(*), COUNT(DISTINCT page) FROM new_listings").fetchone()
+    conn.close()
+    return count, pages
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_scrape_retries_stops_at_end_and_fills_ledger(site, workers):
+    # Page 2 fails once then loads; page 3 fails every attempt
+    site.failures = {2: 1, 3: -1}
+    stats = scrape(site, workers=workers)
+    
+    assert stats['stopped'] == 'end'
+    assert stats['stop_page'] == 4
+    assert stats['failed_pages'] == [3]
+    assert site.requests.count(2) == 2
+    assert site.requests.count(3) == scraper.PAGE_RETRIES + 1
+    assert raw_rows() == (70, 2)
+    
+    pages = ledger()
+    assert pages[1] == ('done', 1, 35)
+    assert pages[2] == ('done', 2, 35)
+    assert pages[3][:2] == ('failed', scraper.PAGE_RETRIES + 1)
+    assert {pages[p][0] for p in range(4, 9)} == {'skipped'}
+    
+    conn = sqlite3.connect('marketpulse.db')
+    inserted, failed = conn.execute("SELECT inserted, pages_failed FROM scrape_runs").fetchone()
+    conn.close()
+    assert (inserted, failed) == (70, 1)
+
+def test_next_run_resumes_only_the_failed_page(site):
+    site.failures = {3: -1}
+    scrape(site)
+    assert ledger()[3][0] == 'failed'
+    
+    site.failures = {}
+    site.requests.clear()
+    stats = scrape(site)
+    assert site.requests == [3]
+    assert stats['failed_pages'] == []
+    assert ledger()[3] == ('done', scraper.PAGE_RETRIES + 2, 35)
+    assert raw_rows() == (105, 3)
+
+def test_incremental_stops_after_pages_of_known_links(site):
+    scrape(site)
+    assert raw_rows() == (105, 3)
+    
+    site.requests.clear()
+    stats = scrape(site, incremental=True, stop_after=2)
+    assert stats['stopped'] == 'until'
+    assert stats['last_page'] == 2
+    # Page 3 may be prefetched, but isn't parsed or stored
+    pages = ledger()
+    assert [pages[p][0] for p in (1, 2)] == ['done', 'done']
+    assert {pages[p][0] for p in range(3, 9)} == {'skipped'}
+    assert raw_rows() == (105, 3)
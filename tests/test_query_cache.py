@@ -0,0 +1,49 @@
+# tests/test_query_cache.py
+import sqlite3
+
+import cleaner
+import queries
+
+ALL = queries.Filters('All', 0, 10**9, 0, 'All')
+
+def remove_brand(conn, brand):
+    """A cleaner run that changes the data: rows go, the version moves"""
+    conn.execute(f"DELETE FROM {queries.CLEAN_TABLE} WHERE brand = ?", (brand,))
+    cleaner.build_aggregates(conn)
+    cleaner.stamp_data_version(conn)
+    conn.commit()
+
+def test_a_new_data_version_invalidates_cached_results(clean_db):
+    conn = sqlite3.connect(clean_db)
+    cache = queries.QueryCache()
+    cache.sync(queries.data_version(conn))
+    before = cache.call(queries.overview, conn, ALL)['count']
+    
+    remove_brand(conn, 'Dell')
+    # Same version: still served from the cache
+    assert cache.call(queries.overview, conn, ALL)['count'] == before
+    assert cache.hits == 1
+    
+    cache.sync(queries.data_version(conn))
+    after = cache.call(queries.overview, conn, ALL)['count']
+    assert after == queries.overview(conn, ALL)['count'] < before
+    assert cache.misses == 2
+
+def test_snapshots_of_different_versions_have_their_own_entries(clean_db, tmp_path):
+    conn = sqlite3.connect(clean_db)
+    cache = queries.QueryCache()
+    columns = ['price', 'quality_score']
+    path = str(tmp_path / 'snapshot.arrow')
+    
+    cleaner.write_snapshot(conn, path)
+    old = queries.load_snapshot(path, queries.data_version(conn))
+    old_rows = len(cache.call(queries.filtered_frame, conn, old, ALL, columns))
+    
+    remove_brand(conn, 'Dell')
+    cleaner.write_snapshot(conn, str(tmp_path / 'next.arrow'))
+    new = queries.load_snapshot(str(tmp_path / 'next.arrow'), queries.data_version(conn))
+    new_rows = len(cache.call(queries.filtered_frame, conn, new, ALL, columns))
+    
+    assert new_rows == new.num_rows < old_rows == old.num_rows
+    assert (cache.hits, cache.misses) == (0, 2)
+    conn.close()
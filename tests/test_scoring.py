@@ -0,0 +1,50 @@
+# tests/test_scoring.py
+import pandas as pd
+
+from scoring import SCORE_TABLES, load_score_tables, score_frame
+
+def calculate_quality_score(row):
+    """The dashboard's inline scorer before the tables moved to score_tables.json, verbatim"""
+    cpu_scores = {
+        'I3': 30, 'I5': 50, 'I7': 70, 'I9': 90,
+        'M1': 60, 'M2': 80, 'M3': 100,
+        'RYZEN-3': 35, 'RYZEN-5': 55, 'RYZEN-7': 75, 'RYZEN-9': 95,
+        'ULTRA-5': 55, 'ULTRA-7': 75, 'ULTRA-9': 95
+    }
+    
+    ram_scores = {
+        4: 20, 8: 40, 16: 70, 32: 100, 64: 120
+    }
+    
+    cpu_score = cpu_scores.get(row['cpu'], 25)  # Default 25 for unknown
+    ram_score = ram_scores.get(row['ram'], row['ram'] * 5)  # Fallback formula
+    
+    total_score = cpu_score + ram_score
+    
+    # Value ratio: score per 1000 DH
+    value_ratio = (total_score / row['price']) * 1000 if row['price'] > 0 else 0
+    
+    return total_score, value_ratio
+
+# Every table entry, unknown CPUs, unlisted RAM sizes and non-positive prices
+ROWS = pd.DataFrame(
+    [(cpu, ram, price) for cpu, ram, price in zip(
+        ['I3', 'I5', 'I7', 'I9', 'M1', 'M2', 'M3', 'RYZEN-3', 'RYZEN-5', 'RYZEN-7', 'RYZEN-9',
+         'ULTRA-5', 'ULTRA-7', 'ULTRA-9', 'Unknown', 'I5', 'I7', 'M2', 'Unknown', 'I5'],
+        [4, 8, 16, 32, 64, 8, 16, 4, 8, 16, 32, 64, 16, 32, 8, 12, 0, 24, 6, 8],
+        [2500, 4000, 6500, 12000, 9000, 11000, 15000, 3000, 4500, 7000, 13000, 16000, 9500, 18000,
+         2000, 5200, 3500, 10000, 0, -100],
+    )],
+    columns=['cpu', 'ram', 'price'],
+)
+
+def test_score_tables_match_the_old_inline_scorer():
+    expected = pd.DataFrame([calculate_quality_score(row) for _, row in ROWS.iterrows()],
+                            columns=['quality_score', 'value_ratio'])
+    quality_score, value_ratio = score_frame(ROWS)
+    assert quality_score.tolist() == expected['quality_score'].astype('float64').tolist()
+    assert value_ratio.tolist() == expected['value_ratio'].astype('float64').tolist()
+
+def test_ram_table_keys_are_integers():
+    assert SCORE_TABLES == load_score_tables()
+    assert set(SCORE_TABLES['ram_scores']) == {4, 8, 16, 32, 64}
@@ -0,0 +1,50 @@
+# tests/test_snapshot.py
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import cleaner
+import queries
+
+def test_snapshot_matches_clean_table(clean_db, tmp_path):
+    path = str(tmp_path / 'snapshot.arrow')
+    conn = sqlite3.connect(clean_db)
+    rows = cleaner.write_snapshot(conn, path, chunksize=500)
+    expected = pd.read_sql(f"SELECT * FROM {cleaner.CLEAN_TABLE}", conn)
+    version = queries.data_version(conn)
+    conn.close()
+    
+    snapshot = queries.load_snapshot(path, version)
+    assert queries.snapshot_version(snapshot) == version
+    assert rows == snapshot.num_rows == len(expected)
+    assert snapshot.schema.names == list(expected.columns)
+    assert sorted(os.listdir(tmp_path)) == ['marketpulse.db', 'snapshot.arrow']
+
+def test_snapshot_of_another_data_version_is_not_loaded(clean_db, tmp_path):
+    # A clean that stamps a new version, then fails to write the snapshot
+    path = str(tmp_path / 'snapshot.arrow')
+    conn = sqlite3.connect(clean_db)
+    cleaner.write_snapshot(conn, path)
+    cleaner.stamp_data_version(conn)
+    conn.commit()
+    version = queries.data_version(conn)
+    conn.close()
+    
+    assert queries.load_snapshot(path, version) is None
+
+def test_failed_write_leaves_no_temp_file(clean_db, tmp_path, monkeypatch):
+    read_sql = pd.read_sql
+    
+    def failing_chunks(*args, **kwargs):
+        # The first chunk is written, then the read fails
+        yield next(iter(read_sql(*args, **kwargs)))
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(cleaner.pd, 'read_sql', failing_chunks)
+    
+    conn = sqlite3.connect(clean_db)
+    with pytest.raises(sqlite3.OperationalError):
+        cleaner.write_snapshot(conn, str(tmp_path / 'snapshot.arrow'), chunksize=500)
+    conn.close()
+    assert os.listdir(tmp_path) == ['marketpulse.db']